@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Import-time benchmark for the Cloud Function entry points.
+
+Runs `python -X importtime` in a fresh interpreter for the modules each
+function loads on a cold start, and prints the total plus the slowest
+top-level imports.
+
+Usage: python3 bench_imports.py [--top N]
+"""
+
+import os
+import re
+import subprocess
+import sys
+
+# Modules each entry point imports before it can answer a request
+ENTRY_POINTS = {
+    "create_reengagement_deal": ["main", "hubspot_client"],
+    "create_followup_task": ["main", "hubspot_client"],
+    "process_jobs": ["main", "job_queue", "hubspot_client"],
+    "gmail_sync": ["main", "anthropic", "tools", "gmail_client"],
+    "daily_report": ["main", "anthropic", "tools", "gmail_client", "calendar_client", "email_client"],
+}
+
+# "import time:  self | cumulative | <indent>module" (nested imports are indented)
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\| ( *)(\S+)")
+
+
+def measure_imports(modules):
+    """
+    Import `modules` in a fresh interpreter with -X importtime.
+    Returns (total_us, [(cumulative_us, module), ...] for top-level imports).
+    """
+    code = "; ".join(f"import {module}" for module in modules)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    top_level = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match and not match.group(3):
+            top_level.append((int(match.group(2)), match.group(4)))
+
+    total = sum(cumulative for cumulative, _ in top_level)
+    return total, sorted(top_level, reverse=True)
+
+
+def main():
+    top = 5
+    if "--top" in sys.argv:
+        top = int(sys.argv[sys.argv.index("--top") + 1])
+
+    print("=" * 60)
+    print("COLD-START IMPORT TIMES")
+    print("=" * 60)
+
+    for entry_point, modules in ENTRY_POINTS.items():
+        print(f"\n{entry_point}")
+        try:
+            total, imports = measure_imports(modules)
+        except RuntimeError as e:
+            print(f"  Error: {e}")
+            continue
+
+        print(f"  Total: {total / 1000:.1f} ms")
+        for cumulative, module in imports[:top]:
+            print(f"    {cumulative / 1000:8.1f} ms  {module}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,11 +7,22 @@ Uses domain-wide delegation to access @kartel.ai calendars.
 import os
 import json
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
+import httplib2
 from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
 
+from outbound import TIMEOUTS, CircuitOpenError, DeadlineExceeded, call
+
+from payload_metrics import (
+    USE_FIELD_MASKS,
+    record_payload,
+    reset_payload_stats,
+    log_payload_stats,
+)
+
 
 # Service account credentials (stored as JSON string in env var)
 GOOGLE_CREDENTIALS = os.environ.get("GOOGLE_CREDENTIALS", "{}")
@@ -26,6 +37,12 @@ KARTEL_CALENDARS = [
 
 SCOPES = ["https://www.googleapis.com/auth/calendar.readonly"]
 
+# Partial-response mask: only the event fields get_calendar_events uses
+LIST_FIELDS = (
+    "items(id,summary,start,end,location,description,organizer/email,"
+    "attendees(email,displayName,responseStatus)),nextPageToken"
+)
+
 
 def _get_calendar_service(user_email: str):
     """
@@ -40,7 +57,10 @@ def _get_calendar_service(user_email: str):
     # Delegate to the specific user
     delegated_credentials = credentials.with_subject(user_email)
 
-    service = build("calendar", "v3", credentials=delegated_credentials)
+    # Bound every API call by the Google read timeout
+    http = AuthorizedHttp(delegated_credentials, http=httplib2.Http(timeout=TIMEOUTS["google"][1]))
+
+    service = build("calendar", "v3", http=http)
     return service
 
 
@@ -48,6 +68,7 @@ def get_calendar_events(
     attendee_emails: List[str],
     days_ahead: int = 7,
     include_today: bool = True,
+    deal_index: Optional[Any] = None,
 ) -> List[Dict[str, Any]]:
     """
     Get calendar events that include specific attendees.
@@ -56,9 +77,11 @@ def get_calendar_events(
         attendee_emails: List of attendee emails to filter by
         days_ahead: Number of days ahead to look
         include_today: Whether to include today's events
+        deal_index: Optional DealIndex used to tag each event with deal_ids
 
     Returns:
         List of event objects with title, start, end, attendees
+        (and deal_ids when a deal_index is given)
     """
     if not attendee_emails:
         return []
@@ -81,6 +104,7 @@ def get_calendar_events(
 
     all_events = []
     seen_event_ids = set()
+    reset_payload_stats("calendar")
 
     # Search each Kartel calendar
     for calendar_user in KARTEL_CALENDARS:
@@ -88,17 +112,20 @@ def get_calendar_events(
             service = _get_calendar_service(calendar_user)
 
             # Get events from this calendar
-            events_result = (
-                service.events()
-                .list(
-                    calendarId="primary",
-                    timeMin=time_min.isoformat() + "Z",
-                    timeMax=time_max.isoformat() + "Z",
-                    singleEvents=True,
-                    orderBy="startTime",
-                    maxResults=100,
-                )
-                .execute()
+            list_kwargs = {
+                "calendarId": "primary",
+                "timeMin": time_min.isoformat() + "Z",
+                "timeMax": time_max.isoformat() + "Z",
+                "singleEvents": True,
+                "orderBy": "startTime",
+                "maxResults": 100,
+            }
+            if USE_FIELD_MASKS:
+                list_kwargs["fields"] = LIST_FIELDS
+
+            events_result = record_payload(
+                "calendar",
+                call("google", service.events().list(**list_kwargs).execute),
             )
 
             events = events_result.get("items", [])
@@ -132,30 +159,41 @@ def get_calendar_events(
                 start_time = start.get("dateTime") or start.get("date")
                 end_time = end.get("dateTime") or end.get("date")
 
-                all_events.append(
-                    {
-                        "id": event_id,
-                        "title": event.get("summary", "(no title)"),
-                        "start": start_time,
-                        "end": end_time,
-                        "attendees": [
-                            {
-                                "email": a.get("email"),
-                                "name": a.get("displayName"),
-                                "response": a.get("responseStatus"),
-                            }
-                            for a in attendees
-                        ],
-                        "location": event.get("location"),
-                        "description": event.get("description", "")[:500],  # Truncate
-                        "calendar_owner": calendar_user,
-                    }
-                )
+                event_obj = {
+                    "id": event_id,
+                    "title": event.get("summary", "(no title)"),
+                    "start": start_time,
+                    "end": end_time,
+                    "attendees": [
+                        {
+                            "email": a.get("email"),
+                            "name": a.get("displayName"),
+                            "response": a.get("responseStatus"),
+                        }
+                        for a in attendees
+                    ],
+                    "location": event.get("location"),
+                    "description": event.get("description", "")[:500],  # Truncate
+                    "calendar_owner": calendar_user,
+                }
+
+                # Attribute to deals by attendee email / company domain
+                if deal_index is not None:
+                    event_obj["deal_ids"] = deal_index.deals_for_addresses(attendee_list)
+
+                all_events.append(event_obj)
+
+        except (CircuitOpenError, DeadlineExceeded) as e:
+            # Calendar is down or we're out of time - stop instead of trying every calendar
+            print(f"Stopping calendar search at {calendar_user}: {e}")
+            break
 
         except Exception as e:
             print(f"Error accessing calendar for {calendar_user}: {e}")
             continue
 
+    log_payload_stats("calendar")
+
     # Sort by start time
     all_events.sort(key=lambda x: x.get("start") or "")
 
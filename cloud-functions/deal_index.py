@@ -0,0 +1,196 @@
+"""
+Participant email → deal index for email and calendar attribution.
+
+Maps normalized contact emails, and company domains, to the active deals
+they belong to. Gmail and Calendar results are tagged with deal IDs from
+this index, so Claude doesn't have to work out attribution from raw headers.
+"""
+
+import time
+from email.utils import getaddresses
+from typing import List, Dict, Any, Optional, Iterable
+
+from hubspot_client import (
+    get_active_deals,
+    batch_get_associations,
+    batch_read_objects,
+)
+
+
+# Domains that don't identify a company (never indexed by domain)
+PERSONAL_DOMAINS = {
+    "gmail.com",
+    "googlemail.com",
+    "yahoo.com",
+    "hotmail.com",
+    "outlook.com",
+    "icloud.com",
+    "aol.com",
+    "me.com",
+}
+INTERNAL_DOMAINS = {"kartel.ai"}
+
+# Rebuild the cached index after this long (gmail_sync runs every 15 min)
+INDEX_TTL_SECONDS = 15 * 60
+
+_cached_index = None
+_cached_at = 0.0
+
+
+def normalize_email(address: Optional[str]) -> Optional[str]:
+    """Lowercase and strip an email address. Returns None if it isn't one."""
+    if not address:
+        return None
+    address = address.strip().strip("<>").lower()
+    if "@" not in address:
+        return None
+    return address
+
+
+def email_domain(address: Optional[str]) -> Optional[str]:
+    """Get the domain part of an email address."""
+    email = normalize_email(address)
+    if not email:
+        return None
+    return email.rsplit("@", 1)[1]
+
+
+def normalize_domain(domain: Optional[str]) -> Optional[str]:
+    """Normalize a HubSpot company domain ("https://www.Acme.com/" → "acme.com")."""
+    if not domain:
+        return None
+    domain = domain.strip().lower()
+    for prefix in ("https://", "http://"):
+        if domain.startswith(prefix):
+            domain = domain[len(prefix):]
+    domain = domain.split("/", 1)[0]
+    if domain.startswith("www."):
+        domain = domain[4:]
+    return domain or None
+
+
+def parse_addresses(header_value: Optional[str]) -> List[str]:
+    """Parse an address header ("Jane <jane@acme.com>, bob@x.com") into emails."""
+    if not header_value:
+        return []
+    emails = []
+    for _, address in getaddresses([header_value]):
+        email = normalize_email(address)
+        if email:
+            emails.append(email)
+    return emails
+
+
+class DealIndex:
+    """Hash index from participant email / company domain to deal IDs."""
+
+    def __init__(self):
+        self.by_email: Dict[str, List[str]] = {}
+        self.by_domain: Dict[str, List[str]] = {}
+
+    def add_email(self, address: str, deal_id: str):
+        email = normalize_email(address)
+        if not email:
+            return
+        deal_ids = self.by_email.setdefault(email, [])
+        if deal_id not in deal_ids:
+            deal_ids.append(deal_id)
+
+    def add_domain(self, domain: str, deal_id: str):
+        domain = normalize_domain(domain)
+        if not domain or domain in PERSONAL_DOMAINS or domain in INTERNAL_DOMAINS:
+            return
+        deal_ids = self.by_domain.setdefault(domain, [])
+        if deal_id not in deal_ids:
+            deal_ids.append(deal_id)
+
+    def lookup(self, address: str) -> List[str]:
+        """
+        Deal IDs for one address. An exact contact email match wins;
+        otherwise fall back to the sender's company domain.
+        """
+        email = normalize_email(address)
+        if not email:
+            return []
+        if email in self.by_email:
+            return self.by_email[email]
+        return self.by_domain.get(email_domain(email), [])
+
+    def deals_for_addresses(self, addresses: Iterable[str]) -> List[str]:
+        """Union of deal IDs for a set of participants, in first-seen order."""
+        deal_ids = []
+        for address in addresses:
+            for deal_id in self.lookup(address):
+                if deal_id not in deal_ids:
+                    deal_ids.append(deal_id)
+        return deal_ids
+
+    def deals_for_headers(self, *header_values: Optional[str]) -> List[str]:
+        """Deal IDs for raw From/To/Cc header values."""
+        addresses = []
+        for header_value in header_values:
+            addresses.extend(parse_addresses(header_value))
+        return self.deals_for_addresses(addresses)
+
+    def emails(self) -> List[str]:
+        """All indexed contact emails."""
+        return list(self.by_email)
+
+
+def build_deal_index(deals: Optional[List[Dict[str, Any]]] = None) -> DealIndex:
+    """
+    Build the index from active deals, their contacts and their companies.
+    Uses batch association and batch read calls (a handful of requests total,
+    instead of one per contact).
+    """
+    if deals is None:
+        deals = get_active_deals()
+
+    index = DealIndex()
+    deal_ids = [str(deal["id"]) for deal in deals if deal.get("id")]
+    if not deal_ids:
+        return index
+
+    # Contacts → emails
+    deal_contacts = batch_get_associations("deals", "contacts", deal_ids)
+    contact_ids = sorted({cid for cids in deal_contacts.values() for cid in cids})
+    contact_emails = {}
+    for contact in batch_read_objects("contacts", contact_ids, ["email"]):
+        email = contact.get("properties", {}).get("email")
+        if email:
+            contact_emails[str(contact.get("id"))] = email
+
+    for deal_id, cids in deal_contacts.items():
+        for cid in cids:
+            if cid in contact_emails:
+                index.add_email(contact_emails[cid], deal_id)
+
+    # Companies → domains
+    deal_companies = batch_get_associations("deals", "companies", deal_ids)
+    company_ids = sorted({cid for cids in deal_companies.values() for cid in cids})
+    company_domains = {}
+    for company in batch_read_objects("companies", company_ids, ["domain"]):
+        domain = company.get("properties", {}).get("domain")
+        if domain:
+            company_domains[str(company.get("id"))] = domain
+
+    for deal_id, cids in deal_companies.items():
+        for cid in cids:
+            if cid in company_domains:
+                index.add_domain(company_domains[cid], deal_id)
+
+    return index
+
+
+def get_deal_index(refresh: bool = False) -> DealIndex:
+    """
+    Get the cached index, rebuilding it when stale.
+    Warm Cloud Function instances reuse it across invocations.
+    """
+    global _cached_index, _cached_at
+
+    if refresh or _cached_index is None or time.time() - _cached_at > INDEX_TTL_SECONDS:
+        _cached_index = build_deal_index()
+        _cached_at = time.time()
+
+    return _cached_index
@@ -14,6 +14,25 @@ echo ""
 # Ensure we're using the right project
 gcloud config set project $PROJECT_ID
 
+# Respond-fast webhooks queue jobs as Cloud Tasks for process-jobs; a SQLite
+# queue in /tmp would be per instance (see job_queue.py)
+JOB_QUEUE="crm-jobs"
+JOB_WORKER_URL="https://${REGION}-${PROJECT_ID}.cloudfunctions.net/process-jobs"
+# Tasks call process-jobs with an OIDC token for this account; nothing else may invoke it
+JOB_INVOKER_SA="crm-jobs-invoker@${PROJECT_ID}.iam.gserviceaccount.com"
+JOB_QUEUE_ENV="JOB_QUEUE_BACKEND=cloud_tasks,JOB_WORKER_URL=$JOB_WORKER_URL,CLOUD_TASKS_PROJECT=$PROJECT_ID,CLOUD_TASKS_LOCATION=$REGION,CLOUD_TASKS_QUEUE=$JOB_QUEUE,CLOUD_TASKS_SERVICE_ACCOUNT=$JOB_INVOKER_SA"
+gcloud tasks queues describe $JOB_QUEUE --location $REGION >/dev/null 2>&1 || \
+  gcloud tasks queues create $JOB_QUEUE --location $REGION
+gcloud iam service-accounts describe $JOB_INVOKER_SA >/dev/null 2>&1 || \
+  gcloud iam service-accounts create crm-jobs-invoker --display-name "Cloud Tasks invoker for process-jobs"
+
+# The functions run as the default compute account, which creates the tasks:
+# it must be allowed to sign tokens as the invoker account
+PROJECT_NUMBER=$(gcloud projects describe $PROJECT_ID --format='value(projectNumber)')
+gcloud iam service-accounts add-iam-policy-binding $JOB_INVOKER_SA \
+  --member "serviceAccount:${PROJECT_NUMBER}-compute@developer.gserviceaccount.com" \
+  --role roles/iam.serviceAccountUser >/dev/null
+
 # Deploy daily report function
 echo "Deploying daily-report function..."
 gcloud functions deploy daily-report \
@@ -23,6 +42,7 @@ gcloud functions deploy daily-report \
   --trigger-http \
   --entry-point daily_report \
   --timeout 540 \
+  --set-env-vars "FUNCTION_TIMEOUT_SECONDS=540" \
   --memory 512MB \
   --set-secrets "HUBSPOT_ACCESS_TOKEN=HUBSPOT_ACCESS_TOKEN:latest,ANTHROPIC_API_KEY=ANTHROPIC_API_KEY:latest,SENDGRID_API_KEY=SENDGRID_API_KEY:latest,GOOGLE_CREDENTIALS=GOOGLE_CREDENTIALS:latest" \
   --allow-unauthenticated
@@ -37,6 +57,7 @@ gcloud functions deploy gmail-sync \
   --trigger-http \
   --entry-point gmail_sync \
   --timeout 540 \
+  --set-env-vars "FUNCTION_TIMEOUT_SECONDS=540" \
   --memory 512MB \
   --set-secrets "HUBSPOT_ACCESS_TOKEN=HUBSPOT_ACCESS_TOKEN:latest,ANTHROPIC_API_KEY=ANTHROPIC_API_KEY:latest,GOOGLE_CREDENTIALS=GOOGLE_CREDENTIALS:latest" \
   --allow-unauthenticated
@@ -51,6 +72,7 @@ gcloud functions deploy create-reengagement-deal \
   --trigger-http \
   --entry-point create_reengagement_deal \
   --timeout 60 \
+  --set-env-vars "FUNCTION_TIMEOUT_SECONDS=60,$JOB_QUEUE_ENV" \
   --memory 256MB \
   --set-secrets "HUBSPOT_ACCESS_TOKEN=HUBSPOT_ACCESS_TOKEN:latest" \
   --allow-unauthenticated
@@ -65,11 +87,39 @@ gcloud functions deploy create-followup-task \
   --trigger-http \
   --entry-point create_followup_task \
   --timeout 60 \
+  --set-env-vars "FUNCTION_TIMEOUT_SECONDS=60,$JOB_QUEUE_ENV" \
   --memory 256MB \
   --set-secrets "HUBSPOT_ACCESS_TOKEN=HUBSPOT_ACCESS_TOKEN:latest" \
   --allow-unauthenticated
 
+# Deploy job worker (runs jobs queued by the webhooks when RESPOND_FAST=true)
+echo ""
+echo "Deploying process-jobs function..."
+gcloud functions deploy process-jobs \
+  --gen2 \
+  --runtime python311 \
+  --region $REGION \
+  --trigger-http \
+  --entry-point process_jobs \
+  --timeout 300 \
+  --set-env-vars "FUNCTION_TIMEOUT_SECONDS=300,$JOB_QUEUE_ENV" \
+  --memory 256MB \
+  --set-secrets "HUBSPOT_ACCESS_TOKEN=HUBSPOT_ACCESS_TOKEN:latest,APOLLO_API_KEY=APOLLO_API_KEY:latest" \
+  --no-allow-unauthenticated
+
+# Only Cloud Tasks (as the invoker account) may run jobs
+gcloud functions add-invoker-policy-binding process-jobs \
+  --region $REGION \
+  --member "serviceAccount:$JOB_INVOKER_SA"
+
 # Deploy enrich-contact function (enriches contacts, routes, creates leads)
+# It deploys from its own directory, so copy in the shared modules it imports
+ENRICH_SHARED_MODULES="outbound.py job_queue.py title_classifier.py routing.py routing_rules.json industry_mapper.py size_buckets.py"
+for module in $ENRICH_SHARED_MODULES; do
+  cp "$module" enrich_contact/
+done
+trap 'for module in $ENRICH_SHARED_MODULES; do rm -f "enrich_contact/$module"; done' EXIT
+
 echo ""
 echo "Deploying enrich-contact function..."
 gcloud functions deploy enrich-contact \
@@ -81,7 +131,7 @@ gcloud functions deploy enrich-contact \
   --entry-point enrich_contact \
   --timeout 120 \
   --memory 256MB \
-  --set-env-vars "SKIP_PERSONAL_EMAILS=false" \
+  --set-env-vars "SKIP_PERSONAL_EMAILS=false,FUNCTION_TIMEOUT_SECONDS=120,$JOB_QUEUE_ENV" \
   --set-secrets "HUBSPOT_ACCESS_TOKEN=HUBSPOT_ACCESS_TOKEN:latest,APOLLO_API_KEY=APOLLO_API_KEY:latest" \
   --allow-unauthenticated
 
@@ -93,12 +143,14 @@ SYNC_URL=$(gcloud functions describe gmail-sync --region $REGION --format='value
 REENGAGEMENT_URL=$(gcloud functions describe create-reengagement-deal --region $REGION --format='value(serviceConfig.uri)')
 FOLLOWUP_URL=$(gcloud functions describe create-followup-task --region $REGION --format='value(serviceConfig.uri)')
 ENRICH_URL=$(gcloud functions describe enrich-contact --region $REGION --format='value(serviceConfig.uri)')
+JOBS_URL=$(gcloud functions describe process-jobs --region $REGION --format='value(serviceConfig.uri)')
 
 echo "Daily Report URL: $DAILY_URL"
 echo "Gmail Sync URL: $SYNC_URL"
 echo "Re-engagement Deal URL: $REENGAGEMENT_URL"
 echo "Follow-up Task URL: $FOLLOWUP_URL"
 echo "Enrich Contact URL: $ENRICH_URL"
+echo "Job Worker URL: $JOBS_URL"
 echo ""
 echo "Use these URLs in HubSpot workflows as webhook actions:"
 echo "  Budget/Timing (90 days): POST to $REENGAGEMENT_URL"
@@ -0,0 +1,137 @@
+"""
+Idempotency and request collapsing for webhook processing.
+
+IdempotencyStore remembers results by key (webhook event ID, contact ID)
+for a configurable window, so HubSpot retries and repeated events for the
+same contact reuse the earlier result instead of calling Apollo and
+PATCHing again.
+
+SingleFlight collapses concurrent calls for the same key into one: the
+first caller does the work and everyone waiting gets its result. Batches
+claim many keys at once with claim() and finish them with release().
+
+Both are per-instance (in memory). With several function instances a
+retry can still land on a fresh instance; the window just bounds how long
+a single instance remembers.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class IdempotencyStore:
+    """Thread-safe key → result cache with a time window"""
+
+    def __init__(self, window_seconds=300):
+        self.window_seconds = window_seconds
+        # Oldest first, so expired entries are always at the front
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Result stored for `key` within the window, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, result = entry
+            if time.monotonic() - stored_at > self.window_seconds:
+                del self._entries[key]
+                return None
+            return result
+
+    def put(self, key, result):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            self._prune()
+
+    def _prune(self):
+        # Caller holds the lock; stops at the first entry still in the window
+        cutoff = time.monotonic() - self.window_seconds
+        while self._entries:
+            stored_at, _ = next(iter(self._entries.values()))
+            if stored_at >= cutoff:
+                break
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one execution"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """
+        Run fn() unless a call for `key` is already running, in which case
+        wait for it and return its result (or raise its exception).
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
+
+    def claim(self, keys):
+        """
+        Lead every key not already in flight; finish each one with release().
+        Returns (claimed keys, {key: call} for keys someone else is running).
+        Release what you claimed before waiting on the others, so two
+        batches waiting on each other's keys can't deadlock.
+        """
+        claimed, running = [], {}
+        with self._lock:
+            for key in keys:
+                if key in self._calls:
+                    running[key] = self._calls[key]
+                else:
+                    self._calls[key] = _Call()
+                    claimed.append(key)
+        return claimed, running
+
+    def release(self, key, result=None, error=None):
+        """Finish a claimed key, handing `result` (or raising `error`) to its waiters"""
+        with self._lock:
+            call = self._calls.pop(key)
+        call.result = result
+        call.error = error
+        call.done.set()
+
+    @staticmethod
+    def wait(call):
+        """Result of a running call from claim(), once it finishes (raises its exception)"""
+        call.done.wait()
+        if call.error:
+            raise call.error
+        return call.result
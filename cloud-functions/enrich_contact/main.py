@@ -15,197 +15,157 @@ For Leads:
 Usage:
 - POST {"contact_id": "123"} - Enrich contact only
 - POST {"lead_id": "456"} - Enrich contact + route lead
+- POST [{...}, ...] - HubSpot webhook subscription batch (up to 100 events),
+  or a list of the objects above; enriched together, one status per event
+
+Set ENRICH_BUFFERED=true to acknowledge webhooks with a 202 and enrich
+queued events in batches using batch reads, Apollo bulk match and batch
+updates. On Cloud Functions the events are buffered in the durable job queue
+(Cloud Tasks, see job_queue.py) and the process_jobs worker enriches each
+queued batch. Locally they're buffered in process by a MicroBatcher
+(ENRICH_BATCH_MAX_SIZE events or ENRICH_BATCH_MAX_WAIT_SECONDS, whichever
+comes first).
+
+Set RESPOND_FAST=true to validate the request, enqueue a durable job (see
+job_queue.py) and return 202; the process_jobs worker enriches queued
+events in batches.
+
+Repeated webhook event IDs, and contacts enriched within the last
+ENRICH_DEDUPE_WINDOW_SECONDS, reuse the earlier result; concurrent requests
+for the same contact share a single in-flight enrichment.
 """
 
 import functions_framework
-import requests
 import os
+import sys
+
+from idempotency import IdempotencyStore, SingleFlight
+
+# Shared cloud-functions modules (deploy.sh copies them in when deploying)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from outbound import OutboundClient, start_deadline
+import routing
+import title_classifier
+from industry_mapper import map_industry
+from size_buckets import size_tier
 
 HUBSPOT_TOKEN = os.getenv('HUBSPOT_ACCESS_TOKEN')
 APOLLO_KEY = os.getenv('APOLLO_API_KEY')
 SKIP_PERSONAL_EMAILS = os.getenv('SKIP_PERSONAL_EMAILS', 'true').lower() == 'true'  # Default: true
 HUBSPOT_BASE = "https://api.hubapi.com"
 
+# Timeouts, request deadline and circuit breakers per dependency
+hubspot = OutboundClient("hubspot")
+apollo = OutboundClient("apollo")
+
+# Owner and tier routing rules (routing_rules.json)
+routing_engine = routing.get_engine()
+
 # Owner IDs for routing
-OWNERS = {
-    "ben": "159215803",      # Ben Kusin - CRO (high-value)
-    "emmet": "160266467",    # Emmet Reilly (middle tier)
-    "tim": "161182435",      # Tim Burke (junk/spam)
-}
+OWNERS = routing_engine.owner_ids()
+
+# Contact properties read for enrichment and lead routing
+CONTACT_PROPERTIES = "email,firstname,lastname,company,jobtitle,seniority,company_size,industry,contact_type,timeline,use_case,client_use_case,hubspotscore"
+
+PERSONAL_DOMAINS = ['gmail.com', 'yahoo.com', 'hotmail.com', 'outlook.com', 'icloud.com', 'aol.com']
+
+# HubSpot object type IDs in webhook subscription events
+CONTACT_OBJECT_TYPE = "0-1"
+LEAD_OBJECT_TYPE = "0-136"
+
+# Max inputs per HubSpot batch request / Apollo bulk match request
+HUBSPOT_BATCH_SIZE = 100
+APOLLO_BULK_SIZE = 10
+
+
+def hubspot_headers():
+    return {
+        "Authorization": f"Bearer {HUBSPOT_TOKEN}",
+        "Content-Type": "application/json"
+    }
+
+
+def parse_apollo_person(data):
+    """Pull the fields we use out of an Apollo person record"""
+    if not data:
+        return None
+
+    org = data.get('organization') or {}
+    return {
+        'firstname': data.get('first_name'),
+        'lastname': data.get('last_name'),
+        'jobtitle': data.get('title'),
+        'seniority': data.get('seniority'),
+        'company': org.get('name'),
+        'company_size': org.get('estimated_num_employees'),
+        'company_revenue': org.get('estimated_annual_revenue'),
+        'industry': org.get('industry'),
+        'linkedin_url': data.get('linkedin_url')
+    }
 
 
 def enrich_with_apollo(email):
     """Enrich contact using Apollo API"""
     try:
-        response = requests.post(
+        response = apollo.post(
             "https://api.apollo.io/v1/people/match",
             headers={"x-api-key": APOLLO_KEY, "Content-Type": "application/json"},
             json={"email": email}
         )
 
         if response.status_code == 200:
-            data = response.json().get('person', {})
-            if data:
-                org = data.get('organization', {})
-                return {
-                    'firstname': data.get('first_name'),
-                    'lastname': data.get('last_name'),
-                    'jobtitle': data.get('title'),
-                    'seniority': data.get('seniority'),
-                    'company': org.get('name'),
-                    'company_size': org.get('estimated_num_employees'),
-                    'company_revenue': org.get('estimated_annual_revenue'),
-                    'industry': org.get('industry'),
-                    'linkedin_url': data.get('linkedin_url')
-                }
+            return parse_apollo_person(response.json().get('person', {}))
     except Exception as e:
         print(f"Apollo error: {e}")
 
     return None
 
 
-def calculate_decision_maker(jobtitle, seniority):
-    """Calculate decision maker status"""
-    if not jobtitle:
-        return seniority in ['C_LEVEL', 'VP', 'DIRECTOR', 'MANAGER'] if seniority else False
-
-    title_lower = jobtitle.lower()
-
-    # C-level
-    if any(x in title_lower for x in ['ceo', 'cfo', 'cmo', 'cto', 'coo', 'cpo', 'chief', 'founder', 'owner']):
-        return True
-
-    # VP/President
-    if 'vp' in title_lower or 'vice president' in title_lower:
-        return True
-    if 'president' in title_lower and 'vice' not in title_lower:
-        return True
-
-    # Director/Head
-    if 'director' in title_lower or 'head of' in title_lower:
-        return True
+def enrich_with_apollo_bulk(emails):
+    """
+    Enrich many contacts with Apollo bulk match (10 per request).
+    Returns {email: apollo_data}; emails Apollo couldn't match are left out.
+    """
+    results = {}
+
+    for i in range(0, len(emails), APOLLO_BULK_SIZE):
+        chunk = emails[i:i + APOLLO_BULK_SIZE]
+        try:
+            response = apollo.post(
+                "https://api.apollo.io/v1/people/bulk_match",
+                headers={"x-api-key": APOLLO_KEY, "Content-Type": "application/json"},
+                json={"details": [{"email": email} for email in chunk]}
+            )
 
-    # Manager (excluding support roles)
-    if 'manager' in title_lower:
-        exclude = ['account manager', 'customer success', 'support', 'operations manager', 'community']
-        if not any(x in title_lower for x in exclude):
-            return True
+            if response.status_code != 200:
+                print(f"Apollo bulk match error: {response.status_code}")
+                continue
 
-    # Seniority-based
-    if seniority in ['C_LEVEL', 'VP', 'DIRECTOR', 'MANAGER']:
-        return True
+            # Matches come back in request order (null where nothing matched)
+            for email, person in zip(chunk, response.json().get('matches', [])):
+                apollo_data = parse_apollo_person(person)
+                if apollo_data:
+                    results[email] = apollo_data
+        except Exception as e:
+            print(f"Apollo error: {e}")
 
-    return False
+    return results
 
 
 def calculate_lead_tier(company_size, company_revenue):
     """Calculate lead tier based on company data"""
-    if (company_size and company_size >= 500) or (company_revenue and company_revenue >= 50000000):
-        return 'enterprise'
-
-    if (company_size and company_size >= 100) or (company_revenue and company_revenue >= 10000000):
-        return 'mid_market'
-
-    return 'smb'
+    decision = routing_engine.evaluate("lead_tier", {"employees": company_size, "revenue": company_revenue})
+    return decision.outcome["tier"]
 
 
 def calculate_priority_level(decision_maker, engagement_score):
-    """Calculate priority level"""
-    score = 0
-
-    if decision_maker:
-        score += 50
-
-    if engagement_score:
-        if engagement_score >= 80:
-            score += 40
-        elif engagement_score >= 50:
-            score += 25
-        elif engagement_score >= 20:
-            score += 10
-
-    if score >= 80:
-        return 'CRITICAL'
-    elif score >= 60:
-        return 'High'
-    elif score >= 30:
-        return 'Medium'
-    else:
-        return 'Low'
-
-
-def map_apollo_industry_to_hubspot(apollo_industry):
-    """Map Apollo industry to HubSpot category"""
-    if not apollo_industry:
-        return None
-
-    industry_lower = apollo_industry.lower()
-
-    if any(kw in industry_lower for kw in ['tech', 'software', 'saas', 'ai', 'data']):
-        return 'Technology'
-    elif any(kw in industry_lower for kw in ['retail', 'ecommerce', 'commerce']):
-        return 'Retail'
-    elif any(kw in industry_lower for kw in ['consumer', 'cpg', 'food', 'beverage', 'cosmetic', 'beauty']):
-        return 'CPG'
-    elif any(kw in industry_lower for kw in ['entertainment', 'media', 'film', 'tv', 'studio']):
-        return 'Entertainment'
-    elif any(kw in industry_lower for kw in ['music', 'record', 'audio']):
-        return 'Music'
-    elif any(kw in industry_lower for kw in ['financial', 'investment', 'bank', 'capital', 'fund']):
-        return 'Financial Services'
-    elif any(kw in industry_lower for kw in ['market', 'advertis', 'agency', 'pr']):
-        return 'Marketing'
-    elif any(kw in industry_lower for kw in ['health', 'medical', 'pharma', 'hospital']):
-        return 'Healthcare'
-    elif any(kw in industry_lower for kw in ['fashion', 'apparel', 'clothing']):
-        return 'Fashion'
-    elif any(kw in industry_lower for kw in ['real estate', 'property']):
-        return 'Real Estate'
-
-    return 'Technology'  # Default
-
-
-def parse_company_size(size_value):
-    """
-    Parse company size from form dropdown or Apollo integer.
-    Returns a tier: 'large', 'medium', 'small', or None if unknown.
-
-    Form dropdown values: "1-10", "11-50", "51-200", "201-500", "501-1000", "1001-5000", "5000+"
-    Apollo returns integer (estimated_num_employees)
-    """
-    if not size_value:
-        return None
-
-    # If it's already an integer (from Apollo)
-    if isinstance(size_value, int):
-        if size_value >= 500:
-            return 'large'
-        elif size_value >= 51:
-            return 'medium'
-        else:
-            return 'small'
-
-    # Form dropdown string values
-    size_str = str(size_value).lower().strip()
-
-    # Large: 500+
-    if size_str in ['501-1000', '1001-5000', '5000+', '5000', '1000+']:
-        return 'large'
-
-    # Medium: 51-500
-    if size_str in ['51-200', '201-500']:
-        return 'medium'
-
-    # Small: 1-50
-    if size_str in ['1-10', '11-50', '1-50']:
-        return 'small'
-
-    return None
+    """Calculate priority level (priority scoring in routing_rules.json)"""
+    return routing_engine.priority.level(decision_maker, engagement_score)
 
 
 def determine_lead_owner(form_company_size, apollo_company_size, apollo_revenue, is_decision_maker):
     """
-    Determine lead owner based on company tier.
+    Determine lead owner with the lead_owner rules in routing_rules.json.
     Uses form data first, falls back to Apollo enrichment.
 
     TOP TIER (Ben - CRO):
@@ -219,73 +179,60 @@ def determine_lead_owner(form_company_size, apollo_company_size, apollo_revenue,
     MIDDLE TIER (Emmet):
       - Everything else (51-500 employees)
     """
-    # Decision makers always go to Ben
-    if is_decision_maker:
-        print(f"Decision maker -> Ben (Top Tier)")
-        return OWNERS["ben"]
-
     # Parse company size - form data takes priority
-    size_tier = parse_company_size(form_company_size)
-    if not size_tier:
-        size_tier = parse_company_size(apollo_company_size)
-
-    # Check Apollo revenue as additional signal
-    if apollo_revenue and apollo_revenue >= 50000000:
-        print(f"High revenue (${apollo_revenue:,}) -> Ben (Top Tier)")
-        return OWNERS["ben"]
-
-    # Route based on company size tier
-    if size_tier == 'large':
-        print(f"Large company ({form_company_size or apollo_company_size}) -> Ben (Top Tier)")
-        return OWNERS["ben"]
+    company_size_tier = size_tier(form_company_size) or size_tier(apollo_company_size)
 
-    if size_tier == 'small':
-        print(f"Small company ({form_company_size or apollo_company_size}) -> Tim (Small Tier)")
-        return OWNERS["tim"]
-
-    if size_tier == 'medium':
-        print(f"Mid-size company ({form_company_size or apollo_company_size}) -> Emmet (Middle Tier)")
-        return OWNERS["emmet"]
-
-    # Unknown size - default to Emmet (middle)
-    print(f"Unknown company size -> Emmet (Middle Tier)")
-    return OWNERS["emmet"]
+    decision = routing_engine.evaluate("lead_owner", {
+        "decision_maker": is_decision_maker,
+        "revenue": apollo_revenue,
+        "size_tier": company_size_tier,
+    })
+    print(f"{decision.explanation} -> {decision.outcome['owner_name']}")
+    return decision.outcome["owner_id"]
 
 
 def get_lead_contact(lead_id):
-    """Get contact associated with a lead"""
-    headers = {
-        "Authorization": f"Bearer {HUBSPOT_TOKEN}",
-        "Content-Type": "application/json"
-    }
-
-    # Get associated contact
-    url = f"{HUBSPOT_BASE}/crm/v4/objects/leads/{lead_id}/associations/contacts"
-    response = requests.get(url, headers=headers)
+    """
+    Get contact associated with a lead.
+    Reads the lead with its contact association inline, then the contact.
+    """
+    url = f"{HUBSPOT_BASE}/crm/v3/objects/leads/{lead_id}"
+    response = hubspot.get(url, headers=hubspot_headers(), params={"associations": "contacts"})
 
     if response.status_code != 200:
-        print(f"Failed to get lead associations: {response.status_code}")
+        print(f"Failed to get lead: {response.status_code}")
         return None
 
-    results = response.json().get("results", [])
+    results = response.json().get("associations", {}).get("contacts", {}).get("results", [])
     if not results:
         print(f"Lead {lead_id} has no associated contact")
         return None
 
-    contact_id = results[0].get("toObjectId")
+    contact_id = str(results[0].get("id"))
 
     # Get contact details
-    contact_url = f"{HUBSPOT_BASE}/crm/v3/objects/contacts/{contact_id}"
-    params = {
-        "properties": "email,firstname,lastname,company,jobtitle,seniority,company_size,industry,contact_type,timeline,use_case,client_use_case,hubspotscore"
-    }
-
-    contact_response = requests.get(contact_url, headers=headers, params=params)
-    if contact_response.status_code != 200:
-        print(f"Failed to get contact: {contact_response.status_code}")
+    contact = batch_get_contacts([contact_id]).get(contact_id)
+    if not contact:
+        print(f"Failed to get contact: {contact_id}")
         return None
 
-    return contact_response.json()
+    return contact
+
+
+def get_leads_with_contacts(lead_ids):
+    """
+    Resolve many leads to their associated contact at once: one association
+    batch read and one contact batch read per 100 leads.
+    Returns {lead_id: contact}; leads without a contact are left out.
+    """
+    lead_contact_ids = batch_get_lead_contact_ids(lead_ids)
+    contacts = batch_get_contacts(sorted(set(lead_contact_ids.values())))
+
+    return {
+        lead_id: contacts[contact_id]
+        for lead_id, contact_id in lead_contact_ids.items()
+        if contact_id in contacts
+    }
 
 
 def update_lead_owner(lead_id, owner_id, lead_props=None):
@@ -301,7 +248,7 @@ def update_lead_owner(lead_id, owner_id, lead_props=None):
     if lead_props:
         properties.update(lead_props)
 
-    response = requests.patch(
+    response = hubspot.patch(
         f"{HUBSPOT_BASE}/crm/v3/objects/leads/{lead_id}",
         headers=headers,
         json={"properties": properties}
@@ -310,6 +257,621 @@ def update_lead_owner(lead_id, owner_id, lead_props=None):
     return response.status_code == 200
 
 
+def is_transient(status_code):
+    """Whether a HubSpot error status is worth retrying (rate limited or unavailable)"""
+    return status_code == 429 or status_code >= 500
+
+
+def batch_get_contacts(contact_ids):
+    """
+    Read many contacts at once. Returns {contact_id: contact}.
+    Raises on 429/5xx, so an outage isn't mistaken for missing contacts.
+    """
+    contacts = {}
+
+    for i in range(0, len(contact_ids), HUBSPOT_BATCH_SIZE):
+        chunk = contact_ids[i:i + HUBSPOT_BATCH_SIZE]
+        response = hubspot.post(
+            f"{HUBSPOT_BASE}/crm/v3/objects/contacts/batch/read",
+            headers=hubspot_headers(),
+            json={
+                "properties": CONTACT_PROPERTIES.split(","),
+                "inputs": [{"id": str(contact_id)} for contact_id in chunk]
+            }
+        )
+
+        # 207 = partial success (some contacts not found)
+        if is_transient(response.status_code):
+            raise Exception(f"HubSpot unavailable reading contacts: {response.status_code}")
+        if response.status_code not in [200, 207]:
+            print(f"Failed to batch read contacts: {response.status_code}")
+            continue
+
+        for contact in response.json().get("results", []):
+            contacts[str(contact.get("id"))] = contact
+
+    return contacts
+
+
+def batch_get_lead_contact_ids(lead_ids):
+    """
+    Get the first associated contact for many leads. Returns {lead_id: contact_id}.
+    Raises on 429/5xx, so an outage isn't mistaken for leads without contacts.
+    """
+    lead_contacts = {}
+
+    for i in range(0, len(lead_ids), HUBSPOT_BATCH_SIZE):
+        chunk = lead_ids[i:i + HUBSPOT_BATCH_SIZE]
+        response = hubspot.post(
+            f"{HUBSPOT_BASE}/crm/v4/associations/leads/contacts/batch/read",
+            headers=hubspot_headers(),
+            json={"inputs": [{"id": str(lead_id)} for lead_id in chunk]}
+        )
+
+        if is_transient(response.status_code):
+            raise Exception(f"HubSpot unavailable reading lead associations: {response.status_code}")
+        if response.status_code not in [200, 207]:
+            print(f"Failed to batch read lead associations: {response.status_code}")
+            continue
+
+        for result in response.json().get("results", []):
+            to = result.get("to", [])
+            if to:
+                lead_contacts[str(result["from"]["id"])] = str(to[0].get("toObjectId"))
+
+    return lead_contacts
+
+
+def batch_update(object_type, updates_by_id):
+    """
+    Update many objects of one type (contacts or leads).
+    Returns (IDs that were updated, IDs whose update failed with 429/5xx
+    and is worth retrying).
+    """
+    updated = set()
+    retryable = set()
+    items = [(object_id, props) for object_id, props in updates_by_id.items() if props]
+
+    for i in range(0, len(items), HUBSPOT_BATCH_SIZE):
+        chunk = items[i:i + HUBSPOT_BATCH_SIZE]
+        response = hubspot.post(
+            f"{HUBSPOT_BASE}/crm/v3/objects/{object_type}/batch/update",
+            headers=hubspot_headers(),
+            json={"inputs": [{"id": str(object_id), "properties": props} for object_id, props in chunk]}
+        )
+
+        if response.status_code not in [200, 207]:
+            print(f"Warning: Failed to batch update {object_type}: {response.status_code}")
+            if is_transient(response.status_code):
+                retryable.update(str(object_id) for object_id, _ in chunk)
+            continue
+
+        for result in response.json().get("results", []):
+            updated.add(str(result.get("id")))
+
+    return updated, retryable
+
+
+def is_personal_email(email):
+    return any(domain in email.lower() for domain in PERSONAL_DOMAINS) if email else False
+
+
+def should_enrich_with_apollo(email, is_personal):
+    """Whether to call Apollo for this email (personal emails depend on SKIP_PERSONAL_EMAILS)"""
+    if not email:
+        return False
+    if is_personal and SKIP_PERSONAL_EMAILS:
+        print(f"Personal email - skipping Apollo enrichment (SKIP_PERSONAL_EMAILS=true): {email}")
+        return False
+    if is_personal:
+        print(f"Personal email - attempting Apollo enrichment (SKIP_PERSONAL_EMAILS=false): {email}")
+    return True
+
+
+def build_contact_updates(props, apollo_data, is_personal):
+    """
+    Merge Apollo data with existing contact properties and calculate
+    decision_maker, lead_tier, priority_level and contact_type.
+    Returns (updates, routing) where routing holds the lead routing inputs.
+    """
+    updates = {}
+
+    if apollo_data:
+        # Job title
+        if not props.get('jobtitle') and apollo_data.get('jobtitle'):
+            updates['jobtitle'] = apollo_data['jobtitle']
+
+        # Seniority
+        if not props.get('seniority') and apollo_data.get('seniority'):
+            updates['seniority'] = apollo_data['seniority']
+
+        # Company
+        if not props.get('company') and apollo_data.get('company'):
+            updates['company'] = apollo_data['company']
+
+        # Industry
+        if not props.get('industry') and apollo_data.get('industry'):
+            hubspot_industry = map_industry(apollo_data['industry'])
+            if hubspot_industry:
+                updates['industry'] = hubspot_industry
+    elif not is_personal:
+        print(f"Apollo returned no data for {props.get('email')}")
+
+    # Calculate decision maker
+    jobtitle = updates.get('jobtitle') or props.get('jobtitle')
+    seniority = updates.get('seniority') or props.get('seniority')
+    is_decision_maker = title_classifier.is_decision_maker(jobtitle, seniority)
+    updates['decision_maker'] = str(is_decision_maker).lower()
+
+    # Get company size from form (contact property) and Apollo
+    form_company_size = props.get('company_size')  # Form dropdown value like "51-200"
+    apollo_company_size = apollo_data.get('company_size') if apollo_data else None
+    apollo_revenue = apollo_data.get('company_revenue') if apollo_data else None
+
+    # Calculate lead tier (uses Apollo data)
+    lead_tier = calculate_lead_tier(apollo_company_size, apollo_revenue)
+    updates['lead_tier'] = lead_tier
+
+    # Calculate priority level
+    engagement_score = int(props.get('hubspotscore', 0)) if props.get('hubspotscore') else None
+    updates['priority_level'] = calculate_priority_level(is_decision_maker, engagement_score)
+
+    # Contact type - default to lead if not set
+    if not props.get('contact_type'):
+        updates['contact_type'] = 'Unqualified Lead'
+
+    routing = {
+        "form_company_size": form_company_size,
+        "apollo_company_size": apollo_company_size,
+        "apollo_revenue": apollo_revenue,
+        "is_decision_maker": is_decision_maker,
+    }
+    return updates, routing
+
+
+def build_lead_updates(props, apollo_data, updates, routing):
+    """
+    Route the lead and copy contact properties onto it.
+    Returns (owner_id, lead_props).
+    """
+    # Determine lead owner based on company tier
+    # Uses FORM data first (company_size dropdown), falls back to Apollo
+    owner_id = determine_lead_owner(
+        routing["form_company_size"],
+        routing["apollo_company_size"],
+        routing["apollo_revenue"],
+        routing["is_decision_maker"]
+    )
+    apollo_company_size = routing["apollo_company_size"]
+
+    lead_props = {}
+    if props.get('company') or (apollo_data and apollo_data.get('company')):
+        lead_props['lead_company_name'] = props.get('company') or apollo_data.get('company')
+    if props.get('company_size') or apollo_company_size:
+        lead_props['lead_company_size'] = props.get('company_size') or str(apollo_company_size)
+    if props.get('jobtitle') or (apollo_data and apollo_data.get('jobtitle')):
+        lead_props['lead_job_title'] = props.get('jobtitle') or apollo_data.get('jobtitle')
+    if props.get('industry') or updates.get('industry'):
+        lead_props['lead_industry'] = props.get('industry') or updates.get('industry')
+    if props.get('contact_type'):
+        lead_props['lead_company_type'] = props.get('contact_type')
+    if props.get('timeline'):
+        lead_props['lead_timeline'] = props.get('timeline')
+    # Check both use_case and client_use_case (form might map to either)
+    use_case_value = props.get('use_case') or props.get('client_use_case')
+    if use_case_value:
+        lead_props['lead_use_case'] = use_case_value
+
+    return owner_id, lead_props
+
+
+def get_owner_name(owner_id):
+    return routing_engine.owner_name(owner_id) or "Emmet"
+
+
+# Dedupe: results remembered per event ID and contact ID for this many seconds
+DEDUPE_WINDOW_SECONDS = int(os.getenv('ENRICH_DEDUPE_WINDOW_SECONDS', '300'))
+
+_recent = IdempotencyStore(DEDUPE_WINDOW_SECONDS)
+_inflight = SingleFlight()
+
+
+def enrich_contact_once(contact_id, props):
+    """
+    Apollo-enrich and update one contact, at most once per dedupe window.
+    Concurrent calls for the same contact share one in-flight enrichment.
+    Returns {"apollo_data", "updates", "routing", "is_personal_email"}.
+    """
+    key = ("contact", str(contact_id))
+
+    def enrich():
+        # Another request may have finished enriching while we waited
+        enrichment = _recent.get(key)
+        if enrichment is not None:
+            print(f"Contact {contact_id} enriched recently - reusing result")
+            return enrichment
+
+        email = props.get('email')
+
+        # Check if personal email (won't enrich with Apollo but still process)
+        is_personal = is_personal_email(email)
+
+        # Enrich with Apollo (conditionally skip for personal emails based on config)
+        apollo_data = enrich_with_apollo(email) if should_enrich_with_apollo(email, is_personal) else None
+
+        # Build updates (merge Apollo data with existing)
+        updates, routing = build_contact_updates(props, apollo_data, is_personal)
+
+        # Update contact in HubSpot
+        updated = True
+        if updates:
+            print(f"Updating {len(updates)} fields for {email}")
+
+            update_response = hubspot.patch(
+                f"{HUBSPOT_BASE}/crm/v3/objects/contacts/{contact_id}",
+                headers=hubspot_headers(),
+                json={"properties": updates}
+            )
+
+            if update_response.status_code != 200:
+                print(f"Warning: Failed to update contact: {update_response.status_code}")
+                updated = False
+
+        enrichment = {
+            "apollo_data": apollo_data,
+            "updates": updates,
+            "routing": routing,
+            "is_personal_email": is_personal,
+        }
+        # Only a contact that was actually updated is skipped on retries
+        if updated:
+            _recent.put(key, enrichment)
+        return enrichment
+
+    return _inflight.do(key, enrich)
+
+
+def process_events(events):
+    """
+    Enrich a batch of {"lead_id"} / {"contact_id"} events with batch reads,
+    Apollo bulk match and batch updates (a few API calls per 100 events
+    instead of three or four per event).
+
+    Contacts another request is already enriching aren't enriched again:
+    the batch waits for that result, as enrich_contact_once does.
+
+    Returns one result dict per event, in order. Results that failed on a
+    429/5xx write, or on another request's enrichment, are marked
+    "retryable". Reads raise on 429/5xx (nothing is written yet).
+    """
+    lead_ids = [str(e['lead_id']) for e in events if e.get('lead_id')]
+    lead_contacts = get_leads_with_contacts(lead_ids) if lead_ids else {}
+
+    # Resolve every event to a contact ID
+    contacts = {str(c['id']): c for c in lead_contacts.values()}
+    event_contact_ids = []
+    for event in events:
+        if event.get('lead_id'):
+            contact = lead_contacts.get(str(event['lead_id']))
+            event_contact_ids.append(str(contact['id']) if contact else None)
+        elif event.get('contact_id'):
+            event_contact_ids.append(str(event['contact_id']))
+        else:
+            event_contact_ids.append(None)
+
+    # Contacts not already read through their lead
+    missing = sorted({cid for cid in event_contact_ids if cid and cid not in contacts})
+    if missing:
+        contacts.update(batch_get_contacts(missing))
+    contact_ids = sorted({cid for cid in event_contact_ids if cid in contacts})
+
+    # Contacts enriched within the dedupe window reuse that enrichment
+    recent = {}
+    for contact_id in contact_ids:
+        enrichment = _recent.get(("contact", contact_id))
+        if enrichment is not None:
+            recent[contact_id] = enrichment
+
+    # Claim the rest; contacts another request is enriching are waited on below
+    claimed, running = _inflight.claim([("contact", cid) for cid in contact_ids if cid not in recent])
+
+    contact_updates = {}
+    enrichments = {}
+    updated_contacts = set()
+    retryable_contacts = set()
+    try:
+        # Another request may have finished enriching before we claimed
+        to_enrich = []
+        for _, contact_id in claimed:
+            enrichment = _recent.get(("contact", contact_id))
+            if enrichment is not None:
+                recent[contact_id] = enrichment
+            else:
+                to_enrich.append(contact_id)
+
+        # One Apollo lookup per distinct email
+        emails_to_enrich = []
+        for contact_id in to_enrich:
+            email = contacts[contact_id].get('properties', {}).get('email')
+            if should_enrich_with_apollo(email, is_personal_email(email)) and email not in emails_to_enrich:
+                emails_to_enrich.append(email)
+        apollo_by_email = enrich_with_apollo_bulk(emails_to_enrich) if emails_to_enrich else {}
+
+        for contact_id in to_enrich:
+            props = contacts[contact_id].get('properties', {})
+            email = props.get('email')
+            is_personal = is_personal_email(email)
+            apollo_data = apollo_by_email.get(email)
+            updates, routing = build_contact_updates(props, apollo_data, is_personal)
+            enrichments[contact_id] = {
+                "apollo_data": apollo_data,
+                "updates": updates,
+                "routing": routing,
+                "is_personal_email": is_personal,
+            }
+            contact_updates[contact_id] = updates
+
+        print(f"Updating {len(contact_updates)} contacts")
+        updated_contacts, retryable_contacts = batch_update("contacts", contact_updates)
+    finally:
+        # Hand each claimed contact's enrichment to anyone waiting on it
+        for key in claimed:
+            contact_id = key[1]
+            if contact_id in recent:
+                _inflight.release(key, recent[contact_id])
+            elif contact_id in enrichments and (not contact_updates[contact_id] or contact_id in updated_contacts):
+                # Only a contact that was actually updated is skipped on retries
+                _recent.put(key, enrichments[contact_id])
+                _inflight.release(key, enrichments[contact_id])
+            else:
+                _inflight.release(key, error=Exception(f"Failed to update contact {contact_id}"))
+
+    failed_contacts = {}
+    for key, call in running.items():
+        contact_id = key[1]
+        try:
+            _inflight.wait(call)
+        except Exception as e:
+            failed_contacts[contact_id] = str(e)
+            continue
+        # The other request's enrichment only counts if its update went through
+        enrichment = _recent.get(key)
+        if enrichment is None:
+            failed_contacts[contact_id] = f"Failed to update contact {contact_id}"
+        else:
+            recent[contact_id] = enrichment
+
+    # Build results and lead updates
+    lead_updates = {}
+    results = []
+    for event, contact_id in zip(events, event_contact_ids):
+        lead_id = str(event['lead_id']) if event.get('lead_id') else None
+
+        if not lead_id and not event.get('contact_id'):
+            results.append({"success": False, "error": "Missing lead_id or contact_id"})
+            continue
+        if not contact_id:
+            results.append({"success": False, "lead_id": lead_id, "error": "No contact associated with lead"})
+            continue
+        if contact_id not in contacts:
+            results.append({"success": False, "contact_id": contact_id, "error": f"Contact {contact_id} not found"})
+            continue
+        if contact_id in failed_contacts:
+            results.append({"success": False, "contact_id": contact_id, "error": failed_contacts[contact_id],
+                            "retryable": True})
+            continue
+
+        props = contacts[contact_id].get('properties', {})
+        enrichment = recent.get(contact_id) or enrichments[contact_id]
+        apollo_data = enrichment["apollo_data"]
+        updates = enrichment["updates"]
+        routing = enrichment["routing"]
+        is_personal = enrichment["is_personal_email"]
+
+        result = {
+            "success": True,
+            "contact_id": contact_id,
+            "contact_fields_updated": list(updates.keys()),
+            "is_personal_email": is_personal,
+            "routing": routing,
+        }
+
+        if lead_id:
+            owner_id, lead_props = build_lead_updates(props, apollo_data, updates, routing)
+            lead_updates[lead_id] = {"hubspot_owner_id": owner_id, **lead_props}
+            result["lead_id"] = lead_id
+            result["owner_id"] = owner_id
+            result["owner_name"] = get_owner_name(owner_id)
+            result["lead_fields_updated"] = list(lead_props.keys())
+
+        results.append(result)
+
+    print(f"Updating {len(lead_updates)} leads")
+    updated_leads, retryable_leads = batch_update("leads", lead_updates) if lead_updates else (set(), set())
+
+    # An event succeeded only if its writes did (contacts with nothing to change count as written)
+    for result in results:
+        if not result["success"]:
+            continue
+        contact_id = result["contact_id"]
+        if contact_updates.get(contact_id) and contact_id not in updated_contacts:
+            result.update({"success": False, "error": f"Failed to update contact {contact_id}",
+                           "retryable": contact_id in retryable_contacts})
+        elif result.get("lead_id") and result["lead_id"] not in updated_leads:
+            result.update({"success": False, "error": f"Failed to update lead {result['lead_id']}",
+                           "retryable": result["lead_id"] in retryable_leads})
+        if not result["success"]:
+            print(result["error"])
+
+    return results
+
+
+def normalize_event(raw):
+    """
+    Turn a webhook event into {"lead_id": ...} or {"contact_id": ...}.
+
+    Accepts our workflow payloads ({"lead_id"} / {"contact_id"}) and HubSpot
+    webhook subscription events ({"subscriptionType": "contact.creation",
+    "objectId": ...} or {"objectTypeId": "0-136", "objectId": ...} for leads).
+    Returns None if the event isn't about a contact or lead.
+    """
+    if not isinstance(raw, dict):
+        return None
+
+    if raw.get('lead_id'):
+        return {"lead_id": str(raw['lead_id'])}
+    if raw.get('contact_id'):
+        return {"contact_id": str(raw['contact_id'])}
+
+    object_id = raw.get('objectId')
+    if not object_id:
+        return None
+
+    subscription_type = raw.get('subscriptionType', '')
+    object_type = raw.get('objectTypeId')
+    if subscription_type.startswith('contact.') or object_type == CONTACT_OBJECT_TYPE:
+        return {"contact_id": str(object_id)}
+    if object_type == LEAD_OBJECT_TYPE:
+        return {"lead_id": str(object_id)}
+
+    return None
+
+
+def event_key(event):
+    """Dedupe key for a normalized event"""
+    if event.get('lead_id'):
+        return ('lead', event['lead_id'])
+    return ('contact', event['contact_id'])
+
+
+def process_event_batch(raw_events):
+    """
+    Enrich a webhook batch. Repeated object IDs are processed once.
+    Returns one status dict per raw event, in order.
+    """
+    events = [normalize_event(raw) for raw in raw_events]
+
+    # Event IDs already processed within the window are answered from the store
+    previous_statuses = {}
+    for index, raw in enumerate(raw_events):
+        if isinstance(raw, dict) and raw.get('eventId') is not None:
+            previous = _recent.get(("event", str(raw['eventId'])))
+            if previous is not None:
+                previous_statuses[index] = {**previous, "status": "duplicate"}
+                events[index] = None
+
+    # First occurrence of each object is processed; later ones share its result
+    unique = []
+    first_index = {}
+    for event in events:
+        if event and event_key(event) not in first_index:
+            first_index[event_key(event)] = len(unique)
+            unique.append(event)
+
+    print(f"Processing batch of {len(raw_events)} events ({len(unique)} unique)")
+    results = process_events(unique) if unique else []
+
+    statuses = []
+    seen = set()
+    for index, (raw, event) in enumerate(zip(raw_events, events)):
+        if index in previous_statuses:
+            statuses.append(previous_statuses[index])
+            continue
+
+        status = {}
+        if isinstance(raw, dict) and raw.get('eventId') is not None:
+            status["event_id"] = raw['eventId']
+
+        if not event:
+            status.update({"status": "ignored", "error": "Not a contact or lead event"})
+        else:
+            key = event_key(event)
+            result = results[first_index[key]]
+            if key in seen:
+                status["status"] = "duplicate"
+            else:
+                status["status"] = "processed" if result.get("success") else "error"
+            seen.add(key)
+            status.update(event)
+            status["result"] = result
+
+            if status.get("event_id") is not None and result.get("success"):
+                _recent.put(("event", str(status["event_id"])), status)
+
+        statuses.append(status)
+
+    return statuses
+
+
+# Respond-fast mode: enqueue a durable job and let process_jobs enrich it
+RESPOND_FAST = os.getenv('RESPOND_FAST', 'false').lower() == 'true'
+
+if RESPOND_FAST:
+    # Fail at startup rather than queue jobs no worker will see
+    from job_queue import require_durable_queue
+    require_durable_queue("RESPOND_FAST")
+
+
+def enqueue_events(events):
+    """Enqueue normalized events for the process_jobs worker. Returns the number queued."""
+    from job_queue import get_job_queue
+
+    unique = list({event_key(e): e for e in events if e}.values())
+    if unique:
+        job_ids = get_job_queue().enqueue_many("enrich_contact", unique)
+        print(f"Queued {len(unique)} enrich_contact jobs ({job_ids[0]}...)")
+    return len(unique)
+
+
+# Buffered mode: acknowledge webhooks immediately and enrich in batches
+ENRICH_BUFFERED = os.getenv('ENRICH_BUFFERED', 'false').lower() == 'true'
+BATCH_MAX_SIZE = int(os.getenv('ENRICH_BATCH_MAX_SIZE', '100'))
+BATCH_MAX_WAIT_SECONDS = float(os.getenv('ENRICH_BATCH_MAX_WAIT_SECONDS', '2'))
+
+if ENRICH_BUFFERED:
+    # After the 202 the instance may be throttled or scaled down, so events
+    # buffered in process would be lost: require the durable queue on GCP
+    from job_queue import require_durable_queue
+    require_durable_queue("ENRICH_BUFFERED")
+
+_batcher = None
+
+
+def buffer_events(events):
+    """
+    Buffer normalized events for batched enrichment. Returns the number queued.
+
+    With the Cloud Tasks job queue they're enqueued durably for process_jobs;
+    otherwise (local runs and tests) they go to the in-process micro-batcher.
+    """
+    from job_queue import JOB_QUEUE_BACKEND
+
+    if JOB_QUEUE_BACKEND == "cloud_tasks":
+        return enqueue_events(events)
+
+    unique = {event_key(e): e for e in events if e}
+    for event in unique.values():
+        get_batcher().submit(event)
+    return len(unique)
+
+
+def get_batcher():
+    """In-process micro-batcher shared by all requests (local runs only; started on first use)"""
+    global _batcher
+
+    if _batcher is None:
+        from micro_batch import MicroBatcher
+
+        _batcher = MicroBatcher(
+            process_events,
+            max_batch_size=BATCH_MAX_SIZE,
+            max_wait_seconds=BATCH_MAX_WAIT_SECONDS,
+        )
+        _batcher.start()
+
+    return _batcher
+
+
 @functions_framework.http
 def enrich_contact(request):
     """
@@ -319,6 +881,10 @@ def enrich_contact(request):
     Accepts either:
     - {"lead_id": "123"} - Enriches associated contact and routes lead
     - {"contact_id": "456"} - Enriches contact only (no lead routing)
+
+    With ENRICH_BUFFERED=true the event is buffered (durably on Cloud
+    Functions) and acknowledged with a 202; buffered events are enriched
+    together by process_events.
     """
     # CORS headers
     if request.method == 'OPTIONS':
@@ -330,16 +896,48 @@ def enrich_contact(request):
         return ('', 204, headers)
 
     headers_cors = {'Access-Control-Allow-Origin': '*'}
+    start_deadline()
 
     try:
-        # Get lead_id OR contact_id from webhook
         data = request.get_json()
+
+        # HubSpot webhook subscriptions deliver arrays of events
+        if isinstance(data, list):
+            if RESPOND_FAST:
+                queued = enqueue_events([normalize_event(raw) for raw in data])
+                return ({"accepted": True, "queued": queued}, 202, headers_cors)
+
+            if ENRICH_BUFFERED:
+                queued = buffer_events([normalize_event(raw) for raw in data])
+                return ({"accepted": True, "queued": queued}, 202, headers_cors)
+
+            statuses = process_event_batch(data)
+            # Always 200: a non-2xx would make HubSpot retry the whole batch
+            return ({"success": True, "results": statuses}, 200, headers_cors)
+
+        # Get lead_id OR contact_id from webhook
         lead_id = data.get('lead_id')
         contact_id = data.get('contact_id')
 
         if not lead_id and not contact_id:
             return ({"error": "Missing lead_id or contact_id"}, 400, headers_cors)
 
+        # HubSpot retries: answer a repeated event ID with the earlier response
+        event_id = data.get('eventId')
+        if event_id is not None:
+            previous = _recent.get(("event", str(event_id)))
+            if previous is not None:
+                print(f"Duplicate event {event_id} - returning earlier result")
+                return ({**previous, "duplicate": True}, 200, headers_cors)
+
+        if RESPOND_FAST:
+            enqueue_events([{"lead_id": str(lead_id)} if lead_id else {"contact_id": str(contact_id)}])
+            return ({"accepted": True}, 202, headers_cors)
+
+        if ENRICH_BUFFERED:
+            buffer_events([{"lead_id": str(lead_id)} if lead_id else {"contact_id": str(contact_id)}])
+            return ({"accepted": True}, 202, headers_cors)
+
         # If lead_id provided, get associated contact
         if lead_id:
             print(f"Processing lead: {lead_id}")
@@ -352,15 +950,9 @@ def enrich_contact(request):
         # If only contact_id provided, fetch contact directly
         else:
             print(f"Processing contact: {contact_id}")
-            headers = {
-                "Authorization": f"Bearer {HUBSPOT_TOKEN}",
-                "Content-Type": "application/json"
-            }
             contact_url = f"{HUBSPOT_BASE}/crm/v3/objects/contacts/{contact_id}"
-            params = {
-                "properties": "email,firstname,lastname,company,jobtitle,seniority,company_size,industry,contact_type,timeline,use_case,client_use_case,hubspotscore"
-            }
-            contact_response = requests.get(contact_url, headers=headers, params=params)
+            params = {"properties": CONTACT_PROPERTIES}
+            contact_response = hubspot.get(contact_url, headers=hubspot_headers(), params=params)
 
             if contact_response.status_code != 200:
                 return ({"error": f"Contact {contact_id} not found"}, 404, headers_cors)
@@ -371,134 +963,28 @@ def enrich_contact(request):
 
         print(f"Found associated contact: {contact_id} ({email})")
 
-        # Check if personal email (won't enrich with Apollo but still process)
-        personal_domains = ['gmail.com', 'yahoo.com', 'hotmail.com', 'outlook.com', 'icloud.com', 'aol.com']
-        is_personal_email = any(domain in email.lower() for domain in personal_domains) if email else False
-
-        # Enrich with Apollo (conditionally skip for personal emails based on config)
-        apollo_data = None
-        if email:
-            if is_personal_email and SKIP_PERSONAL_EMAILS:
-                print(f"Personal email - skipping Apollo enrichment (SKIP_PERSONAL_EMAILS=true): {email}")
-            elif is_personal_email and not SKIP_PERSONAL_EMAILS:
-                print(f"Personal email - attempting Apollo enrichment (SKIP_PERSONAL_EMAILS=false): {email}")
-                apollo_data = enrich_with_apollo(email)
-            else:
-                # Business email - always enrich
-                apollo_data = enrich_with_apollo(email)
-
-        # Build updates (merge Apollo data with existing)
-        updates = {}
-
-        # Get names from Apollo or existing
-        firstname = props.get('firstname') or (apollo_data.get('firstname') if apollo_data else None)
-        lastname = props.get('lastname') or (apollo_data.get('lastname') if apollo_data else None)
-
-        if apollo_data:
-            # Job title
-            if not props.get('jobtitle') and apollo_data.get('jobtitle'):
-                updates['jobtitle'] = apollo_data['jobtitle']
-
-            # Seniority
-            if not props.get('seniority') and apollo_data.get('seniority'):
-                updates['seniority'] = apollo_data['seniority']
-
-            # Company
-            if not props.get('company') and apollo_data.get('company'):
-                updates['company'] = apollo_data['company']
-
-            # Industry
-            if not props.get('industry') and apollo_data.get('industry'):
-                hubspot_industry = map_apollo_industry_to_hubspot(apollo_data['industry'])
-                if hubspot_industry:
-                    updates['industry'] = hubspot_industry
-        elif not is_personal_email:
-            print(f"Apollo returned no data for {email}")
-
-        # Calculate decision maker
-        jobtitle = updates.get('jobtitle') or props.get('jobtitle')
-        seniority = updates.get('seniority') or props.get('seniority')
-        is_decision_maker = calculate_decision_maker(jobtitle, seniority)
-        updates['decision_maker'] = str(is_decision_maker).lower()
-
-        # Get company size from form (contact property) and Apollo
-        form_company_size = props.get('company_size')  # Form dropdown value like "51-200"
-        apollo_company_size = apollo_data.get('company_size') if apollo_data else None
-        apollo_revenue = apollo_data.get('company_revenue') if apollo_data else None
-
-        # Calculate lead tier (uses Apollo data)
-        lead_tier = calculate_lead_tier(apollo_company_size, apollo_revenue)
-        updates['lead_tier'] = lead_tier
-
-        # Calculate priority level
-        engagement_score = int(props.get('hubspotscore', 0)) if props.get('hubspotscore') else None
-        updates['priority_level'] = calculate_priority_level(is_decision_maker, engagement_score)
-
-        # Contact type - default to lead if not set
-        if not props.get('contact_type'):
-            updates['contact_type'] = 'Unqualified Lead'
-
-        # Update contact in HubSpot
-        if updates:
-            print(f"Updating {len(updates)} fields for {email}")
-
-            update_response = requests.patch(
-                f"{HUBSPOT_BASE}/crm/v3/objects/contacts/{contact_id}",
-                headers={
-                    "Authorization": f"Bearer {HUBSPOT_TOKEN}",
-                    "Content-Type": "application/json"
-                },
-                json={"properties": updates}
-            )
-
-            if update_response.status_code != 200:
-                print(f"Warning: Failed to update contact: {update_response.status_code}")
+        # Enrich and update the contact (shared with concurrent/recent requests)
+        enrichment = enrich_contact_once(contact_id, props)
+        apollo_data = enrichment["apollo_data"]
+        updates = enrichment["updates"]
+        routing = enrichment["routing"]
+        is_personal = enrichment["is_personal_email"]
 
         # Build response data
         response_data = {
             "success": True,
             "contact_id": contact_id,
             "contact_fields_updated": list(updates.keys()),
-            "is_personal_email": is_personal_email,
-            "routing": {
-                "form_company_size": form_company_size,
-                "apollo_company_size": apollo_company_size,
-                "apollo_revenue": apollo_revenue,
-                "is_decision_maker": is_decision_maker,
-            }
+            "is_personal_email": is_personal,
+            "routing": routing,
         }
 
         # If lead_id provided, update lead properties and owner
         if lead_id:
-            # Determine lead owner based on company tier
-            # Uses FORM data first (company_size dropdown), falls back to Apollo
-            owner_id = determine_lead_owner(
-                form_company_size,
-                apollo_company_size,
-                apollo_revenue,
-                is_decision_maker
-            )
-
-            lead_props = {}
-            if props.get('company') or (apollo_data and apollo_data.get('company')):
-                lead_props['lead_company_name'] = props.get('company') or apollo_data.get('company')
-            if props.get('company_size') or apollo_company_size:
-                lead_props['lead_company_size'] = props.get('company_size') or str(apollo_company_size)
-            if props.get('jobtitle') or (apollo_data and apollo_data.get('jobtitle')):
-                lead_props['lead_job_title'] = props.get('jobtitle') or apollo_data.get('jobtitle')
-            if props.get('industry') or updates.get('industry'):
-                lead_props['lead_industry'] = props.get('industry') or updates.get('industry')
-            if props.get('contact_type'):
-                lead_props['lead_company_type'] = props.get('contact_type')
-            if props.get('timeline'):
-                lead_props['lead_timeline'] = props.get('timeline')
-            # Check both use_case and client_use_case (form might map to either)
-            use_case_value = props.get('use_case') or props.get('client_use_case')
-            if use_case_value:
-                lead_props['lead_use_case'] = use_case_value
+            owner_id, lead_props = build_lead_updates(props, apollo_data, updates, routing)
 
             # Update lead with owner and properties
-            owner_name = "Ben" if owner_id == OWNERS["ben"] else ("Tim" if owner_id == OWNERS["tim"] else "Emmet")
+            owner_name = get_owner_name(owner_id)
             print(f"Routing lead {lead_id} to {owner_name}")
 
             if update_lead_owner(lead_id, owner_id, lead_props):
@@ -511,6 +997,9 @@ def enrich_contact(request):
             response_data["owner_name"] = owner_name
             response_data["lead_fields_updated"] = list(lead_props.keys())
 
+        if event_id is not None:
+            _recent.put(("event", str(event_id)), response_data)
+
         return (response_data, 200, headers_cors)
 
     except Exception as e:
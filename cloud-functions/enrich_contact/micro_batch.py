@@ -0,0 +1,157 @@
+"""
+Micro-batching for webhook bursts.
+
+Events are put on a queue and acknowledged right away; a background thread
+drains the queue and hands events to a flush function in batches, as soon
+as max_batch_size events are waiting or max_wait_seconds have passed since
+the first one arrived.
+
+LocalQueue is an in-process stand-in for a real queue (Pub/Sub, Cloud Tasks)
+so batching can be run and tested offline. It isn't durable: events still
+queued when the process stops are lost, so on Cloud Functions enrich_contact
+buffers through job_queue instead. Any object with put(event) and
+get_batch(max_items, timeout) can be used instead.
+
+A batch whose flush raises is retried, retry_seconds later (longer each
+time), up to max_attempts times in all. After that its events are kept in
+MicroBatcher.failed rather than dropped, for the caller to inspect or
+resubmit.
+"""
+
+import queue
+import threading
+import time
+
+
+class LocalQueue:
+    """In-memory, thread-safe event queue"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def put(self, event):
+        self._queue.put(event)
+
+    def get_batch(self, max_items, timeout):
+        """
+        Wait up to `timeout` seconds for the first event, then keep collecting
+        until `max_items` events or `timeout` seconds after the first one.
+        Returns a (possibly empty) list.
+        """
+        try:
+            batch = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + timeout
+        while len(batch) < max_items:
+            # Take whatever is already waiting before blocking
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def __len__(self):
+        return self._queue.qsize()
+
+
+class MicroBatcher:
+    """Buffers submitted events and flushes them in batches by size or time"""
+
+    def __init__(self, flush, max_batch_size=100, max_wait_seconds=2.0, event_queue=None,
+                 max_attempts=3, retry_seconds=5.0):
+        self.flush = flush
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.queue = event_queue if event_queue is not None else LocalQueue()
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.stats = {"submitted": 0, "batches": 0, "flushed": 0, "errors": 0, "failed": 0}
+        # Events whose batch failed max_attempts times
+        self.failed = []
+        # (due time, batch, attempt) for failed batches waiting to be retried
+        self._retries = []
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def submit(self, event):
+        """Queue an event. Returns immediately."""
+        self.queue.put(event)
+        self.stats["submitted"] += 1
+
+    def start(self):
+        """Start the background flush thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, drain=True):
+        """Stop the flush thread, optionally flushing whatever is still queued"""
+        self._stopping.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        if drain:
+            self.flush_pending()
+
+    def flush_pending(self):
+        """
+        Flush everything queued right now, in batches, then retry failed
+        batches without waiting. Returns the number of events flushed.
+        """
+        flushed = self.stats["flushed"]
+        while True:
+            batch = self.queue.get_batch(self.max_batch_size, 0)
+            if not batch:
+                break
+            self._flush_batch(batch)
+        while self._retries:
+            self._retry_due(force=True)
+        return self.stats["flushed"] - flushed
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._retry_due()
+            batch = self.queue.get_batch(self.max_batch_size, self.max_wait_seconds)
+            if batch:
+                self._flush_batch(batch)
+
+    def _retry_due(self, force=False):
+        """Retry failed batches whose wait is over (all of them with force)"""
+        now = time.monotonic()
+        due, waiting = [], []
+        for retry in self._retries:
+            (due if force or retry[0] <= now else waiting).append(retry)
+        self._retries = waiting
+        for _, batch, attempt in due:
+            self._flush_batch(batch, attempt)
+
+    def _flush_batch(self, batch, attempt=1):
+        self.stats["batches"] += 1
+        try:
+            print(f"Flushing batch of {len(batch)} events")
+            self.flush(batch)
+            self.stats["flushed"] += len(batch)
+        except Exception as e:
+            # Keep the thread alive; retry the batch later, or keep its events
+            self.stats["errors"] += 1
+            if attempt < self.max_attempts:
+                print(f"Error flushing batch (attempt {attempt}), retrying: {e}")
+                self._retries.append((time.monotonic() + self.retry_seconds * attempt, batch, attempt + 1))
+            else:
+                print(f"Error flushing batch, giving up on {len(batch)} events after {attempt} attempts: {e}")
+                self.stats["failed"] += len(batch)
+                self.failed.extend(batch)
@@ -9,11 +9,22 @@ import os
 import json
 import base64
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
+import httplib2
 from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
 
+from outbound import TIMEOUTS, CircuitOpenError, DeadlineExceeded, call
+
+from payload_metrics import (
+    USE_FIELD_MASKS,
+    record_payload,
+    reset_payload_stats,
+    log_payload_stats,
+)
+
 
 # Service account credentials (stored as JSON string in env var)
 GOOGLE_CREDENTIALS = os.environ.get("GOOGLE_CREDENTIALS", "{}")
@@ -29,6 +40,17 @@ KARTEL_INBOXES = [
 
 SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
 
+# Only the headers we read (Cc is used for deal attribution)
+METADATA_HEADERS = ["From", "To", "Cc", "Subject", "Date"]
+
+# Addresses per search query: each adds a from: and a to: term, and Gmail
+# rejects queries past a few thousand characters
+QUERY_ADDRESSES = int(os.environ.get("GMAIL_QUERY_ADDRESSES", "25"))
+
+# Partial-response masks: only the fields search_gmail uses
+LIST_FIELDS = "messages(id),nextPageToken"
+GET_FIELDS = "id,internalDate,snippet,payload/headers"
+
 
 def _get_gmail_service(user_email: str):
     """
@@ -43,7 +65,10 @@ def _get_gmail_service(user_email: str):
     # Delegate to the specific user
     delegated_credentials = credentials.with_subject(user_email)
 
-    service = build("gmail", "v1", credentials=delegated_credentials)
+    # Bound every API call by the Google read timeout
+    http = AuthorizedHttp(delegated_credentials, http=httplib2.Http(timeout=TIMEOUTS["google"][1]))
+
+    service = build("gmail", "v1", http=http)
     return service
 
 
@@ -51,6 +76,7 @@ def search_gmail(
     email_addresses: List[str],
     since_hours: int = 24,
     max_results: int = 50,
+    deal_index: Optional[Any] = None,
 ) -> List[Dict[str, Any]]:
     """
     Search Gmail for emails from/to specific email addresses.
@@ -59,42 +85,49 @@ def search_gmail(
         email_addresses: List of contact emails to search for
         since_hours: Only get emails from the last N hours
         max_results: Maximum number of emails to return
+        deal_index: Optional DealIndex used to tag each email with deal_ids
 
     Returns:
         List of email objects with sender, recipient, subject, date, snippet
+        (and deal_ids when a deal_index is given)
     """
     if not email_addresses:
         return []
 
-    # Build Gmail search query
-    # Format: (from:email1 OR from:email2 OR to:email1 OR to:email2)
-    from_queries = [f"from:{email}" for email in email_addresses]
-    to_queries = [f"to:{email}" for email in email_addresses]
-    email_query = f"({' OR '.join(from_queries + to_queries)})"
-
     # Add date filter
     since_date = datetime.now() - timedelta(hours=since_hours)
     date_query = f"after:{since_date.strftime('%Y/%m/%d')}"
 
-    full_query = f"{email_query} {date_query}"
+    # Build Gmail search queries, QUERY_ADDRESSES addresses each
+    # Format: (from:email1 OR from:email2 OR to:email1 OR to:email2) after:...
+    queries = []
+    for start in range(0, len(email_addresses), QUERY_ADDRESSES):
+        chunk = email_addresses[start:start + QUERY_ADDRESSES]
+        from_queries = [f"from:{email}" for email in chunk]
+        to_queries = [f"to:{email}" for email in chunk]
+        queries.append(f"({' OR '.join(from_queries + to_queries)}) {date_query}")
 
     all_emails = []
     seen_message_ids = set()
+    reset_payload_stats("gmail")
 
     # Search each Kartel inbox
     for inbox in KARTEL_INBOXES:
         try:
             service = _get_gmail_service(inbox)
 
-            # Search for messages
-            results = (
-                service.users()
-                .messages()
-                .list(userId="me", q=full_query, maxResults=max_results)
-                .execute()
-            )
+            # Search for messages, one query per address chunk
+            messages = []
+            for query in queries:
+                list_kwargs = {"userId": "me", "q": query, "maxResults": max_results}
+                if USE_FIELD_MASKS:
+                    list_kwargs["fields"] = LIST_FIELDS
 
-            messages = results.get("messages", [])
+                results = record_payload(
+                    "gmail",
+                    call("google", service.users().messages().list(**list_kwargs).execute),
+                )
+                messages.extend(results.get("messages", []))
 
             for msg in messages:
                 msg_id = msg["id"]
@@ -104,12 +137,15 @@ def search_gmail(
                     continue
                 seen_message_ids.add(msg_id)
 
-                # Get full message details
-                message = (
-                    service.users()
-                    .messages()
-                    .get(userId="me", id=msg_id, format="metadata")
-                    .execute()
+                # Get message headers only
+                get_kwargs = {"userId": "me", "id": msg_id, "format": "metadata"}
+                if USE_FIELD_MASKS:
+                    get_kwargs["metadataHeaders"] = METADATA_HEADERS
+                    get_kwargs["fields"] = GET_FIELDS
+
+                message = record_payload(
+                    "gmail",
+                    call("google", service.users().messages().get(**get_kwargs).execute),
                 )
 
                 headers = {
@@ -124,22 +160,35 @@ def search_gmail(
                 else:
                     email_date = None
 
-                all_emails.append(
-                    {
-                        "id": msg_id,
-                        "from": headers.get("from", "Unknown"),
-                        "to": headers.get("to", "Unknown"),
-                        "subject": headers.get("subject", "(no subject)"),
-                        "date": email_date.isoformat() if email_date else None,
-                        "snippet": message.get("snippet", ""),
-                        "searched_inbox": inbox,
-                    }
-                )
+                email_obj = {
+                    "id": msg_id,
+                    "from": headers.get("from", "Unknown"),
+                    "to": headers.get("to", "Unknown"),
+                    "subject": headers.get("subject", "(no subject)"),
+                    "date": email_date.isoformat() if email_date else None,
+                    "snippet": message.get("snippet", ""),
+                    "searched_inbox": inbox,
+                }
+
+                # Attribute to deals by participant email / company domain
+                if deal_index is not None:
+                    email_obj["deal_ids"] = deal_index.deals_for_headers(
+                        headers.get("from"), headers.get("to"), headers.get("cc")
+                    )
+
+                all_emails.append(email_obj)
+
+        except (CircuitOpenError, DeadlineExceeded) as e:
+            # Gmail is down or we're out of time - stop instead of trying every inbox
+            print(f"Stopping Gmail search at inbox {inbox}: {e}")
+            break
 
         except Exception as e:
             print(f"Error searching inbox {inbox}: {e}")
             continue
 
+    log_payload_stats("gmail")
+
     # Sort by date (newest first) and limit results
     all_emails.sort(key=lambda x: x.get("date") or "", reverse=True)
     return all_emails[:max_results]
@@ -2,16 +2,31 @@
 HubSpot API client for deal, contact, and task operations.
 """
 
+import asyncio
 import os
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
 
-import requests
+from outbound import OutboundClient
+from partitioned_search import search_all
 
 
 HUBSPOT_TOKEN = os.environ.get("HUBSPOT_ACCESS_TOKEN", "")
 BASE_URL = "https://api.hubapi.com"
 
+# Timeouts, request deadline and circuit breaker for HubSpot calls
+hubspot = OutboundClient("hubspot")
+
+# Max inputs per HubSpot batch request
+BATCH_SIZE = 100
+
+# Most tasks get_hubspot_tasks reads (5 search pages)
+TASKS_LIMIT = int(os.environ.get("HUBSPOT_TASKS_LIMIT", "500"))
+
+# HubSpot-defined association type IDs
+DEAL_TO_COMPANY = 341
+TASK_TO_DEAL = 216
+
 # Owner ID mapping
 OWNERS = {
     "159215803": "Ben Kusin",
@@ -33,8 +48,6 @@ def get_active_deals() -> List[Dict[str, Any]]:
     Get all active deals (not closed won/lost).
     Returns simplified deal objects with key fields.
     """
-    url = f"{BASE_URL}/crm/v3/objects/deals/search"
-
     # Search for deals not in closed stages
     payload = {
         "filterGroups": [
@@ -58,16 +71,13 @@ def get_active_deals() -> List[Dict[str, Any]]:
             "pipeline",
             "closedate",
         ],
-        "limit": 100,
     }
 
-    response = requests.post(url, headers=_headers(), json=payload)
-
-    if response.status_code != 200:
-        raise Exception(f"HubSpot API error: {response.text}")
+    # Every active deal, not just the first page (the deal index is built on these)
+    results = search_all("deals", payload["filterGroups"], payload["properties"], _headers(), post=hubspot.post)
 
     deals = []
-    for deal in response.json().get("results", []):
+    for deal in results:
         props = deal.get("properties", {})
         owner_id = props.get("hubspot_owner_id", "")
 
@@ -95,7 +105,7 @@ def get_deal_contacts(deal_id: str) -> List[Dict[str, Any]]:
     """
     url = f"{BASE_URL}/crm/v4/objects/deals/{deal_id}/associations/contacts"
 
-    response = requests.get(url, headers=_headers())
+    response = hubspot.get(url, headers=_headers())
 
     if response.status_code != 200:
         return []
@@ -113,7 +123,7 @@ def get_deal_contacts(deal_id: str) -> List[Dict[str, Any]]:
         contact_url = f"{BASE_URL}/crm/v3/objects/contacts/{contact_id}"
         params = {"properties": "email,firstname,lastname,company,jobtitle"}
 
-        contact_response = requests.get(contact_url, headers=_headers(), params=params)
+        contact_response = hubspot.get(contact_url, headers=_headers(), params=params)
 
         if contact_response.status_code == 200:
             props = contact_response.json().get("properties", {})
@@ -135,8 +145,6 @@ def get_hubspot_tasks(include_completed: bool = False) -> Dict[str, List[Dict]]:
     """
     Get tasks organized by status: due_today, overdue, upcoming.
     """
-    url = f"{BASE_URL}/crm/v3/objects/tasks/search"
-
     today = datetime.now().date()
     today_start = datetime.combine(today, datetime.min.time())
     today_end = datetime.combine(today, datetime.max.time())
@@ -162,17 +170,15 @@ def get_hubspot_tasks(include_completed: bool = False) -> Dict[str, List[Dict]]:
             "hubspot_owner_id",
             "hs_task_body",
         ],
-        "limit": 100,
     }
 
-    response = requests.post(url, headers=_headers(), json=payload)
-
-    if response.status_code != 200:
-        raise Exception(f"HubSpot API error: {response.text}")
+    # At most TASKS_LIMIT tasks, so the agent's tool call stays a few requests
+    tasks = search_all("tasks", payload["filterGroups"], payload["properties"], _headers(),
+                       post=hubspot.post, limit=TASKS_LIMIT)
 
     result = {"due_today": [], "overdue": [], "upcoming": []}
 
-    for task in response.json().get("results", []):
+    for task in tasks:
         props = task.get("properties", {})
         due_timestamp = props.get("hs_timestamp")
 
@@ -217,7 +223,7 @@ def update_deal_field(deal_id: str, field_name: str, value: str) -> Dict[str, An
 
     payload = {"properties": {field_name: value}}
 
-    response = requests.patch(url, headers=_headers(), json=payload)
+    response = hubspot.patch(url, headers=_headers(), json=payload)
 
     if response.status_code != 200:
         raise Exception(f"Failed to update deal: {response.text}")
@@ -239,7 +245,7 @@ def create_hubspot_note(deal_id: str, note_body: str) -> Dict[str, Any]:
         }
     }
 
-    response = requests.post(url, headers=_headers(), json=payload)
+    response = hubspot.post(url, headers=_headers(), json=payload)
 
     if response.status_code != 201:
         raise Exception(f"Failed to create note: {response.text}")
@@ -251,11 +257,66 @@ def create_hubspot_note(deal_id: str, note_body: str) -> Dict[str, Any]:
 
     assoc_payload = [{"associationCategory": "HUBSPOT_DEFINED", "associationTypeId": 214}]
 
-    assoc_response = requests.put(assoc_url, headers=_headers(), json=assoc_payload)
+    assoc_response = hubspot.put(assoc_url, headers=_headers(), json=assoc_payload)
 
     return {"success": True, "note_id": note_id, "deal_id": deal_id}
 
 
+def batch_read_objects(
+    object_type: str, object_ids: List[str], properties: List[str]
+) -> List[Dict[str, Any]]:
+    """
+    Read many CRM objects by ID, 100 per request.
+    """
+    url = f"{BASE_URL}/crm/v3/objects/{object_type}/batch/read"
+
+    results = []
+    for i in range(0, len(object_ids), BATCH_SIZE):
+        chunk = object_ids[i:i + BATCH_SIZE]
+        payload = {
+            "properties": properties,
+            "inputs": [{"id": str(object_id)} for object_id in chunk],
+        }
+
+        response = hubspot.post(url, headers=_headers(), json=payload)
+
+        # 207 = partial success (some IDs not found)
+        if response.status_code not in [200, 207]:
+            raise Exception(f"HubSpot API error: {response.text}")
+
+        results.extend(response.json().get("results", []))
+
+    return results
+
+
+def batch_get_associations(
+    from_type: str, to_type: str, object_ids: List[str]
+) -> Dict[str, List[str]]:
+    """
+    Get associated object IDs for many objects at once.
+    Returns {from_id: [to_id, ...]}.
+    """
+    url = f"{BASE_URL}/crm/v4/associations/{from_type}/{to_type}/batch/read"
+
+    associations = {str(object_id): [] for object_id in object_ids}
+    for i in range(0, len(object_ids), BATCH_SIZE):
+        chunk = object_ids[i:i + BATCH_SIZE]
+        payload = {"inputs": [{"id": str(object_id)} for object_id in chunk]}
+
+        response = hubspot.post(url, headers=_headers(), json=payload)
+
+        if response.status_code not in [200, 207]:
+            raise Exception(f"HubSpot API error: {response.text}")
+
+        for result in response.json().get("results", []):
+            from_id = str(result.get("from", {}).get("id"))
+            associations.setdefault(from_id, []).extend(
+                str(to.get("toObjectId")) for to in result.get("to", [])
+            )
+
+    return associations
+
+
 class HubSpotClient:
     """HubSpot API client class for re-engagement operations."""
 
@@ -276,7 +337,7 @@ class HubSpotClient:
             "properties": "dealname,amount,dealstage,hubspot_owner_id,pipeline,loss_reason"
         }
 
-        response = requests.get(url, headers=self._headers(), params=params)
+        response = hubspot.get(url, headers=self._headers(), params=params)
         if response.status_code != 200:
             return None
         return response.json()
@@ -286,7 +347,7 @@ class HubSpotClient:
         url = f"{self.base_url}/crm/v3/objects/companies/{company_id}"
         params = {"properties": "name,domain,industry"}
 
-        response = requests.get(url, headers=self._headers(), params=params)
+        response = hubspot.get(url, headers=self._headers(), params=params)
         if response.status_code != 200:
             return None
         return response.json()
@@ -295,7 +356,7 @@ class HubSpotClient:
         """Get associations for a deal."""
         url = f"{self.base_url}/crm/v4/objects/deals/{deal_id}/associations/{to_object_type}"
 
-        response = requests.get(url, headers=self._headers())
+        response = hubspot.get(url, headers=self._headers())
         if response.status_code != 200:
             return []
 
@@ -304,13 +365,30 @@ class HubSpotClient:
             for assoc in response.json().get("results", [])
         ]
 
-    def create_deal(self, properties: Dict[str, Any]) -> Dict[str, Any]:
-        """Create a new deal."""
+    def _inline_association(self, to_id: str, association_type_id: int) -> Dict[str, Any]:
+        """Association spec for creating an object already associated to another."""
+        return {
+            "to": {"id": str(to_id)},
+            "types": [
+                {"associationCategory": "HUBSPOT_DEFINED", "associationTypeId": association_type_id}
+            ],
+        }
+
+    def create_deal(
+        self,
+        properties: Dict[str, Any],
+        associated_company_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Create a new deal, optionally associated with a company in the same call."""
         url = f"{self.base_url}/crm/v3/objects/deals"
 
         payload = {"properties": properties}
+        if associated_company_id:
+            payload["associations"] = [
+                self._inline_association(associated_company_id, DEAL_TO_COMPANY)
+            ]
 
-        response = requests.post(url, headers=self._headers(), json=payload)
+        response = hubspot.post(url, headers=self._headers(), json=payload)
         if response.status_code not in [200, 201]:
             raise Exception(f"Failed to create deal: {response.text}")
 
@@ -327,9 +405,9 @@ class HubSpotClient:
         url = f"{self.base_url}/crm/v4/objects/{from_type}/{from_id}/associations/{to_type}/{to_id}"
 
         # Association type for deal to company
-        payload = [{"associationCategory": "HUBSPOT_DEFINED", "associationTypeId": 342}]
+        payload = [{"associationCategory": "HUBSPOT_DEFINED", "associationTypeId": DEAL_TO_COMPANY}]
 
-        response = requests.put(url, headers=self._headers(), json=payload)
+        response = hubspot.put(url, headers=self._headers(), json=payload)
         return response.status_code in [200, 201]
 
     def create_task(
@@ -337,7 +415,7 @@ class HubSpotClient:
         properties: Dict[str, Any],
         associated_deal_id: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Create a task and optionally associate with a deal."""
+        """Create a task, optionally associated with a deal in the same call."""
         url = f"{self.base_url}/crm/v3/objects/tasks"
 
         # Add timestamp if not provided
@@ -345,18 +423,72 @@ class HubSpotClient:
             properties["hs_timestamp"] = datetime.now().isoformat()
 
         payload = {"properties": properties}
+        if associated_deal_id:
+            payload["associations"] = [
+                self._inline_association(associated_deal_id, TASK_TO_DEAL)
+            ]
 
-        response = requests.post(url, headers=self._headers(), json=payload)
+        response = hubspot.post(url, headers=self._headers(), json=payload)
         if response.status_code not in [200, 201]:
             raise Exception(f"Failed to create task: {response.text}")
 
-        task = response.json()
-        task_id = task.get("id")
+        return response.json()
+
+
+class AsyncHubSpotClient:
+    """
+    Async variant of HubSpotClient for the workflow webhooks.
+
+    Each call runs HubSpotClient in a worker thread, so calls that don't
+    depend on each other can be awaited together with asyncio.gather.
+    """
+
+    def __init__(self):
+        self._client = HubSpotClient()
+
+    async def get_deal(self, deal_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._client.get_deal, deal_id)
+
+    async def get_company(self, company_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._client.get_company, company_id)
+
+    async def get_deal_associations(self, deal_id: str, to_object_type: str) -> List[Dict]:
+        return await asyncio.to_thread(
+            self._client.get_deal_associations, deal_id, to_object_type
+        )
+
+    async def get_deal_with_companies(self, deal_id: str):
+        """Fetch a deal and its associated companies concurrently."""
+        return await asyncio.gather(
+            self.get_deal(deal_id),
+            self.get_deal_associations(deal_id, "companies"),
+        )
+
+    async def create_deal(
+        self,
+        properties: Dict[str, Any],
+        associated_company_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        return await asyncio.to_thread(
+            self._client.create_deal, properties, associated_company_id
+        )
 
-        # Associate with deal if provided
-        if associated_deal_id and task_id:
-            assoc_url = f"{self.base_url}/crm/v4/objects/tasks/{task_id}/associations/deals/{associated_deal_id}"
-            assoc_payload = [{"associationCategory": "HUBSPOT_DEFINED", "associationTypeId": 216}]
-            requests.put(assoc_url, headers=self._headers(), json=assoc_payload)
+    async def create_association(
+        self,
+        from_id: str,
+        from_type: str,
+        to_id: str,
+        to_type: str
+    ) -> bool:
+        return await asyncio.to_thread(
+            self._client.create_association, from_id, from_type, to_id, to_type
+        )
 
-        return task
+    async def create_task(
+        self,
+        properties: Dict[str, Any],
+        associated_deal_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        return await asyncio.to_thread(
+            self._client.create_task, properties, associated_deal_id
+        )
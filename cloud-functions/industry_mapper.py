@@ -0,0 +1,126 @@
+"""
+Apollo industry → HubSpot industry category.
+
+Keywords are matched against whole tokens of the Apollo industry string
+(split on anything that isn't a letter or digit), so "ai" no longer matches
+inside "retail" and "pr" no longer matches inside "professional". A keyword
+ending in "*" matches any token starting with it ("tech*" → "technology");
+multi-word keywords match consecutive tokens ("real estate").
+
+All keywords are compiled into one character trie. Mapping a string walks
+the trie once from each token start, so it's linear in the string length.
+Results are memoized per distinct industry string.
+
+Used by enrich_contact (deploy.sh copies this module into it) and
+enrich-contacts.py.
+"""
+
+import os
+import re
+from functools import lru_cache
+from typing import Iterable, List, Optional
+
+# Categories in priority order: when keywords from several categories
+# match, the first category wins
+CATEGORY_KEYWORDS = [
+    ("Technology", ["tech*", "software", "saas", "ai", "artificial intelligence", "data*"]),
+    ("Retail", ["retail*", "ecommerce", "commerce*"]),
+    ("CPG", ["consumer*", "cpg", "food*", "beverage*", "cosmetic*", "beauty"]),
+    ("Entertainment", ["entertainment", "media", "film*", "tv", "studio*"]),
+    ("Music", ["music*", "record*", "audio*"]),
+    ("Financial Services", ["financ*", "investment*", "bank*", "capital", "fund*"]),
+    ("Marketing", ["market*", "advertis*", "agency", "agencies", "pr", "public relations"]),
+    ("Healthcare", ["health*", "medical", "pharma*", "hospital*"]),
+    ("Fashion", ["fashion", "apparel", "clothing"]),
+    ("Real Estate", ["real estate", "propert*"]),
+]
+
+# Category when nothing matches
+DEFAULT_CATEGORY = "Technology"
+
+INDUSTRY_CACHE_SIZE = int(os.environ.get("INDUSTRY_CACHE_SIZE", "4096"))
+
+_NON_TOKEN = re.compile(r"[^a-z0-9]+")
+
+# Trie node keys: characters, plus these markers holding a category priority
+_EXACT = "$"  # keyword ends here and must end on a token boundary
+_PREFIX = "*"  # keyword ends here; the rest of the token doesn't matter
+
+
+def _build_trie():
+    root = {}
+    for priority, (_, keywords) in enumerate(CATEGORY_KEYWORDS):
+        for keyword in keywords:
+            is_prefix = keyword.endswith("*")
+            node = root
+            for char in normalize_industry(keyword.rstrip("*")):
+                node = node.setdefault(char, {})
+            marker = _PREFIX if is_prefix else _EXACT
+            # Keep the highest-priority category if two categories share a keyword
+            node[marker] = min(node.get(marker, priority), priority)
+    return root
+
+
+def normalize_industry(industry: str) -> str:
+    """Lowercase, with tokens separated by single spaces ("E-Commerce" → "e commerce")."""
+    return " ".join(_NON_TOKEN.split(industry.lower())).strip()
+
+
+_TRIE = _build_trie()
+
+
+def _best_priority(text: str) -> Optional[int]:
+    """Highest-priority (lowest index) category with a keyword in `text`, or None."""
+    best = None
+    length = len(text)
+
+    for start in range(length):
+        if start > 0 and text[start - 1] != " ":
+            continue  # keywords only start at token starts
+
+        node = _TRIE
+        position = start
+        while position < length and text[position] in node:
+            node = node[text[position]]
+            position += 1
+
+            at_boundary = position == length or text[position] == " "
+            for marker in (_PREFIX, _EXACT):
+                if marker not in node or (marker == _EXACT and not at_boundary):
+                    continue
+                if best is None or node[marker] < best:
+                    best = node[marker]
+
+        if best == 0:
+            break
+
+    return best
+
+
+@lru_cache(maxsize=INDUSTRY_CACHE_SIZE)
+def _map_normalized(normalized: str) -> str:
+    priority = _best_priority(normalized)
+    return DEFAULT_CATEGORY if priority is None else CATEGORY_KEYWORDS[priority][0]
+
+
+def map_industry(apollo_industry: Optional[str]) -> Optional[str]:
+    """HubSpot industry category for an Apollo industry (None if there isn't one)."""
+    if not apollo_industry:
+        return None
+    return _map_normalized(normalize_industry(apollo_industry))
+
+
+def map_industries(apollo_industries: Iterable[Optional[str]]) -> List[Optional[str]]:
+    """Map a list of Apollo industries, in order. Each distinct string is mapped once."""
+    by_industry = {}
+    results = []
+    for industry in apollo_industries:
+        if industry not in by_industry:
+            by_industry[industry] = map_industry(industry)
+        results.append(by_industry[industry])
+    return results
+
+
+def cache_info():
+    """LRU hit/miss counts."""
+    return _map_normalized.cache_info()
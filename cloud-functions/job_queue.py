@@ -0,0 +1,306 @@
+"""
+Durable job queue for respond-fast webhook handling.
+
+With RESPOND_FAST=true the HubSpot workflow webhooks (create_reengagement_deal,
+create_followup_task, enrich_contact) validate the request, enqueue a job and
+return 202; the process_jobs worker in main.py does the work later.
+
+Backends (JOB_QUEUE_BACKEND):
+- "sqlite" (default): a SQLite file at JOB_QUEUE_PATH. Jobs are claimed in
+  batches with a lease, retried with backoff on failure and marked dead
+  after MAX_ATTEMPTS. Used locally and in tests; the webhook and the worker
+  must share the file, so it only works on a single machine.
+- "cloud_tasks": each enqueue creates a Cloud Task that POSTs the jobs to
+  the worker (JOB_WORKER_URL). The worker re-enqueues only the jobs that
+  failed, with the same backoff and MAX_ATTEMPTS as SQLite, so jobs that
+  succeeded aren't run again. Tasks carry an OIDC token for
+  CLOUD_TASKS_SERVICE_ACCOUNT, the only account allowed to invoke the
+  worker. deploy.sh deploys with this backend.
+
+On Cloud Functions every instance has its own /tmp, so a SQLite queue there
+is never seen by the worker: require_durable_queue() fails at startup
+instead.
+
+enrich_contact deploys from its own directory, so deploy.sh copies this
+module into it.
+"""
+
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from outbound import OutboundClient
+
+JOB_QUEUE_BACKEND = os.environ.get("JOB_QUEUE_BACKEND", "sqlite")
+JOB_QUEUE_PATH = os.environ.get("JOB_QUEUE_PATH", "/tmp/kartel-jobs.sqlite3")
+
+# Retry policy for the SQLite backend
+MAX_ATTEMPTS = 5
+LEASE_SECONDS = 300
+RETRY_BACKOFF_SECONDS = 30
+
+# Cloud Tasks settings
+CLOUD_TASKS_PROJECT = os.environ.get("CLOUD_TASKS_PROJECT", "kartel-crm-automation")
+CLOUD_TASKS_LOCATION = os.environ.get("CLOUD_TASKS_LOCATION", "us-west1")
+CLOUD_TASKS_QUEUE = os.environ.get("CLOUD_TASKS_QUEUE", "crm-jobs")
+JOB_WORKER_URL = os.environ.get("JOB_WORKER_URL")
+# Service account the tasks authenticate to the worker as (needs its invoker role)
+CLOUD_TASKS_SERVICE_ACCOUNT = os.environ.get("CLOUD_TASKS_SERVICE_ACCOUNT")
+METADATA_TOKEN_URL = "http://metadata.google.internal/computeMetadata/v1/instance/service-accounts/default/token"
+
+# Set by the Cloud Functions (gen2) / Cloud Run runtime
+ON_GCP = bool(os.environ.get("K_SERVICE"))
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds to wait before retrying a job that has failed `attempts` times"""
+    return RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1)
+
+
+def require_durable_queue(feature: str):
+    """
+    Raise if `feature` would queue jobs to this instance's SQLite file on
+    Cloud Functions, where no worker can see them.
+    """
+    if not ON_GCP:
+        return
+    if JOB_QUEUE_BACKEND != "cloud_tasks" or not JOB_WORKER_URL or not CLOUD_TASKS_SERVICE_ACCOUNT:
+        raise RuntimeError(
+            f"{feature} on Cloud Functions needs JOB_QUEUE_BACKEND=cloud_tasks, JOB_WORKER_URL and "
+            f"CLOUD_TASKS_SERVICE_ACCOUNT (got JOB_QUEUE_BACKEND={JOB_QUEUE_BACKEND!r}); "
+            f"/tmp is per instance, see deploy.sh"
+        )
+
+
+class SQLiteJobQueue:
+    """Job queue in a SQLite file, safe to share between processes"""
+
+    def __init__(self, path: str = JOB_QUEUE_PATH, max_attempts: int = MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    available_at REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_error TEXT
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at)")
+
+    @contextmanager
+    def _connect(self):
+        # isolation_level=None: transactions are opened explicitly with BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, kind: str, payload: Dict[str, Any]) -> str:
+        """Add one job. Returns its ID."""
+        return self.enqueue_many(kind, [payload])[0]
+
+    def enqueue_many(self, kind: str, payloads: List[Dict[str, Any]]) -> List[str]:
+        """Add several jobs of one kind in a single transaction. Returns their IDs."""
+        now = time.time()
+        ids = []
+        with self._lock, self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for payload in payloads:
+                cursor = conn.execute(
+                    "INSERT INTO jobs (kind, payload, available_at, created_at) VALUES (?, ?, ?, ?)",
+                    (kind, json.dumps(payload), now, now),
+                )
+                ids.append(str(cursor.lastrowid))
+            conn.execute("COMMIT")
+        return ids
+
+    def claim(self, limit: int, lease_seconds: float = LEASE_SECONDS) -> List[Dict[str, Any]]:
+        """
+        Claim up to `limit` ready jobs, oldest first. Claimed jobs are leased:
+        if they're neither completed nor failed within `lease_seconds` (worker
+        crashed or timed out), they become ready again.
+        """
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                """
+                SELECT id, kind, payload, attempts FROM jobs
+                WHERE status IN ('queued', 'running') AND available_at <= ?
+                ORDER BY id LIMIT ?
+                """,
+                (now, limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, available_at = ? WHERE id = ?",
+                [(now + lease_seconds, row[0]) for row in rows],
+            )
+            conn.execute("COMMIT")
+
+        return [
+            {"id": str(job_id), "kind": kind, "payload": json.loads(payload), "attempts": attempts + 1}
+            for job_id, kind, payload, attempts in rows
+        ]
+
+    def complete(self, job_ids: List[str]):
+        """Mark jobs done"""
+        with self._lock, self._connect() as conn:
+            conn.executemany("UPDATE jobs SET status = 'done' WHERE id = ?", [(int(i),) for i in job_ids])
+
+    def fail(self, job: Dict[str, Any], error: str):
+        """Retry a claimed job with backoff, or mark it dead after max_attempts"""
+        if job["attempts"] >= self.max_attempts:
+            status, available_at = "dead", time.time()
+            print(f"Job {job['id']} ({job['kind']}) failed {job['attempts']} times, giving up: {error}")
+        else:
+            status = "queued"
+            available_at = time.time() + retry_delay(job["attempts"])
+
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, available_at = ?, last_error = ? WHERE id = ?",
+                (status, available_at, error, int(job["id"])),
+            )
+
+    def requeue(self, jobs: List[Dict[str, Any]]):
+        """
+        Queue failed jobs ({"kind", "payload", "attempts"}) again with backoff,
+        or drop them after max_attempts
+        """
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for job in jobs:
+                attempts = job.get("attempts", 1)
+                if attempts >= self.max_attempts:
+                    print(f"Job {job['kind']} failed {attempts} times, giving up: {job.get('error')}")
+                    continue
+                conn.execute(
+                    "INSERT INTO jobs (kind, payload, attempts, available_at, created_at, last_error) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (job["kind"], json.dumps(job["payload"]), attempts, now + retry_delay(attempts), now,
+                     job.get("error")),
+                )
+            conn.execute("COMMIT")
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs per status"""
+        with self._lock, self._connect() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+
+class CloudTasksJobQueue:
+    """Enqueues jobs as Cloud Tasks that POST {"jobs": [...]} to the worker"""
+
+    def __init__(self, worker_url: Optional[str] = JOB_WORKER_URL, project: str = CLOUD_TASKS_PROJECT,
+                 location: str = CLOUD_TASKS_LOCATION, queue: str = CLOUD_TASKS_QUEUE,
+                 service_account: Optional[str] = CLOUD_TASKS_SERVICE_ACCOUNT):
+        if not worker_url:
+            raise ValueError("JOB_WORKER_URL is required for the cloud_tasks job queue")
+        if not service_account:
+            # The worker only accepts authenticated calls
+            raise ValueError("CLOUD_TASKS_SERVICE_ACCOUNT is required for the cloud_tasks job queue")
+        self.worker_url = worker_url
+        self.service_account = service_account
+        self.tasks_url = (
+            f"https://cloudtasks.googleapis.com/v2/projects/{project}"
+            f"/locations/{location}/queues/{queue}/tasks"
+        )
+        self.client = OutboundClient("cloud_tasks")
+        self._token = None
+        self._token_expires_at = 0
+
+    def _access_token(self) -> str:
+        """Access token for the function's service account, from the metadata server"""
+        if self._token is None or time.time() > self._token_expires_at - 60:
+            response = self.client.get(METADATA_TOKEN_URL, headers={"Metadata-Flavor": "Google"})
+            if response.status_code != 200:
+                raise Exception(f"Failed to get access token: {response.text}")
+            token = response.json()
+            self._token = token["access_token"]
+            self._token_expires_at = time.time() + token["expires_in"]
+        return self._token
+
+    def enqueue(self, kind: str, payload: Dict[str, Any]) -> str:
+        return self.enqueue_many(kind, [payload])[0]
+
+    def enqueue_many(self, kind: str, payloads: List[Dict[str, Any]]) -> List[str]:
+        """One task for all the payloads, so the worker handles them as one batch"""
+        task_name = self._create_task([{"kind": kind, "payload": payload, "attempts": 1} for payload in payloads])
+        return [task_name] * len(payloads)
+
+    def requeue(self, jobs: List[Dict[str, Any]], max_attempts: int = MAX_ATTEMPTS):
+        """
+        Queue failed jobs ({"kind", "payload", "attempts"}) again as one task
+        with backoff, or drop them after max_attempts
+        """
+        retry = []
+        for job in jobs:
+            attempts = job.get("attempts", 1)
+            if attempts >= max_attempts:
+                print(f"Job {job['kind']} failed {attempts} times, giving up: {job.get('error')}")
+            else:
+                retry.append({"kind": job["kind"], "payload": job["payload"], "attempts": attempts + 1})
+        if retry:
+            delay = retry_delay(min(job["attempts"] - 1 for job in retry))
+            self._create_task(retry, delay_seconds=delay)
+
+    def _create_task(self, jobs: List[Dict[str, Any]], delay_seconds: float = 0) -> str:
+        body = {"jobs": jobs}
+        task = {
+            "httpRequest": {
+                "httpMethod": "POST",
+                "url": self.worker_url,
+                "headers": {"Content-Type": "application/json"},
+                "body": base64.b64encode(json.dumps(body).encode("utf-8")).decode("ascii"),
+                # Signed identity token, so only Cloud Tasks can call the worker
+                "oidcToken": {"serviceAccountEmail": self.service_account, "audience": self.worker_url},
+            }
+        }
+        if delay_seconds:
+            schedule_time = datetime.now(timezone.utc) + timedelta(seconds=delay_seconds)
+            task["scheduleTime"] = schedule_time.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+        response = self.client.post(
+            self.tasks_url,
+            headers={"Authorization": f"Bearer {self._access_token()}"},
+            json={"task": task},
+        )
+        if response.status_code != 200:
+            raise Exception(f"Failed to create task: {response.text}")
+
+        return response.json().get("name", "")
+
+
+_queue = None
+
+
+def get_job_queue():
+    """Job queue for this instance, per JOB_QUEUE_BACKEND"""
+    global _queue
+
+    if _queue is None:
+        if JOB_QUEUE_BACKEND == "cloud_tasks":
+            _queue = CloudTasksJobQueue()
+        elif JOB_QUEUE_BACKEND == "sqlite":
+            _queue = SQLiteJobQueue()
+        else:
+            raise ValueError(f"Unknown JOB_QUEUE_BACKEND: {JOB_QUEUE_BACKEND}")
+
+    return _queue
@@ -6,16 +6,33 @@ Two functions:
 2. gmail_sync - Syncs relevant Gmail emails to HubSpot every 15 min
 
 Both use Claude API with tools for intelligent data gathering.
+
+HubSpot workflow webhooks (create_reengagement_deal, create_followup_task)
+can respond fast with RESPOND_FAST=true: the request is validated, a job is
+enqueued (see job_queue.py) and a 202 returned; process_jobs does the work.
+
+Heavy dependencies (anthropic, Google API client, SendGrid) are imported
+inside the functions that use them, so the HubSpot webhook functions don't
+pay for them on cold start. Run bench_imports.py to check import times.
 """
 
+import asyncio
 import functions_framework
 import json
 import os
 from datetime import datetime
 
-import anthropic
+from outbound import TIMEOUTS, call, call_timeout, remaining_time, start_deadline
+
+# Enqueue workflow webhooks and answer 202 instead of doing the work inline
+RESPOND_FAST = os.environ.get("RESPOND_FAST", "false").lower() == "true"
+# Jobs claimed per batch by process_jobs
+WORKER_BATCH_SIZE = int(os.environ.get("WORKER_BATCH_SIZE", "50"))
 
-from tools import TOOLS, execute_tool
+if RESPOND_FAST:
+    # Fail at startup rather than queue jobs no worker will see
+    from job_queue import require_durable_queue
+    require_durable_queue("RESPOND_FAST")
 
 
 def get_secrets():
@@ -33,7 +50,11 @@ def run_claude_agent(prompt: str, max_iterations: int = 20) -> str:
     Run Claude with tools in an agentic loop.
     Claude will use tools to gather data, then generate output.
     """
-    client = anthropic.Anthropic()
+    import anthropic
+
+    from tools import TOOLS, execute_tool
+
+    client = anthropic.Anthropic(timeout=TIMEOUTS["anthropic"][1])
 
     messages = [{"role": "user", "content": prompt}]
 
@@ -43,11 +64,17 @@ def run_claude_agent(prompt: str, max_iterations: int = 20) -> str:
     while iteration < max_iterations:
         iteration += 1
 
-        response = client.messages.create(
+        # Capped by the time left in this invocation
+        _, read_timeout = call_timeout("anthropic")
+
+        response = call(
+            "anthropic",
+            client.messages.create,
             model="claude-sonnet-4-20250514",
             max_tokens=8192,
             tools=TOOLS,
             messages=messages,
+            timeout=read_timeout,
         )
 
         # Check if Claude wants to use tools
@@ -97,6 +124,7 @@ def daily_report(request):
 
     Triggered by Cloud Scheduler at 6am PT daily.
     """
+    start_deadline()
     today = datetime.now().strftime("%B %d, %Y")
 
     prompt = f"""Generate today's daily sales report for Kartel AI.
@@ -111,20 +139,18 @@ Follow these steps IN ORDER:
 1. Call get_active_deals() to get all active deals (not closed won/lost)
 2. Call get_hubspot_tasks() to get tasks (due today, overdue, upcoming 7 days)
 
-### Step 2: Get Contact Emails for Each Deal
-For each active deal, call get_deal_contacts(deal_id) to get associated contact emails.
-Build a list of all unique contact email addresses.
-
-### Step 3: Search Gmail (Smart Filtering)
-Call search_gmail() with ONLY the contact emails from Step 2.
+### Step 2: Search Gmail (Smart Filtering)
+Call search_gmail() without email_addresses - it defaults to the contacts on active deals.
 This ensures we only look at relevant emails, not the entire inbox.
 Look at emails from the last 24 hours.
+Each email has deal_ids telling you which deals it belongs to.
 
-### Step 4: Check Calendar (Smart Filtering)
-Call get_calendar_events() with ONLY the contact emails from Step 2.
+### Step 3: Check Calendar (Smart Filtering)
+Call get_calendar_events() without attendee_emails - it defaults to the contacts on active deals.
 Get events for today and the next 7 days.
+Each event has deal_ids telling you which deals it belongs to.
 
-### Step 5: Generate the Report
+### Step 4: Generate the Report
 Create a report with these sections:
 
 ```
@@ -164,7 +190,7 @@ RECENT ACTIVITY (Last 24h)
 [Summary of important emails - who responded, key updates]
 ```
 
-### Step 6: Send the Report
+### Step 5: Send the Report
 Call send_email() with:
 - to: ["emmet@kartel.ai"]
 - subject: "Daily Sales Report - {today}"
@@ -187,6 +213,7 @@ def gmail_sync(request):
 
     Triggered by Cloud Scheduler every 15 minutes during business hours.
     """
+    start_deadline()
     prompt = """Sync recent Gmail activity to HubSpot deals.
 
 ## Instructions
@@ -194,21 +221,20 @@ def gmail_sync(request):
 ### Step 1: Get Active Deals
 Call get_active_deals() to get all deals not in closed won/lost stages.
 
-### Step 2: Get Contacts for Each Deal
-For each deal, call get_deal_contacts(deal_id) to get associated contact emails.
-
-### Step 3: Search Gmail for These Contacts
-Call search_gmail() with the contact emails from Step 2.
-Look for emails from the last 4 hours (since last sync).
+### Step 2: Search Gmail for Deal Contacts
+Call search_gmail() without email_addresses - it defaults to every contact on an active deal.
+Look for emails from the last 4 hours (since last sync, since_hours=4).
+Each email comes back with deal_ids: the deals its participants belong to.
 
-### Step 4: Extract Updates from Emails
+### Step 3: Extract Updates from Emails
 For each email found, determine:
-- Which deal it relates to (based on sender/recipient matching contacts)
+- Which deal it relates to - use its deal_ids. Skip emails with no deal_ids.
+  If an email has several deal_ids, pick the one the content is about.
 - Any next steps mentioned
 - Any meeting requests or confirmations
 - Any key decisions or updates
 
-### Step 5: Update HubSpot
+### Step 4: Update HubSpot
 For each deal with relevant email activity:
 - Call update_deal_field() to set next_steps if a clear next step was found
 - Call create_hubspot_note() to log a summary of the email activity
@@ -224,6 +250,104 @@ Don't create noise with trivial updates."""
         return {"status": "error", "message": str(e)}, 500
 
 
+async def _reengage_lost_deal(deal_id: str, loss_reason: str):
+    """Create the re-engagement deal and owner task. Returns (body, status)."""
+    from hubspot_client import AsyncHubSpotClient
+
+    hs = AsyncHubSpotClient()
+
+    # Get the original deal and its company together
+    original_deal, companies = await hs.get_deal_with_companies(deal_id)
+    if not original_deal:
+        return {"status": "error", "message": f"Deal {deal_id} not found"}, 404
+
+    deal_name = original_deal.get("properties", {}).get("dealname", "Unknown")
+    owner_id = original_deal.get("properties", {}).get("hubspot_owner_id")
+
+    if not companies:
+        return {"status": "error", "message": "No company associated with deal"}, 400
+
+    company_id = companies[0]["id"]
+    company = await hs.get_company(company_id) or {}
+    company_name = company.get("properties", {}).get("name", "Unknown Company")
+
+    # Create re-engagement deal
+    reason_text = {
+        "budget_timing": "lost 90 days ago due to budget/timing",
+        "competitor": "lost to competitor 6 months ago"
+    }.get(loss_reason, "ready for re-engagement")
+
+    # Associated with company (not contacts) in the create call
+    new_deal = await hs.create_deal({
+        "dealname": f"Re-engage: {company_name}",
+        "pipeline": "1880222400",  # Re-engagement Pipeline
+        "dealstage": "2978916037",  # Opportunity Identified
+        "hubspot_owner_id": owner_id,
+        "description": f"Re-engagement from lost deal: {deal_name}\nReason: {loss_reason}"
+    }, associated_company_id=company_id)
+
+    new_deal_id = new_deal.get("id")
+
+    # Create task for owner (associated with the new deal in the same call)
+    await hs.create_task({
+        "hs_task_subject": f"Re-engage {company_name} - {reason_text}",
+        "hs_task_body": f"Original deal: {deal_name}\nLoss reason: {loss_reason}",
+        "hs_task_status": "NOT_STARTED",
+        "hs_task_priority": "MEDIUM",
+        "hubspot_owner_id": owner_id,
+    }, new_deal_id)
+
+    return {
+        "status": "success",
+        "reengagement_deal_id": new_deal_id,
+        "company_name": company_name
+    }, 200
+
+
+async def _follow_up_no_response(deal_id: str):
+    """Create the final follow-up task on a deal. Returns (body, status)."""
+    from hubspot_client import AsyncHubSpotClient
+
+    hs = AsyncHubSpotClient()
+
+    # Get the original deal and its company together
+    original_deal, companies = await hs.get_deal_with_companies(deal_id)
+    if not original_deal:
+        return {"status": "error", "message": f"Deal {deal_id} not found"}, 404
+
+    deal_name = original_deal.get("properties", {}).get("dealname", "Unknown")
+    owner_id = original_deal.get("properties", {}).get("hubspot_owner_id")
+
+    # Get associated company name
+    company_name = "Unknown Company"
+    if companies:
+        company = await hs.get_company(companies[0]["id"]) or {}
+        company_name = company.get("properties", {}).get("name", "Unknown Company")
+
+    # Create follow-up task
+    await hs.create_task({
+        "hs_task_subject": f"Final follow-up: {company_name} - no response, one more try",
+        "hs_task_body": f"Original deal: {deal_name}\n\nThis contact went dark. One final attempt before moving on.",
+        "hs_task_status": "NOT_STARTED",
+        "hs_task_priority": "LOW",
+        "hubspot_owner_id": owner_id,
+    }, deal_id)
+
+    return {
+        "status": "success",
+        "company_name": company_name
+    }, 200
+
+
+def _enqueue_job(kind: str, payload: dict):
+    """Enqueue a job for process_jobs and build the 202 response."""
+    from job_queue import get_job_queue
+
+    job_id = get_job_queue().enqueue(kind, payload)
+    print(f"Queued {kind} job {job_id}")
+    return {"status": "accepted", "job_id": job_id}, 202
+
+
 @functions_framework.http
 def create_reengagement_deal(request):
     """
@@ -240,7 +364,7 @@ def create_reengagement_deal(request):
         "loss_reason": "budget_timing"  // or "competitor"
     }
     """
-    from hubspot_client import HubSpotClient
+    start_deadline()
 
     try:
         # Parse request
@@ -251,58 +375,10 @@ def create_reengagement_deal(request):
         if not deal_id:
             return {"status": "error", "message": "dealId is required"}, 400
 
-        hs = HubSpotClient()
-
-        # Get the original deal
-        original_deal = hs.get_deal(deal_id)
-        if not original_deal:
-            return {"status": "error", "message": f"Deal {deal_id} not found"}, 404
+        if RESPOND_FAST:
+            return _enqueue_job("reengagement_deal", {"deal_id": str(deal_id), "loss_reason": loss_reason})
 
-        deal_name = original_deal.get("properties", {}).get("dealname", "Unknown")
-        owner_id = original_deal.get("properties", {}).get("hubspot_owner_id")
-
-        # Get associated company
-        companies = hs.get_deal_associations(deal_id, "companies")
-        if not companies:
-            return {"status": "error", "message": "No company associated with deal"}, 400
-
-        company_id = companies[0]["id"]
-        company = hs.get_company(company_id)
-        company_name = company.get("properties", {}).get("name", "Unknown Company")
-
-        # Create re-engagement deal
-        reason_text = {
-            "budget_timing": "lost 90 days ago due to budget/timing",
-            "competitor": "lost to competitor 6 months ago"
-        }.get(loss_reason, "ready for re-engagement")
-
-        new_deal = hs.create_deal({
-            "dealname": f"Re-engage: {company_name}",
-            "pipeline": "1880222400",  # Re-engagement Pipeline
-            "dealstage": "2978916037",  # Opportunity Identified
-            "hubspot_owner_id": owner_id,
-            "description": f"Re-engagement from lost deal: {deal_name}\nReason: {loss_reason}"
-        })
-
-        new_deal_id = new_deal.get("id")
-
-        # Associate with company (not contacts)
-        hs.create_association(new_deal_id, "deals", company_id, "companies")
-
-        # Create task for owner
-        hs.create_task({
-            "hs_task_subject": f"Re-engage {company_name} - {reason_text}",
-            "hs_task_body": f"Original deal: {deal_name}\nLoss reason: {loss_reason}",
-            "hs_task_status": "NOT_STARTED",
-            "hs_task_priority": "MEDIUM",
-            "hubspot_owner_id": owner_id,
-        }, new_deal_id)
-
-        return {
-            "status": "success",
-            "reengagement_deal_id": new_deal_id,
-            "company_name": company_name
-        }, 200
+        return asyncio.run(_reengage_lost_deal(deal_id, loss_reason))
 
     except Exception as e:
         print(f"Error creating re-engagement deal: {e}")
@@ -324,7 +400,7 @@ def create_followup_task(request):
         "dealId": "123456"
     }
     """
-    from hubspot_client import HubSpotClient
+    start_deadline()
 
     try:
         request_json = request.get_json(silent=True) or {}
@@ -333,42 +409,177 @@ def create_followup_task(request):
         if not deal_id:
             return {"status": "error", "message": "dealId is required"}, 400
 
-        hs = HubSpotClient()
-
-        # Get the original deal
-        original_deal = hs.get_deal(deal_id)
-        if not original_deal:
-            return {"status": "error", "message": f"Deal {deal_id} not found"}, 404
-
-        deal_name = original_deal.get("properties", {}).get("dealname", "Unknown")
-        owner_id = original_deal.get("properties", {}).get("hubspot_owner_id")
-
-        # Get associated company name
-        companies = hs.get_deal_associations(deal_id, "companies")
-        company_name = "Unknown Company"
-        if companies:
-            company = hs.get_company(companies[0]["id"])
-            company_name = company.get("properties", {}).get("name", "Unknown Company")
-
-        # Create follow-up task
-        hs.create_task({
-            "hs_task_subject": f"Final follow-up: {company_name} - no response, one more try",
-            "hs_task_body": f"Original deal: {deal_name}\n\nThis contact went dark. One final attempt before moving on.",
-            "hs_task_status": "NOT_STARTED",
-            "hs_task_priority": "LOW",
-            "hubspot_owner_id": owner_id,
-        }, deal_id)
-
-        return {
-            "status": "success",
-            "company_name": company_name
-        }, 200
+        if RESPOND_FAST:
+            return _enqueue_job("followup_task", {"deal_id": str(deal_id)})
+
+        return asyncio.run(_follow_up_no_response(deal_id))
 
     except Exception as e:
         print(f"Error creating follow-up task: {e}")
         return {"status": "error", "message": str(e)}, 500
 
 
+async def _run_deal_jobs(coroutines):
+    """Run workflow jobs concurrently. Returns one (body, status) or exception per job."""
+    return await asyncio.gather(*coroutines, return_exceptions=True)
+
+
+def _workflow_results(results):
+    """Job outcome per (body, status) result: 5xx and exceptions are retried, 4xx are not."""
+    outcomes = []
+    for result in results:
+        if isinstance(result, Exception):
+            outcomes.append(result)
+        else:
+            body, status = result
+            outcomes.append(Exception(body.get("message")) if status >= 500 else body)
+    return outcomes
+
+
+def run_reengagement_jobs(payloads):
+    return _workflow_results(asyncio.run(_run_deal_jobs(
+        [_reengage_lost_deal(p["deal_id"], p.get("loss_reason")) for p in payloads]
+    )))
+
+
+def run_followup_jobs(payloads):
+    return _workflow_results(asyncio.run(_run_deal_jobs(
+        [_follow_up_no_response(p["deal_id"]) for p in payloads]
+    )))
+
+
+def run_enrich_jobs(payloads):
+    """Enrich a batch of {"lead_id"} / {"contact_id"} events with enrich_contact's batch path."""
+    import importlib.util
+    import sys
+
+    enrich_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "enrich_contact")
+    if "enrich_contact_main" not in sys.modules:
+        # enrich_contact/main.py imports its sibling modules by name
+        sys.path.append(enrich_dir)
+        spec = importlib.util.spec_from_file_location("enrich_contact_main", os.path.join(enrich_dir, "main.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["enrich_contact_main"] = module
+        spec.loader.exec_module(module)
+
+    # Missing contacts/leads come back as unsuccessful results and are completed;
+    # retryable ones (HubSpot 429/5xx) are retried like a workflow's 5xx. A failed
+    # read raises, so run_jobs retries the whole batch.
+    results = sys.modules["enrich_contact_main"].process_events(payloads)
+    return [Exception(result["error"]) if result.get("retryable") else result for result in results]
+
+
+# Job kind -> handler taking a list of payloads, returning a result or exception per payload
+JOB_HANDLERS = {
+    "reengagement_deal": run_reengagement_jobs,
+    "followup_task": run_followup_jobs,
+    "enrich_contact": run_enrich_jobs,
+}
+
+
+def run_jobs(jobs):
+    """
+    Run jobs grouped by kind, one handler call per kind.
+    Returns {job index: result or exception}.
+    """
+    outcomes = {}
+    by_kind = {}
+    for index, job in enumerate(jobs):
+        by_kind.setdefault(job["kind"], []).append(index)
+
+    for kind, indexes in by_kind.items():
+        handler = JOB_HANDLERS.get(kind)
+        if handler is None:
+            for index in indexes:
+                outcomes[index] = Exception(f"Unknown job kind: {kind}")
+            continue
+
+        try:
+            results = handler([jobs[index]["payload"] for index in indexes])
+        except Exception as e:
+            results = [e] * len(indexes)
+
+        for index, result in zip(indexes, results):
+            outcomes[index] = result
+
+    return outcomes
+
+
+@functions_framework.http
+def process_jobs(request):
+    """
+    Worker for jobs enqueued by the respond-fast webhooks.
+
+    - POST {"jobs": [{"kind": ..., "payload": ..., "attempts": ...}, ...]}
+      (from Cloud Tasks): runs those jobs and re-enqueues only the ones that
+      failed (job_queue requeue: backoff, dropped after MAX_ATTEMPTS), then
+      answers 200 so the jobs that succeeded aren't retried with them. A 500
+      only if the re-enqueue itself fails, so Cloud Tasks retries the task.
+    - Anything else (e.g. Cloud Scheduler, or locally): drains the SQLite
+      queue in batches of WORKER_BATCH_SIZE until it's empty or the
+      function is close to its timeout.
+    """
+    start_deadline()
+
+    request_json = (request.get_json(silent=True) if request else None) or {}
+
+    from job_queue import SQLiteJobQueue, get_job_queue
+
+    if "jobs" in request_json:
+        jobs = request_json["jobs"]
+        outcomes = run_jobs(jobs)
+
+        failed = []
+        for index, job in enumerate(jobs):
+            result = outcomes[index]
+            if isinstance(result, Exception):
+                print(f"Job failed: {result}")
+                failed.append({**job, "error": str(result)})
+
+        if failed:
+            try:
+                get_job_queue().requeue(failed)
+            except Exception as e:
+                print(f"Error re-enqueueing failed jobs: {e}")
+                return {"status": "error", "processed": len(jobs) - len(failed), "message": str(e)}, 500
+        return {"status": "success", "processed": len(jobs) - len(failed), "failed": len(failed)}, 200
+
+    queue = get_job_queue()
+    if not isinstance(queue, SQLiteJobQueue):
+        return {"status": "error", "message": "jobs are required"}, 400
+
+    processed = failed = batches = 0
+
+    # Leave room for a batch to finish before the function times out
+    while remaining_time() > 30:
+        jobs = queue.claim(WORKER_BATCH_SIZE)
+        if not jobs:
+            break
+
+        batches += 1
+        print(f"Processing batch of {len(jobs)} jobs")
+        outcomes = run_jobs(jobs)
+
+        done = []
+        for index, job in enumerate(jobs):
+            result = outcomes[index]
+            if isinstance(result, Exception):
+                queue.fail(job, str(result))
+                failed += 1
+            else:
+                done.append(job["id"])
+        queue.complete(done)
+        processed += len(done)
+
+    return {
+        "status": "success",
+        "batches": batches,
+        "processed": processed,
+        "failed": failed,
+        "queue": queue.counts(),
+    }, 200
+
+
 # For local testing
 if __name__ == "__main__":
     from dotenv import load_dotenv
@@ -0,0 +1,210 @@
+"""
+Outbound call policy shared by the HubSpot, Apollo, Google and Anthropic clients.
+
+- Per-dependency timeouts: every HTTP call gets a (connect, read) timeout.
+- Request deadline: each function calls start_deadline() when a request
+  comes in, based on its deployed timeout (FUNCTION_TIMEOUT_SECONDS). Call
+  timeouts are capped by the time left, and calls past the deadline fail
+  fast with DeadlineExceeded instead of running into the platform kill.
+- Circuit breakers: after repeated failures (errors, timeouts, 429/5xx) a
+  dependency's breaker opens and calls fail immediately with CircuitOpenError
+  for a cooldown; then a trial call is let through.
+
+enrich_contact deploys from its own directory, so deploy.sh copies this
+module into it.
+"""
+
+import contextvars
+import os
+import threading
+import time
+from typing import Optional, Tuple
+
+import requests
+
+
+# (connect, read) timeouts in seconds
+TIMEOUTS = {
+    "hubspot": (3.05, 15),
+    "apollo": (3.05, 10),
+    "google": (3.05, 20),
+    "anthropic": (5, 120),
+    "cloud_tasks": (3.05, 10),
+}
+DEFAULT_TIMEOUT = (3.05, 15)
+
+# Deployed function timeout (--timeout in deploy.sh)
+FUNCTION_TIMEOUT_SECONDS = float(os.environ.get("FUNCTION_TIMEOUT_SECONDS", "60"))
+# Time kept back at the end of a request to log and build the response
+DEADLINE_MARGIN_SECONDS = 2
+
+# Circuit breaker settings
+FAILURE_THRESHOLD = 5
+RESET_SECONDS = 30
+
+_deadline = contextvars.ContextVar("outbound_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before the call was made."""
+
+
+class CircuitOpenError(Exception):
+    """A dependency's circuit breaker is open; the call was not made."""
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures, for `reset_seconds`."""
+
+    def __init__(self, name: str, failure_threshold: int = FAILURE_THRESHOLD, reset_seconds: float = RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Whether a call may go out. Half-open lets one trial call through."""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open":
+                # Re-arm the cooldown so only this caller gets the trial call
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    print(f"[outbound] Circuit open for {self.name} after {self.failures} failures")
+                self.opened_at = time.monotonic()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(dependency: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if dependency not in _breakers:
+            _breakers[dependency] = CircuitBreaker(dependency)
+        return _breakers[dependency]
+
+
+def start_deadline(budget_seconds: Optional[float] = None):
+    """Start the time budget for the current request."""
+    budget = FUNCTION_TIMEOUT_SECONDS if budget_seconds is None else budget_seconds
+    _deadline.set(time.monotonic() + budget - DEADLINE_MARGIN_SECONDS)
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds left in the current request's budget, or None if there is no deadline."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def call_timeout(dependency: str) -> Tuple[float, float]:
+    """(connect, read) timeout for a call, capped by the time left."""
+    connect, read = TIMEOUTS.get(dependency, DEFAULT_TIMEOUT)
+    remaining = remaining_time()
+    if remaining is None:
+        return connect, read
+    if remaining <= 0:
+        raise DeadlineExceeded(f"No time left for {dependency} call")
+    return min(connect, remaining), min(read, remaining)
+
+
+def _is_failure_status(status_code: int) -> bool:
+    return status_code == 429 or status_code >= 500
+
+
+def is_transient_error(error: Exception) -> bool:
+    """
+    Whether an exception means the dependency is unhealthy (network errors,
+    timeouts, 429/5xx), as opposed to a bad request or missing permission.
+    """
+    if isinstance(error, (requests.ConnectionError, requests.Timeout, TimeoutError, ConnectionError)):
+        return True
+    # googleapiclient HttpError carries the response as .resp; anthropic errors have .status_code
+    status = getattr(getattr(error, "resp", None), "status", None) or getattr(error, "status_code", None)
+    return status is not None and _is_failure_status(int(status))
+
+
+def call(dependency: str, fn, *args, **kwargs):
+    """
+    Run a non-requests call (e.g. a Google API .execute) under the policy:
+    checks the breaker and the deadline, and records transient failures.
+    """
+    breaker = get_breaker(dependency)
+    if not breaker.allow():
+        raise CircuitOpenError(f"{dependency} circuit is open")
+    call_timeout(dependency)  # raises DeadlineExceeded if out of time
+
+    try:
+        result = fn(*args, **kwargs)
+    except Exception as e:
+        if is_transient_error(e):
+            breaker.record_failure()
+        raise
+
+    breaker.record_success()
+    return result
+
+
+class OutboundClient:
+    """requests-style get/post/put/patch for one dependency, under the policy."""
+
+    def __init__(self, dependency: str):
+        self.dependency = dependency
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        breaker = get_breaker(self.dependency)
+        if not breaker.allow():
+            raise CircuitOpenError(f"{self.dependency} circuit is open")
+
+        kwargs.setdefault("timeout", call_timeout(self.dependency))
+
+        try:
+            response = requests.request(method, url, **kwargs)
+        except requests.RequestException:
+            breaker.record_failure()
+            raise
+
+        if _is_failure_status(response.status_code):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PUT", url, **kwargs)
+
+    def patch(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PATCH", url, **kwargs)
@@ -0,0 +1,252 @@
+"""
+Partitioned CRM search, for queries past the search API's 10,000 result cap.
+
+The search endpoint can't page past 10,000 results per query. PartitionedSearch
+splits a query into disjoint ranges of one property (hs_object_id by
+default, or createdate), each small enough to page through:
+
+1. Probe the whole query (one call, limit 1). At most PARTITION_SIZE
+   results: page through it as usual.
+2. Otherwise read the property's lowest and highest values and split that
+   range into equal-width pieces, about PARTITION_SIZE results each. Probe
+   each piece's total; pieces still too big are split again (ids aren't
+   evenly spread, so sizes adapt to where the records actually are).
+3. Page through every piece concurrently (SEARCH_WORKERS threads) and yield
+   the results as one stream, in partition order.
+
+Each range is ANDed into every filter group of the query, so pieces are
+disjoint and together cover the query. The top piece is open-ended so
+records created while the search runs aren't missed.
+
+All calls share one limiter (SEARCH_REQUESTS_PER_SECOND; HubSpot allows 5
+search requests per second per token) and retry 429s.
+
+With `limit`, the search stops after that many results. Limits within the
+10,000 cap skip partitioning and page through the query one page at a time.
+
+Used by search_deals (dashboard.py, daily-crm-sync.py), get_active_deals,
+get_contacts_to_enrich (enrich-contacts.py) and get_hubspot_tasks (those two
+with a limit).
+"""
+
+import contextvars
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional
+
+import requests
+
+BASE_URL = "https://api.hubapi.com"
+
+# Search API can't page past this many results
+SEARCH_LIMIT = 10000
+PAGE_SIZE = 100
+
+# Results per partition to aim for (at most SEARCH_LIMIT)
+PARTITION_SIZE = min(int(os.environ.get("SEARCH_PARTITION_SIZE", "2500")), SEARCH_LIMIT)
+SEARCH_WORKERS = int(os.environ.get("SEARCH_WORKERS", "4"))
+SEARCH_REQUESTS_PER_SECOND = float(os.environ.get("SEARCH_REQUESTS_PER_SECOND", "4"))
+
+MAX_RETRIES = 5
+
+PARTITION_PROPERTIES = ["hs_object_id", "createdate"]
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart, across threads"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+# Shared by every search in the process
+search_limiter = RateLimiter(SEARCH_REQUESTS_PER_SECOND)
+
+
+def _to_number(prop: str, value: str) -> int:
+    """Partition property value as an integer (createdate in epoch ms)"""
+    if prop == "createdate":
+        return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp() * 1000)
+    return int(value)
+
+
+def with_range(filter_groups: List[Dict], prop: str, low: int, high: Optional[int]) -> List[Dict]:
+    """filter_groups with low <= prop <= high (no upper bound if high is None) ANDed into each group"""
+    if high is None:
+        bound = {"propertyName": prop, "operator": "GTE", "value": str(low)}
+    else:
+        bound = {"propertyName": prop, "operator": "BETWEEN", "value": str(low), "highValue": str(high)}
+    if not filter_groups:
+        return [{"filters": [bound]}]
+    return [{**group, "filters": [*group.get("filters", []), bound]} for group in filter_groups]
+
+
+class PartitionedSearch:
+    """
+    Every result of a CRM search, however many (see module docstring).
+
+    `post` makes the HTTP call: requests.post by default, or an
+    OutboundClient's post in the Cloud Functions. `limit` caps the number of
+    results (None for all of them).
+    """
+
+    def __init__(
+        self,
+        object_type: str,
+        filter_groups: List[Dict],
+        properties: List[str],
+        headers: Dict[str, str],
+        post: Callable = requests.post,
+        partition_property: str = "hs_object_id",
+        partition_size: int = PARTITION_SIZE,
+        workers: int = SEARCH_WORKERS,
+        limiter: RateLimiter = search_limiter,
+        base_url: str = BASE_URL,
+        limit: Optional[int] = None,
+    ):
+        if partition_property not in PARTITION_PROPERTIES:
+            raise Exception(f"Can't partition a search on {partition_property}")
+        self.object_type = object_type
+        self.filter_groups = filter_groups or []
+        self.properties = properties
+        self.headers = headers
+        self.post = post
+        self.prop = partition_property
+        self.partition_size = min(partition_size, SEARCH_LIMIT)
+        self.workers = workers
+        self.limiter = limiter
+        self.url = f"{base_url}/crm/v3/objects/{object_type}/search"
+        self.limit = limit
+        self.maximum = None
+
+    def _search(self, payload: Dict) -> Dict:
+        for attempt in range(MAX_RETRIES):
+            self.limiter.wait()
+            response = self.post(self.url, headers=self.headers, json=payload)
+            if response.status_code == 429:
+                time.sleep(2 ** attempt)
+                continue
+            if response.status_code != 200:
+                raise Exception(f"Error searching {self.object_type}: {response.status_code} {response.text[:200]}")
+            return response.json()
+        raise Exception(f"Error searching {self.object_type}: still rate limited after {MAX_RETRIES} tries")
+
+    def _groups(self, low: Optional[int], high: Optional[int]) -> List[Dict]:
+        if low is None:
+            return self.filter_groups
+        # The top piece stays open for records created mid-search
+        return with_range(self.filter_groups, self.prop, low, None if high >= self.maximum else high)
+
+    def _sorts(self, direction: str = "ASCENDING") -> List[Dict]:
+        return [{"propertyName": self.prop, "direction": direction}]
+
+    def total(self, low: Optional[int] = None, high: Optional[int] = None) -> int:
+        """Number of results in a range (the whole query without one)"""
+        data = self._search({"filterGroups": self._groups(low, high), "properties": [self.prop], "limit": 1})
+        return data.get("total", 0)
+
+    def _bound(self, direction: str) -> Optional[int]:
+        data = self._search({"filterGroups": self.filter_groups, "properties": [self.prop],
+                             "sorts": self._sorts(direction), "limit": 1})
+        results = data.get("results", [])
+        if not results:
+            return None
+        return _to_number(self.prop, results[0].get("properties", {}).get(self.prop) or results[0]["id"])
+
+    def _map(self, pool: ThreadPoolExecutor, fn: Callable, ranges: List) -> List:
+        # Each task gets a copy of the caller's context (e.g. the outbound deadline)
+        futures = [pool.submit(contextvars.copy_context().run, fn, *r) for r in ranges]
+        return [future.result() for future in futures]
+
+    def partitions(self, pool: ThreadPoolExecutor) -> List:
+        """[(low, high)] ranges of at most partition_size results, in order ([(None, None)] = unpartitioned)"""
+        total = self.total()
+        if total <= self.partition_size:
+            return [(None, None)]
+
+        low, high = self._bound("ASCENDING"), self._bound("DESCENDING")
+        if low is None:
+            return [(None, None)]
+        self.maximum = high
+
+        leaves = []
+        pending = [(low, high, total)]
+        while pending:
+            pieces = []
+            for low, high, count in pending:
+                if high == low:
+                    raise Exception(f"{count} {self.object_type} have {self.prop} {low}, "
+                                    f"more than one partition can hold; partition on hs_object_id")
+                n = min(math.ceil(count / self.partition_size), high - low + 1)
+                width = (high - low + 1) / n
+                edges = [low + int(round(i * width)) for i in range(n)] + [high + 1]
+                pieces += [(edges[i], edges[i + 1] - 1) for i in range(n) if edges[i + 1] > edges[i]]
+
+            counts = self._map(pool, self.total, pieces)
+            pending = []
+            for (piece_low, piece_high), count in zip(pieces, counts):
+                if count > self.partition_size:
+                    pending.append((piece_low, piece_high, count))
+                elif count:
+                    leaves.append((piece_low, piece_high))
+        return sorted(leaves)
+
+    def fetch(self, low: Optional[int] = None, high: Optional[int] = None, limit: int = SEARCH_LIMIT) -> List[Dict]:
+        """Every result in one range (up to `limit`), paged in partition property order"""
+        results = []
+        after = None
+        while True:
+            payload = {"filterGroups": self._groups(low, high), "properties": self.properties,
+                       "sorts": self._sorts(), "limit": min(PAGE_SIZE, limit - len(results))}
+            if after:
+                payload["after"] = after
+            data = self._search(payload)
+            results.extend(data.get("results", []))
+
+            after = data.get("paging", {}).get("next", {}).get("after")
+            if not after or len(results) >= min(limit, SEARCH_LIMIT):
+                return results[:limit]
+
+    def __iter__(self) -> Iterator[Dict]:
+        if self.limit is not None and self.limit <= SEARCH_LIMIT:
+            # One query can hold this many: no probes, no partitions
+            yield from self.fetch(limit=self.limit)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            ranges = self.partitions(pool)
+            futures = [pool.submit(contextvars.copy_context().run, self.fetch, *r) for r in ranges]
+            seen = set()
+            try:
+                for future in futures:
+                    for result in future.result():
+                        # A record edited mid-search can't move between ranges, but skip repeats anyway
+                        if result["id"] not in seen:
+                            seen.add(result["id"])
+                            yield result
+                            if self.limit is not None and len(seen) >= self.limit:
+                                return
+            finally:
+                # Ranges not started yet aren't needed any more
+                for future in futures:
+                    future.cancel()
+
+
+def search_all(object_type: str, filter_groups: List[Dict], properties: List[str], headers: Dict[str, str],
+               **options) -> List[Dict]:
+    """Every result of a search (see PartitionedSearch for options)"""
+    return list(PartitionedSearch(object_type, filter_groups, properties, headers, **options))
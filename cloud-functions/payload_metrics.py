@@ -0,0 +1,49 @@
+"""
+Response payload size tracking for Google API calls.
+
+Counts decoded response bytes per API so the effect of field masks can be
+compared (set USE_FIELD_MASKS=false to measure the unmasked baseline).
+"""
+
+import json
+import os
+from typing import Dict, Any
+
+
+# Partial responses are on by default
+USE_FIELD_MASKS = os.environ.get("USE_FIELD_MASKS", "true").lower() == "true"
+
+_stats: Dict[str, Dict[str, int]] = {}
+
+
+def payload_bytes(response: Any) -> int:
+    """Size of a decoded API response, re-encoded as compact JSON."""
+    return len(json.dumps(response, separators=(",", ":")).encode("utf-8"))
+
+
+def record_payload(api: str, response: Any) -> Any:
+    """Add a response to the byte count for `api`. Returns the response unchanged."""
+    stats = _stats.setdefault(api, {"requests": 0, "bytes": 0})
+    stats["requests"] += 1
+    stats["bytes"] += payload_bytes(response)
+    return response
+
+
+def get_payload_stats() -> Dict[str, Dict[str, int]]:
+    """Request and byte counts per API since the last reset."""
+    return {api: dict(stats) for api, stats in _stats.items()}
+
+
+def reset_payload_stats(api: str = None):
+    """Reset the counts for one API, or for all of them."""
+    if api is None:
+        _stats.clear()
+    else:
+        _stats.pop(api, None)
+
+
+def log_payload_stats(api: str):
+    """Print the byte count for one API."""
+    stats = _stats.get(api, {"requests": 0, "bytes": 0})
+    mode = "field masks" if USE_FIELD_MASKS else "full responses"
+    print(f"[{api}] {stats['requests']} requests, {stats['bytes']:,} bytes ({mode})")
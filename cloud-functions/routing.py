@@ -0,0 +1,295 @@
+"""
+Declarative owner and tier routing.
+
+Rules live in routing_rules.json (or ROUTING_RULES_PATH): the owners, the
+features rules can test, and ordered rule sets where the first matching
+rule wins. Features are discretized to a few values each (booleans,
+categories, threshold bands), so each rule set is compiled up front into a
+decision table over every combination of the features it uses. Evaluating
+a contact is one discretization and one dict lookup.
+
+    engine = get_engine()
+    decision = engine.evaluate("lead_owner", {"decision_maker": False, "size_tier": "small"})
+    decision.outcome["owner_id"], decision.explanation
+
+Rule sets:
+- lead_owner: lead owner (enrich_contact, sync_leads_from_contacts.py)
+- lead_tier: lead_tier contact property (enrich_contact, recompute_contact_scores.py)
+- contact_tier: tier and owner for enrich-contacts.py
+
+The spec's "priority" section scores the priority_level contact property
+from decision maker status and HubSpot score.
+
+evaluate_columns / PriorityScore.levels are NumPy versions for whole
+columns of contacts (NumPy is imported only there).
+
+Used by enrich_contact (deploy.sh copies this module and the rules into it),
+sync_leads_from_contacts.py and enrich-contacts.py.
+"""
+
+import itertools
+import json
+import os
+from bisect import bisect_right
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+RULES_PATH = os.environ.get(
+    "ROUTING_RULES_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "routing_rules.json"),
+)
+
+# Value of a feature that's missing (None, empty, 0)
+UNKNOWN = "unknown"
+
+
+class Decision(NamedTuple):
+    rule: str  # name of the rule that matched
+    outcome: Dict[str, Any]  # the rule's "then", plus owner_id/owner_name if it sets an owner
+    explanation: str  # e.g. "large_company (size_tier=large)"
+
+
+class Feature:
+    """Discretizes one input value to a small set of values rules can test"""
+
+    def __init__(self, name: str, spec: Dict[str, Any]):
+        self.name = name
+        self.type = spec["type"]
+
+        if self.type == "bool":
+            self.values = [True, False]
+        elif self.type == "category":
+            self.values = list(spec["values"]) + [UNKNOWN]
+        elif self.type == "bands":
+            # {"band": lower bound}; a value falls in the highest band it reaches
+            bands = sorted(spec["bands"].items(), key=lambda item: item[1])
+            self.band_names = [name for name, _ in bands]
+            self.bounds = [bound for _, bound in bands]
+            self.values = self.band_names + [UNKNOWN]
+        else:
+            raise ValueError(f"Feature {name}: unknown type {self.type}")
+
+    def discretize(self, value: Any) -> Any:
+        if self.type == "bool":
+            return bool(value)
+        if self.type == "category":
+            return value if value in self.values else UNKNOWN
+
+        if not value:
+            return UNKNOWN
+        index = bisect_right(self.bounds, float(value)) - 1
+        return self.band_names[index] if index >= 0 else UNKNOWN
+
+    def codes(self, column):
+        """Vectorized discretize(): index into self.values for each value in a column"""
+        import numpy as np
+
+        if self.type == "bool":
+            # values are [True, False]
+            return (~np.asarray(column, dtype=bool)).astype(np.intp)
+
+        if self.type == "category":
+            column = np.asarray(column, dtype=object)
+            positions = {value: i for i, value in enumerate(self.values)}
+            unknown = len(self.values) - 1
+            return np.array([positions.get(value, unknown) for value in column], dtype=np.intp)
+
+        # Missing values should be NaN
+        column = np.asarray(column, dtype=float)
+        codes = np.searchsorted(self.bounds, column, side="right") - 1
+        codes[~(column > 0) | (codes < 0)] = len(self.band_names)  # UNKNOWN
+        return codes.astype(np.intp)
+
+
+class RuleSet:
+    """Ordered rules compiled into a decision table over the features they use"""
+
+    def __init__(self, name: str, rules: List[Dict[str, Any]], features: Dict[str, Feature], owners: Dict[str, Dict[str, str]]):
+        self.name = name
+        self.rules = rules
+
+        used = sorted({f for rule in rules for f in rule["when"]})
+        unknown = [f for f in used if f not in features]
+        if unknown:
+            raise ValueError(f"{name}: unknown features {unknown}")
+        self.features = [features[f] for f in used]
+
+        for rule in rules:
+            for feature_name, expected in rule["when"].items():
+                allowed = features[feature_name].values
+                for value in (expected if isinstance(expected, list) else [expected]):
+                    if value not in allowed:
+                        raise ValueError(f"{name}/{rule['name']}: {feature_name} can't be {value!r}")
+            owner = rule["then"].get("owner")
+            if owner is not None and owner not in owners:
+                raise ValueError(f"{name}/{rule['name']}: unknown owner {owner!r}")
+
+        self.outcomes = [self._outcome(rule, owners) for rule in rules]
+        self.table = self._compile()
+
+    @staticmethod
+    def _outcome(rule, owners):
+        outcome = dict(rule["then"])
+        if "owner" in outcome:
+            outcome["owner_id"] = owners[outcome["owner"]]["id"]
+            outcome["owner_name"] = owners[outcome["owner"]]["name"]
+        return outcome
+
+    @staticmethod
+    def _matches(rule, key):
+        for feature_name, expected in rule["when"].items():
+            if isinstance(expected, list):
+                if key[feature_name] not in expected:
+                    return False
+            elif key[feature_name] != expected:
+                return False
+        return True
+
+    def _compile(self):
+        """Evaluate the rules once for every combination of feature values"""
+        table = {}
+        names = [feature.name for feature in self.features]
+        for values in itertools.product(*(feature.values for feature in self.features)):
+            key = dict(zip(names, values))
+            for index, rule in enumerate(self.rules):
+                if self._matches(rule, key):
+                    table[values] = index
+                    break
+            else:
+                raise ValueError(f"{self.name}: no rule matches {key}; add a default rule")
+        return table
+
+    def evaluate(self, facts: Dict[str, Any]) -> Decision:
+        values = tuple(feature.discretize(facts.get(feature.name)) for feature in self.features)
+        index = self.table[values]
+        rule = self.rules[index]
+
+        matched = ", ".join(
+            f"{feature.name}={value}"
+            for feature, value in zip(self.features, values)
+            if feature.name in rule["when"]
+        )
+        explanation = f"{rule['name']} ({matched})" if matched else f"{rule['name']} (default)"
+        return Decision(rule["name"], self.outcomes[index], explanation)
+
+    def evaluate_columns(self, columns: Dict[str, Any], length: int):
+        """
+        Vectorized evaluate() over `length` contacts, with one array per
+        feature in `columns`. Returns the matched rule index per contact.
+        """
+        import numpy as np
+
+        dense = np.empty([len(feature.values) for feature in self.features], dtype=np.intp)
+        for values, index in self.table.items():
+            dense[tuple(feature.values.index(value) for feature, value in zip(self.features, values))] = index
+
+        if not self.features:
+            return np.full(length, dense[()], dtype=np.intp)
+
+        codes = tuple(feature.codes(columns[feature.name]) for feature in self.features)
+        return dense[codes]
+
+
+class PriorityScore:
+    """priority_level from decision maker status and HubSpot score (the spec's "priority")"""
+
+    def __init__(self, spec: Dict[str, Any]):
+        self.decision_maker_points = spec["decision_maker_points"]
+        # [[min score, points], ...] and [[min total, level], ...], highest first
+        self.engagement_points = sorted(spec["engagement_points"], reverse=True)
+        self.levels_by_score = sorted(spec["levels"], key=lambda item: item[0], reverse=True)
+        self.default_level = spec["default_level"]
+
+    def score(self, decision_maker: bool, engagement_score: Optional[float]) -> int:
+        score = self.decision_maker_points if decision_maker else 0
+        if engagement_score:
+            for minimum, points in self.engagement_points:
+                if engagement_score >= minimum:
+                    score += points
+                    break
+        return score
+
+    def level(self, decision_maker: bool, engagement_score: Optional[float]) -> str:
+        score = self.score(decision_maker, engagement_score)
+        for minimum, level in self.levels_by_score:
+            if score >= minimum:
+                return level
+        return self.default_level
+
+    def levels(self, decision_makers, engagement_scores):
+        """Vectorized level() over columns (missing engagement scores as NaN)"""
+        import numpy as np
+
+        engagement = np.nan_to_num(np.asarray(engagement_scores, dtype=float), nan=0.0)
+        scores = np.where(np.asarray(decision_makers, dtype=bool), self.decision_maker_points, 0)
+        scores = scores + np.select(
+            [engagement >= minimum for minimum, _ in self.engagement_points],
+            [points for _, points in self.engagement_points],
+            0,
+        )
+        return np.select(
+            [scores >= minimum for minimum, _ in self.levels_by_score],
+            [level for _, level in self.levels_by_score],
+            self.default_level,
+        ).astype(object)
+
+
+class RoutingEngine:
+    """All rule sets from one spec"""
+
+    def __init__(self, spec: Dict[str, Any]):
+        self.owners = spec["owners"]
+        self.features = {name: Feature(name, feature) for name, feature in spec["features"].items()}
+        self.rule_sets = {
+            name: RuleSet(name, rules, self.features, self.owners)
+            for name, rules in spec["rule_sets"].items()
+        }
+        self.priority = PriorityScore(spec["priority"])
+
+    def owner_ids(self) -> Dict[str, str]:
+        """{"ben": "159215803", ...}"""
+        return {key: owner["id"] for key, owner in self.owners.items()}
+
+    def owner_name(self, owner_id: str) -> Optional[str]:
+        for owner in self.owners.values():
+            if owner["id"] == owner_id:
+                return owner["name"]
+        return None
+
+    def evaluate(self, rule_set: str, facts: Dict[str, Any]) -> Decision:
+        """Route one contact. `facts` maps feature names to raw values."""
+        return self.rule_sets[rule_set].evaluate(facts)
+
+    def evaluate_batch(self, rule_set: str, facts_list: Iterable[Dict[str, Any]]) -> List[Decision]:
+        """Route many contacts, in order."""
+        compiled = self.rule_sets[rule_set]
+        return [compiled.evaluate(facts) for facts in facts_list]
+
+    def evaluate_columns(self, rule_set: str, columns: Dict[str, Any], key: str):
+        """
+        Route whole columns of contacts at once. `columns` maps feature names
+        to arrays (missing band values as NaN). Returns a numpy array of the
+        matched rules' outcome[key] (e.g. "tier").
+        """
+        import numpy as np
+
+        compiled = self.rule_sets[rule_set]
+        length = len(next(iter(columns.values()))) if columns else 0
+        indexes = compiled.evaluate_columns(columns, length)
+        outcomes = np.array([outcome.get(key) for outcome in compiled.outcomes], dtype=object)
+        return outcomes[indexes]
+
+
+def load_engine(path: str = RULES_PATH) -> RoutingEngine:
+    with open(path) as f:
+        return RoutingEngine(json.load(f))
+
+
+_engine = None
+
+
+def get_engine() -> RoutingEngine:
+    """Engine for the default rules file, loaded once"""
+    global _engine
+    if _engine is None:
+        _engine = load_engine()
+    return _engine
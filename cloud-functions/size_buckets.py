@@ -0,0 +1,173 @@
+"""
+Company size bucketing shared by enrichment, routing and sync code.
+
+Each bucket set is a boundary table: sorted inclusive upper bounds and one
+more label than bounds (the last label is open-ended). A count is bucketed
+with one bisect; whole columns go through numpy.searchsorted.
+
+Bucket sets:
+- COMPANY_SIZE: form dropdown / lead_company_size values ("51-200")
+- NUMEMPLOYEES: HubSpot's numemployees contact property enum ("100-500")
+- SIZE_TIER: routing tier ("small", "medium", "large")
+
+Range labels from either set can be parsed back to counts (label_range),
+converted to the other set (convert_label) or tiered (size_tier), so form
+values, HubSpot enums and Apollo employee counts all tier the same way.
+
+NumPy is only needed for the vectorized paths (to_counts, size_tiers,
+BucketTable.label_array).
+"""
+
+import re
+from bisect import bisect_left
+from typing import Any, Iterable, List, Optional, Tuple
+
+
+class BucketTable:
+    """Labels for counts, from inclusive upper bounds"""
+
+    def __init__(self, upper_bounds: List[int], labels: List[str]):
+        if len(labels) != len(upper_bounds) + 1:
+            raise ValueError("Need one more label than upper bounds")
+        if upper_bounds != sorted(upper_bounds):
+            raise ValueError("Upper bounds must be sorted")
+        self.upper_bounds = upper_bounds
+        self.labels = labels
+
+    def label(self, value: Any) -> Optional[str]:
+        """Bucket label for a count (int, float or numeric string), or None if missing/invalid."""
+        count = to_count(value)
+        if count is None:
+            return None
+        return self.labels[bisect_left(self.upper_bounds, count)]
+
+    def label_array(self, counts):
+        """Vectorized label(): numpy array of labels (None where the count is missing or <= 0)."""
+        import numpy as np
+
+        counts = np.asarray(counts, dtype=float)
+        labels = np.array(self.labels + [None], dtype=object)
+        index = np.searchsorted(self.upper_bounds, counts, side="left")
+        missing = ~(counts > 0)  # also catches NaN
+        index[missing] = len(self.labels)
+        return labels[index]
+
+
+# Form dropdown and lead_company_size options (create_lead_properties.py)
+COMPANY_SIZE = BucketTable(
+    [10, 50, 200, 500, 1000, 5000],
+    ["1-10", "11-50", "51-200", "201-500", "501-1000", "1001-5000", "5000+"],
+)
+
+# HubSpot numemployees enum
+NUMEMPLOYEES = BucketTable(
+    [5, 25, 50, 100, 500, 1000],
+    ["1-5", "5-25", "25-50", "50-100", "100-500", "500-1000", "1000+"],
+)
+
+# Routing tiers: 1-50 small, 51-499 medium, 500+ large
+SIZE_TIER = BucketTable([50, 499], ["small", "medium", "large"])
+
+_RANGE = re.compile(r"^\s*(\d[\d,]*)\s*(?:(\+)|-\s*(\d[\d,]*))?\s*$")
+
+
+def to_count(value: Any) -> Optional[float]:
+    """Employee count from an int, float or numeric string; None if missing, invalid or <= 0."""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        count = float(str(value).replace(",", "")) if isinstance(value, str) else float(value)
+    except ValueError:
+        return None
+    return count if count > 0 else None
+
+
+def label_range(label: Any) -> Optional[Tuple[int, Optional[int]]]:
+    """
+    (low, high) employee range for a label: "51-200" → (51, 200),
+    "5000+" → (5000, None), "250" → (250, 250). None if it isn't a range.
+    """
+    if label is None:
+        return None
+    match = _RANGE.match(str(label))
+    if not match:
+        return None
+
+    low = int(match.group(1).replace(",", ""))
+    if match.group(2):
+        return low, None
+    if match.group(3):
+        return low, int(match.group(3).replace(",", ""))
+    return low, low
+
+
+def convert_label(label: Any, table: BucketTable) -> Optional[str]:
+    """
+    Convert a range label to `table`'s labels, by the range's lower bound
+    ("51-200" → NUMEMPLOYEES "50-100"). Buckets don't line up exactly,
+    so this is lossy.
+    """
+    bounds = label_range(label)
+    return table.label(bounds[0]) if bounds else None
+
+
+def company_size_label(value: Any) -> Optional[str]:
+    """Form dropdown / lead_company_size label for an employee count"""
+    return COMPANY_SIZE.label(value)
+
+
+def numemployees_label(value: Any) -> Optional[str]:
+    """HubSpot numemployees enum value for an employee count"""
+    return NUMEMPLOYEES.label(value)
+
+
+def size_tier(value: Any) -> Optional[str]:
+    """
+    Routing tier ('large', 'medium', 'small') for an Apollo employee count
+    or a form / HubSpot range label (tiered by its lower bound).
+    None if unknown.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return SIZE_TIER.label(value)
+    bounds = label_range(value)
+    return SIZE_TIER.label(bounds[0]) if bounds else None
+
+
+def to_counts(values: Iterable[Any]):
+    """
+    Employee counts for a column of counts and/or range labels (labels count
+    as their lower bound), as a float numpy array with NaN where unknown.
+    Each distinct value is parsed once.
+    """
+    import numpy as np
+
+    values = list(values)
+    if not values:
+        return np.array([], dtype=float)
+
+    # Parse distinct values to counts, then scatter back over the column
+    keys = [str(v) if v is not None else "" for v in values]
+    unique, inverse = np.unique(np.array(keys, dtype=object), return_inverse=True)
+    first = {}
+    for value, key in zip(values, keys):
+        first.setdefault(key, value)
+
+    counts = np.empty(len(unique), dtype=float)
+    for i, key in enumerate(unique):
+        value = first[key]
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            count = to_count(value)
+        else:
+            bounds = label_range(value)
+            count = bounds[0] if bounds else None
+        counts[i] = count if count else np.nan
+
+    return counts[inverse]
+
+
+def size_tiers(values: Iterable[Any]):
+    """
+    Vectorized size_tier() for a column of counts and/or labels: one
+    searchsorted over the parsed counts. Returns a numpy object array.
+    """
+    return SIZE_TIER.label_array(to_counts(values))
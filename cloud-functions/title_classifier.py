@@ -0,0 +1,125 @@
+"""
+Job title classification shared by all routing code.
+
+Every keyword the routing rules look for (decision-maker titles, senior
+titles for lead tiers, excluded manager roles) is compiled into one regex
+that finds all keywords in a title in a single scan. Results are memoized
+per normalized title in a bounded LRU, so a backfill where most contacts
+share a handful of titles classifies each distinct title once.
+
+Matching is by substring, like the `x in title_lower` checks this replaces
+(so "cto" still matches inside "director").
+
+Used by enrich_contact (deploy.sh copies this module into it),
+sync_leads_from_contacts.py and enrich-contacts.py.
+"""
+
+import os
+import re
+from functools import lru_cache
+from typing import FrozenSet, Iterable, List, NamedTuple, Optional
+
+# Title keywords that make a contact a decision maker on their own
+C_LEVEL_KEYWORDS = ["ceo", "cfo", "cmo", "cto", "coo", "cpo", "chief", "founder", "owner"]
+VP_KEYWORDS = ["vp", "vice president"]
+DIRECTOR_KEYWORDS = ["director", "head of"]
+# "manager" counts unless the title is one of these support roles
+MANAGER_EXCLUDE_KEYWORDS = ["account manager", "customer success", "support", "operations manager", "community"]
+
+# Senior titles for lead tier routing (enrich-contacts.py)
+SENIOR_KEYWORDS = ["ceo", "cmo", "cfo", "coo", "cto", "vp", "president", "director", "head of", "chief", "founder", "owner"]
+
+DECISION_MAKER_SENIORITIES = ["C_LEVEL", "VP", "DIRECTOR", "MANAGER"]
+
+KEYWORDS = sorted(
+    set(C_LEVEL_KEYWORDS + VP_KEYWORDS + DIRECTOR_KEYWORDS + MANAGER_EXCLUDE_KEYWORDS + SENIOR_KEYWORDS)
+    | {"president", "vice", "manager"},
+    key=len,
+    reverse=True,
+)
+
+# Zero-width lookahead so every position is tried and overlapping keywords are
+# found; longest keywords first, so each position reports its longest match.
+KEYWORD_PATTERN = re.compile("(?=(" + "|".join(re.escape(k) for k in KEYWORDS) + "))")
+
+# A keyword matched at a position implies every shorter keyword it starts with
+# ("vice president" → "vice")
+_PREFIXES = {k: frozenset(p for p in KEYWORDS if k.startswith(p)) for k in KEYWORDS}
+
+TITLE_CACHE_SIZE = int(os.environ.get("TITLE_CACHE_SIZE", "8192"))
+
+
+class TitleClass(NamedTuple):
+    decision_maker: bool  # the title alone makes the contact a decision maker
+    senior: bool  # senior title for lead tier routing
+    keywords: FrozenSet[str]  # rule keywords found in the title
+
+
+NO_TITLE = TitleClass(False, False, frozenset())
+
+
+def normalize_title(title: Optional[str]) -> str:
+    """Lowercase and collapse whitespace, so variants of a title share a cache entry."""
+    if not title:
+        return ""
+    return " ".join(title.lower().split())
+
+
+def find_keywords(normalized_title: str) -> FrozenSet[str]:
+    """All rule keywords in a normalized title, in one scan."""
+    found = set()
+    for match in KEYWORD_PATTERN.finditer(normalized_title):
+        found |= _PREFIXES[match.group(1)]
+    return frozenset(found)
+
+
+@lru_cache(maxsize=TITLE_CACHE_SIZE)
+def _classify_normalized(normalized_title: str) -> TitleClass:
+    if not normalized_title:
+        return NO_TITLE
+
+    keywords = find_keywords(normalized_title)
+
+    decision_maker = (
+        any(k in keywords for k in C_LEVEL_KEYWORDS)
+        or any(k in keywords for k in VP_KEYWORDS)
+        or ("president" in keywords and "vice" not in keywords)
+        or any(k in keywords for k in DIRECTOR_KEYWORDS)
+        or ("manager" in keywords and not any(k in keywords for k in MANAGER_EXCLUDE_KEYWORDS))
+    )
+    senior = any(k in keywords for k in SENIOR_KEYWORDS)
+
+    return TitleClass(decision_maker, senior, keywords)
+
+
+def classify_title(title: Optional[str]) -> TitleClass:
+    """Classify one job title (memoized)."""
+    return _classify_normalized(normalize_title(title))
+
+
+def classify_titles(titles: Iterable[Optional[str]]) -> List[TitleClass]:
+    """Classify a list of job titles, in order. Each distinct title is classified once."""
+    by_title = {}
+    results = []
+    for title in titles:
+        if title not in by_title:
+            by_title[title] = classify_title(title)
+        results.append(by_title[title])
+    return results
+
+
+def is_decision_maker(jobtitle: Optional[str], seniority: Optional[str]) -> bool:
+    """Decision maker from job title, falling back to Apollo/HubSpot seniority."""
+    if classify_title(jobtitle).decision_maker:
+        return True
+    return seniority in DECISION_MAKER_SENIORITIES if seniority else False
+
+
+def is_senior_title(title: Optional[str]) -> bool:
+    """Senior title for lead tier routing."""
+    return classify_title(title).senior
+
+
+def cache_info():
+    """LRU hit/miss counts, for checking cache size on backfills."""
+    return _classify_normalized.cache_info()
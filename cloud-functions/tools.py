@@ -2,6 +2,9 @@
 Tool definitions and executor for Claude API.
 
 These tools are what Claude uses to gather data intelligently.
+
+Client modules are imported inside execute_tool, so importing this module
+doesn't pull in googleapiclient or sendgrid until a tool needs them.
 """
 
 from hubspot_client import (
@@ -11,9 +14,7 @@ from hubspot_client import (
     update_deal_field,
     create_hubspot_note,
 )
-from gmail_client import search_gmail
-from calendar_client import get_calendar_events
-from email_client import send_email
+from deal_index import get_deal_index
 
 
 # Tool definitions for Claude API
@@ -58,14 +59,14 @@ TOOLS = [
     },
     {
         "name": "search_gmail",
-        "description": "Search Gmail for emails from/to specific email addresses. Only searches for emails involving the specified contacts. Returns sender, recipient, subject, date, and snippet for each email.",
+        "description": "Search Gmail for emails from/to specific email addresses. Only searches for emails involving the specified contacts. Returns sender, recipient, subject, date, snippet, and deal_ids (the active deals the participants belong to) for each email.",
         "input_schema": {
             "type": "object",
             "properties": {
                 "email_addresses": {
                     "type": "array",
                     "items": {"type": "string"},
-                    "description": "List of email addresses to search for (from or to)",
+                    "description": "List of email addresses to search for (from or to). Defaults to every contact on an active deal.",
                 },
                 "since_hours": {
                     "type": "integer",
@@ -78,19 +79,19 @@ TOOLS = [
                     "default": 50,
                 },
             },
-            "required": ["email_addresses"],
+            "required": [],
         },
     },
     {
         "name": "get_calendar_events",
-        "description": "Get Google Calendar events that include specific attendees. Only returns events with the specified contacts. Returns event title, start time, end time, and attendees.",
+        "description": "Get Google Calendar events that include specific attendees. Only returns events with the specified contacts. Returns event title, start time, end time, attendees, and deal_ids (the active deals the attendees belong to).",
         "input_schema": {
             "type": "object",
             "properties": {
                 "attendee_emails": {
                     "type": "array",
                     "items": {"type": "string"},
-                    "description": "List of attendee email addresses to filter by",
+                    "description": "List of attendee email addresses to filter by. Defaults to every contact on an active deal.",
                 },
                 "days_ahead": {
                     "type": "integer",
@@ -103,7 +104,7 @@ TOOLS = [
                     "default": True,
                 },
             },
-            "required": ["attendee_emails"],
+            "required": [],
         },
     },
     {
@@ -188,17 +189,25 @@ def execute_tool(tool_name: str, tool_input: dict):
         return get_hubspot_tasks(include_completed=include_completed)
 
     elif tool_name == "search_gmail":
+        from gmail_client import search_gmail
+
+        deal_index = get_deal_index()
         return search_gmail(
-            email_addresses=tool_input["email_addresses"],
+            email_addresses=tool_input.get("email_addresses") or deal_index.emails(),
             since_hours=tool_input.get("since_hours", 24),
             max_results=tool_input.get("max_results", 50),
+            deal_index=deal_index,
         )
 
     elif tool_name == "get_calendar_events":
+        from calendar_client import get_calendar_events
+
+        deal_index = get_deal_index()
         return get_calendar_events(
-            attendee_emails=tool_input["attendee_emails"],
+            attendee_emails=tool_input.get("attendee_emails") or deal_index.emails(),
             days_ahead=tool_input.get("days_ahead", 7),
             include_today=tool_input.get("include_today", True),
+            deal_index=deal_index,
         )
 
     elif tool_name == "update_deal_field":
@@ -215,6 +224,8 @@ def execute_tool(tool_name: str, tool_input: dict):
         )
 
     elif tool_name == "send_email":
+        from email_client import send_email
+
         return send_email(
             to=tool_input["to"],
             subject=tool_input["subject"],
@@ -0,0 +1,213 @@
+"""
+Bulk reads through HubSpot's CRM exports API.
+
+Full-portal reads page through the REST API 100 records at a time (and
+search stops at 10,000 results). An export reads everything in one job:
+
+1. start_export(): POST /crm/v3/exports/export/async
+2. wait_for_export(): poll the task status until COMPLETE
+3. download(): stream the file to disk in chunks
+4. read_export(): parse it into records shaped like the REST API's
+   ({"id", "properties", "associations"}), so callers can swap it in for a
+   paged read
+
+Exports come back as CSV or XLSX, and large ones as a ZIP of several files;
+all three are handled. XLSX needs openpyxl.
+
+Point HUBSPOT_API_BASE at crm_export_fake.FakeExportServer to run this
+against local files.
+"""
+
+import csv
+import io
+import os
+import tempfile
+import time
+import zipfile
+from typing import Dict, Iterator, List
+
+import requests
+
+TOKEN = os.environ.get("HUBSPOT_ACCESS_TOKEN", "")
+BASE = os.environ.get("HUBSPOT_API_BASE", "https://api.hubapi.com")
+HEADERS = {
+    "Authorization": f"Bearer {TOKEN}",
+    "Content-Type": "application/json"
+}
+
+# Export objectType for each CRM object
+OBJECT_TYPES = {
+    "contacts": "CONTACT",
+    "companies": "COMPANY",
+    "deals": "DEAL",
+    "leads": "0-136",
+}
+
+EXPORT_POLL_SECONDS = int(os.environ.get("EXPORT_POLL_SECONDS", "5"))
+EXPORT_TIMEOUT_SECONDS = int(os.environ.get("EXPORT_TIMEOUT_SECONDS", "1800"))
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+# Column holding the record id, depending on the export's header style
+ID_COLUMNS = ["hs_object_id", "Record ID"]
+
+
+def start_export(object_name, properties, associated=None, file_format="CSV", base=None):
+    """Start an export of every `object_name` record. Returns the task id."""
+    payload = {
+        "exportType": "VIEW",
+        "exportName": f"kartel {object_name} {time.strftime('%Y-%m-%d %H:%M')}",
+        "format": file_format,
+        "language": "EN",
+        "objectType": OBJECT_TYPES[object_name],
+        "objectProperties": ["hs_object_id", *properties],
+        # Internal property names and values, so columns match the REST API
+        "exportInternalValuesOptions": ["NAMES", "VALUES"],
+    }
+    if associated:
+        payload["associatedObjectType"] = OBJECT_TYPES[associated]
+
+    response = requests.post(f"{base or BASE}/crm/v3/exports/export/async", headers=HEADERS, json=payload)
+    if response.status_code not in [200, 201, 202]:
+        raise Exception(f"Error starting {object_name} export: {response.status_code} {response.text[:200]}")
+    return str(response.json()["id"])
+
+
+def wait_for_export(task_id, poll_seconds=None, timeout_seconds=None, base=None):
+    """Poll until the export is done. Returns the file's download URL."""
+    poll_seconds = EXPORT_POLL_SECONDS if poll_seconds is None else poll_seconds
+    deadline = time.monotonic() + (timeout_seconds or EXPORT_TIMEOUT_SECONDS)
+
+    while True:
+        response = requests.get(f"{base or BASE}/crm/v3/exports/export/async/tasks/{task_id}/status",
+                                headers=HEADERS)
+        if response.status_code == 429:
+            status = "rate limited"
+        elif response.status_code != 200:
+            raise Exception(f"Error checking export {task_id}: {response.status_code} {response.text[:200]}")
+        else:
+            data = response.json()
+            status = data.get("status")
+            if status == "COMPLETE":
+                return data["result"]
+            if status in ["CANCELED", "FAILED"]:
+                raise Exception(f"Export {task_id} {status.lower()}: {data.get('errors') or ''}")
+
+        if time.monotonic() > deadline:
+            raise Exception(f"Export {task_id} still {status} after {timeout_seconds or EXPORT_TIMEOUT_SECONDS}s")
+        time.sleep(1 if status == "rate limited" else poll_seconds)
+
+
+def download(url, path):
+    """Stream the export file at `url` to `path`"""
+    with requests.get(url, stream=True) as response:
+        if response.status_code != 200:
+            raise Exception(f"Error downloading export: {response.status_code}")
+        with open(path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_BYTES):
+                f.write(chunk)
+
+
+def _csv_rows(binary_file):
+    text = io.TextIOWrapper(binary_file, encoding="utf-8-sig", newline="")
+    yield from csv.DictReader(text)
+
+
+def _xlsx_rows(binary_file):
+    try:
+        import openpyxl
+    except ImportError:
+        raise Exception("Reading XLSX exports needs openpyxl (pip install openpyxl), or export as CSV")
+
+    workbook = openpyxl.load_workbook(binary_file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell) if cell is not None else "" for cell in next(rows, [])]
+        for row in rows:
+            yield {column: _cell_text(value) for column, value in zip(header, row)}
+    finally:
+        workbook.close()
+
+
+def _cell_text(value):
+    if value is None:
+        return ""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _is_xlsx(archive):
+    return "[Content_Types].xml" in archive.namelist()
+
+
+def _rows(path):
+    """Every row of an export file: CSV, XLSX, or a ZIP of either"""
+    if not zipfile.is_zipfile(path):
+        with open(path, "rb") as f:
+            yield from _csv_rows(f)
+        return
+
+    with zipfile.ZipFile(path) as archive:
+        if _is_xlsx(archive):
+            with open(path, "rb") as f:
+                yield from _xlsx_rows(f)
+            return
+
+        for name in sorted(archive.namelist()):
+            with archive.open(name) as member:
+                if name.lower().endswith(".csv"):
+                    yield from _csv_rows(member)
+                elif name.lower().endswith(".xlsx"):
+                    yield from _xlsx_rows(io.BytesIO(member.read()))
+
+
+def _association_ids(value):
+    return [part.strip() for part in value.replace(",", ";").split(";") if part.strip()]
+
+
+def read_export(path, properties, associated=None) -> Iterator[Dict]:
+    """
+    Records from an export file, shaped like REST API results: id,
+    `properties` (None where empty) and, with `associated`, an
+    "associations" entry listing the associated record ids.
+    """
+    for row in _rows(path):
+        record_id = next((row[c] for c in ID_COLUMNS if row.get(c)), None)
+        if not record_id:
+            continue
+
+        record = {
+            "id": str(record_id),
+            "properties": {name: (row.get(name) or None) for name in properties},
+        }
+        if associated:
+            ids = []
+            for column, value in row.items():
+                normalized = (column or "").lower().replace(" ", "").replace("_", "")
+                if normalized.startswith("associated") and normalized.endswith("ids") and value:
+                    ids += _association_ids(value)
+            record["associations"] = {associated: {"results": [{"id": i} for i in ids]}}
+        yield record
+
+
+def export_objects(object_name, properties, associated=None, file_format="CSV", base=None,
+                   poll_seconds=None) -> List[Dict]:
+    """
+    Every `object_name` record (contacts, companies, deals, leads) via one
+    export job. Same shape as a paged REST read with `properties` (and
+    `associations` for `associated`).
+    """
+    print(f"Exporting all {object_name}...")
+    task_id = start_export(object_name, properties, associated, file_format, base)
+    url = wait_for_export(task_id, poll_seconds=poll_seconds, base=base)
+
+    suffix = ".xlsx" if file_format == "XLSX" else ".csv"
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f"{object_name}{suffix}")
+        download(url, path)
+        records = list(read_export(path, properties, associated))
+
+    print(f"Exported {len(records)} {object_name}")
+    return records
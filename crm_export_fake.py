@@ -0,0 +1,164 @@
+"""
+Local stand-in for HubSpot's CRM exports API, for exercising crm_export.
+
+Serves the three export endpoints from in-memory records:
+
+    records = {"CONTACT": [{"id": "1", "properties": {"email": "a@b.co"}}]}
+    with FakeExportServer(records) as fake:
+        crm_export.export_objects("contacts", ["email"], base=fake.base_url)
+
+or run it and point HUBSPOT_API_BASE at it:
+
+    python3 crm_export_fake.py records.json [PORT]
+
+where records.json maps export objectType ("CONTACT", "DEAL", "0-136", ...)
+to a list of records. Associations are given per record as
+{"associations": {"<object>": ["<id>", ...]}}.
+
+Tasks report PROCESSING for `polls_before_complete` status checks, then
+COMPLETE. Exports with more than `rows_per_file` records are served as a
+ZIP of CSVs, as HubSpot does for large exports.
+"""
+
+import csv
+import io
+import itertools
+import json
+import sys
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path != "/crm/v3/exports/export/async":
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if request.get("format", "CSV") != "CSV":
+            self._send_json(400, {"message": "The fake only serves CSV exports"})
+            return
+        task_id = self.server.fake.add_task(request)
+        self._send_json(202, {"id": task_id})
+
+    def do_GET(self):
+        fake = self.server.fake
+        parts = self.path.strip("/").split("/")
+
+        # /crm/v3/exports/export/async/tasks/<id>/status
+        if self.path.startswith("/crm/v3/exports/export/async/tasks/") and parts[-1] == "status":
+            task = fake.tasks.get(parts[-2])
+            if task is None:
+                self.send_error(404)
+                return
+            task["polls"] += 1
+            if task["polls"] <= fake.polls_before_complete:
+                self._send_json(200, {"status": "PROCESSING"})
+            else:
+                self._send_json(200, {"status": "COMPLETE", "result": f"{fake.base_url}/files/{parts[-2]}"})
+            return
+
+        # /files/<id>
+        if len(parts) == 2 and parts[0] == "files" and parts[1] in fake.tasks:
+            body, content_type = fake.export_file(fake.tasks[parts[1]]["request"])
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_error(404)
+
+
+class FakeExportServer:
+    """Export API on http://127.0.0.1:<port> (see module docstring)"""
+
+    def __init__(self, records, port=0, polls_before_complete=1, rows_per_file=1000):
+        self.records = records
+        self.polls_before_complete = polls_before_complete
+        self.rows_per_file = rows_per_file
+        self.tasks = {}
+        self._ids = itertools.count(1)
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        self.server.fake = self
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = None
+
+    def add_task(self, request):
+        task_id = str(next(self._ids))
+        self.tasks[task_id] = {"request": request, "polls": 0}
+        return task_id
+
+    def _csv(self, header, rows):
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(header)
+        writer.writerows(rows)
+        return out.getvalue().encode("utf-8")
+
+    def export_file(self, request):
+        """(file bytes, content type) for an export request"""
+        properties = [p for p in request.get("objectProperties", []) if p != "hs_object_id"]
+        associated = request.get("associatedObjectType")
+        header = ["Record ID", *properties]
+        if associated:
+            header.append(f"Associated {associated} IDs")
+
+        rows = []
+        for record in self.records.get(request.get("objectType"), []):
+            props = record.get("properties", {})
+            row = [record["id"], *[props.get(p) or "" for p in properties]]
+            if associated:
+                ids = record.get("associations", {}).get(associated, [])
+                row.append(";".join(str(i) for i in ids))
+            rows.append(row)
+
+        if len(rows) <= self.rows_per_file:
+            return self._csv(header, rows), "text/csv"
+
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as z:
+            for n, start in enumerate(range(0, len(rows), self.rows_per_file), 1):
+                z.writestr(f"export-{n}.csv", self._csv(header, rows[start:start + self.rows_per_file]))
+        return archive.getvalue(), "application/zip"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    with open(sys.argv[1]) as f:
+        records = json.load(f)
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8060
+    fake = FakeExportServer(records, port=port)
+    print(f"Fake export API on {fake.base_url} (set HUBSPOT_API_BASE to this)")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
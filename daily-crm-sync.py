@@ -14,6 +14,8 @@ Features:
 6. Create re-engagement deals when deals close lost or churn
 7. Spec handoff notification when spec_required = yes
 8. Send email alerts for critical items
+
+Requires numpy (stall detection, via deal_funnel).
 """
 
 import os
@@ -25,6 +27,16 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
+import dashboard
+import deal_funnel
+from date_index import DateIndex
+from forecast_cube import ForecastCube
+from snapshot_history import SnapshotHistory
+
+# Shared search modules live with the Cloud Functions
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "cloud-functions"))
+from partitioned_search import search_all
+
 # API Keys
 HUBSPOT_TOKEN = os.environ.get("HUBSPOT_ACCESS_TOKEN", "")
 APOLLO_KEY = os.environ.get("APOLLO_API_KEY", "")
@@ -110,17 +122,12 @@ def get_stage_ids():
 
 
 def search_deals(filters, properties):
-    """Search deals with given filters."""
-    payload = {
-        "filterGroups": [{"filters": filters}],
-        "properties": properties,
-        "limit": 100
-    }
-    response = requests.post(f"{BASE_URL}/crm/v3/objects/deals/search", headers=HEADERS, json=payload)
-    if response.status_code != 200:
-        log(f"Error searching deals: {response.text}")
+    """Search deals with given filters (every result, partitioned past the 10k search cap)."""
+    try:
+        return search_all("deals", [{"filters": filters}], properties, HEADERS)
+    except Exception as e:
+        log(f"Error searching deals: {e}")
         return []
-    return response.json().get("results", [])
 
 
 def create_task(title, description, owner_id, deal_id=None, due_days=1):
@@ -207,57 +214,42 @@ def send_email_alert(to_email, subject, body):
 # ============================================
 
 def detect_stalled_deals():
-    """Find deals that haven't moved stages in 7+ days and create follow-up tasks."""
+    """Find open deals that haven't moved stages in 7+ days and create follow-up tasks."""
     log("\n=== DETECTING STALLED DEALS ===")
 
-    # Get all open deals
-    filters = [
-        {"propertyName": "dealstage", "operator": "NOT_IN", "values": [
-            STAGES.get("enterprise_closedwon", ""),
-            STAGES.get("enterprise_closedlost", ""),
-            STAGES.get("smb_closedwon", ""),
-            STAGES.get("smb_closedlost", "")
-        ]}
-    ]
-
     deals = search_deals(
         [{"propertyName": "pipeline", "operator": "IN", "values": [ENTERPRISE_PIPELINE, SMB_PIPELINE]}],
-        ["dealname", "dealstage", "hubspot_owner_id", "hs_date_entered_*", "amount"]
+        ["dealname", "dealstage", "hubspot_owner_id", "amount"]
     )
+    deals_by_id = {deal["id"]: deal.get("properties", {}) for deal in deals}
+
+    # Stage entry dates are hs_date_entered_<stage id>; deal_funnel requests
+    # the exact names from the pipeline definitions
+    try:
+        pipelines = deal_funnel.get_pipelines([ENTERPRISE_PIPELINE, SMB_PIPELINE])
+        history = deal_funnel.get_stage_history(deals_by_id.keys(), pipelines)
+    except Exception as e:
+        log(f"Error reading stage history: {e}")
+        return
 
     stalled_count = 0
-    today = datetime.now()
-
-    for deal in deals:
-        props = deal.get("properties", {})
-        deal_id = deal.get("id")
-        deal_name = props.get("dealname", "Unknown")
-        owner_id = props.get("hubspot_owner_id")
-        stage = props.get("dealstage")
-
-        # Check all date_entered properties to find current stage entry date
-        # HubSpot stores these as hs_date_entered_<stage_id>
-        stage_entry_key = f"hs_date_entered_{stage}"
-        stage_entry = props.get(stage_entry_key)
-
-        if not stage_entry:
-            continue
-
-        try:
-            entry_date = datetime.fromisoformat(stage_entry.replace("Z", "+00:00")).replace(tzinfo=None)
-            days_in_stage = (today - entry_date).days
+    for pipeline_history in history.values():
+        for deal_id, stage, days_in_stage in pipeline_history.stalled(STALLED_DAYS):
+            props = deals_by_id.get(deal_id, {})
+            deal_name = props.get("dealname", "Unknown")
 
-            if days_in_stage >= STALLED_DAYS:
-                log(f"  STALLED: {deal_name} - {days_in_stage} days in current stage")
+            log(f"  STALLED: {deal_name} - {days_in_stage} days in {stage.label}")
+            # One failed task shouldn't stop the other deals or the rest of the run
+            try:
                 create_task(
                     f"Follow up on stalled deal: {deal_name}",
                     f"This deal has been in the same stage for {days_in_stage} days. Time to push it forward or update the status.",
-                    owner_id or OWNER_EMMET,
+                    props.get("hubspot_owner_id") or OWNER_EMMET,
                     deal_id
                 )
                 stalled_count += 1
-        except Exception as e:
-            pass
+            except Exception as e:
+                log(f"  Error creating stalled deal task for {deal_name}: {e}")
 
     log(f"  Found {stalled_count} stalled deals")
 
@@ -274,38 +266,34 @@ def check_renewal_reminders():
 
     today = datetime.now().date()
     reminder_count = 0
+    by_end_date = DateIndex.build(deals, lambda deal: deal.get("properties", {}).get("contract_end_date"))
 
-    for deal in deals:
-        props = deal.get("properties", {})
-        deal_id = deal.get("id")
-        deal_name = props.get("dealname", "Unknown")
-        owner_id = props.get("hubspot_owner_id")
-        end_date_str = props.get("contract_end_date")
-
-        if not end_date_str:
-            continue
+    for alert_days in RENEWAL_ALERTS:
+        end_date = today + timedelta(days=alert_days)
 
-        try:
-            end_date = datetime.fromisoformat(end_date_str.replace("Z", "+00:00")).date()
-            days_until = (end_date - today).days
-
-            for alert_days in RENEWAL_ALERTS:
-                if days_until == alert_days:
-                    if alert_days == 90:
-                        task_title = f"Identify expansion path: {deal_name}"
-                        task_body = f"Contract ends in 90 days ({end_date}). Start planning renewal/expansion strategy."
-                    elif alert_days == 15:
-                        task_title = f"Finalize renewal strategy: {deal_name}"
-                        task_body = f"Contract ends in 15 days ({end_date}). Renewal proposal should be ready."
-                    else:  # 7 days
-                        task_title = f"URGENT - Final renewal push: {deal_name}"
-                        task_body = f"Contract ends in 7 days ({end_date}). Close this renewal NOW."
-
-                    log(f"  RENEWAL ALERT ({alert_days} days): {deal_name}")
-                    create_task(task_title, task_body, owner_id or OWNER_EMMET, deal_id)
-                    reminder_count += 1
-        except Exception as e:
-            pass
+        for deal in by_end_date.on(end_date):
+            props = deal.get("properties", {})
+            deal_id = deal.get("id")
+            deal_name = props.get("dealname", "Unknown")
+            owner_id = props.get("hubspot_owner_id")
+
+            if alert_days == 90:
+                task_title = f"Identify expansion path: {deal_name}"
+                task_body = f"Contract ends in 90 days ({end_date}). Start planning renewal/expansion strategy."
+            elif alert_days == 15:
+                task_title = f"Finalize renewal strategy: {deal_name}"
+                task_body = f"Contract ends in 15 days ({end_date}). Renewal proposal should be ready."
+            else:  # 7 days
+                task_title = f"URGENT - Final renewal push: {deal_name}"
+                task_body = f"Contract ends in 7 days ({end_date}). Close this renewal NOW."
+
+            log(f"  RENEWAL ALERT ({alert_days} days): {deal_name}")
+            # One failed task shouldn't stop the other reminders or the rest of the run
+            try:
+                create_task(task_title, task_body, owner_id or OWNER_EMMET, deal_id)
+                reminder_count += 1
+            except Exception as e:
+                log(f"  Error creating renewal reminder for {deal_name}: {e}")
 
     log(f"  Created {reminder_count} renewal reminders")
 
@@ -577,6 +565,24 @@ def generate_daily_digest():
 
     log(f"  Open Enterprise deals: {open_enterprise}")
 
+    try:
+        snapshot = dashboard.refresh_snapshot()
+    except Exception as e:
+        log(f"Error refreshing deal snapshot: {e}")
+        return
+
+    # Weighted forecast from the snapshot's cube
+    forecast = ForecastCube.from_state(snapshot.state["forecast"])
+    this_month = datetime.now().strftime("%Y-%m")
+    log(f"  Weighted pipeline: ${forecast.get()['weighted']:,.0f}")
+    log(f"  Weighted forecast closing this month: ${forecast.get(close_month=this_month)['weighted']:,.0f}")
+
+    # Record today's deal state and compare with last week
+    history = SnapshotHistory()
+    history.record(snapshot)
+    for tier, change in dashboard.pipeline_trend(history)["week_over_week"].items():
+        log(f"  Pipeline change vs last week ({tier}): {change:+,.0f}")
+
     # TODO: Add more summary stats and email them
 
 
@@ -2,51 +2,30 @@
 """
 Dashboard Data Extractor
 Pulls all key metrics that would appear on HubSpot dashboards via API.
+
+The numbers come from dashboard.py (importable; also serves them as JSON).
+This script prints them as tables. Each run updates the saved deal snapshot
+with deals modified since the last run, so the report can also be
+re-rendered without calling the API, and records the day's state in the
+snapshot history (snapshot_history.py) for week-over-week trends.
+
+Requires numpy.
+
 Run: python3 dashboard-data.py
+     python3 dashboard-data.py --full            # refetch every deal
+     python3 dashboard-data.py --full --export   # refetch every deal with one CRM export job
+     python3 dashboard-data.py --funnel          # add the funnel section (reads stage history for every sales deal)
+     python3 dashboard-data.py --from-snapshot   # last saved snapshot, no API calls (no funnel)
+     python3 dashboard-data.py --serve [PORT]    # JSON at http://127.0.0.1:PORT/metrics (default 8050)
 """
 
-import requests
-import json
-from datetime import datetime, timedelta
-
-import os
-TOKEN = os.environ.get("HUBSPOT_ACCESS_TOKEN", "")
-BASE = "https://api.hubapi.com"
-HEADERS = {
-    "Authorization": f"Bearer {TOKEN}",
-    "Content-Type": "application/json"
-}
-
-# Pipeline IDs
-PIPELINES = {
-    "enterprise": "1880222397",
-    "smb": "1880222398",
-    "client_delivery": "1880222399",
-    "reengagement": "1880222400"
-}
-
-def search_deals(filters, properties=None):
-    """Search deals with given filters"""
-    if properties is None:
-        properties = ["dealname", "amount", "dealstage", "pipeline", "closedate",
-                     "hubspot_owner_id", "deal_tier", "payment_expected_date",
-                     "payment_received_date", "phase_3_start_date", "renewal_date"]
-
-    payload = {
-        "filterGroups": filters,
-        "properties": properties,
-        "limit": 100
-    }
-
-    r = requests.post(f"{BASE}/crm/v3/objects/deals/search",
-                     headers=HEADERS, json=payload)
-    if r.status_code == 200:
-        return r.json().get("results", [])
-    return []
-
-def get_all_deals():
-    """Get all deals"""
-    return search_deals([])
+import sys
+from datetime import datetime
+
+from dashboard import (PIPELINES, SNAPSHOT_PATH, MetricsCache, dashboard_metrics, fetch_snapshot,
+                       funnel_metrics, pipeline_trend, refresh_snapshot, serve, snapshot_file_version)
+from deal_snapshot import DealSnapshot
+from snapshot_history import SnapshotHistory
 
 def format_currency(amount):
     """Format as currency"""
@@ -82,172 +61,156 @@ def print_table(headers, rows):
         print(f"  {row_line}")
 
 # ============================================================
-# EXECUTIVE DASHBOARD
+# REPORT
 # ============================================================
-print_section("EXECUTIVE DASHBOARD")
 
-deals = get_all_deals()
+def format_percent(value):
+    return "-" if value is None else f"{value:.0%}"
+
+def format_days(value):
+    return "-" if value is None else f"{value:.1f}"
+
+def print_funnel(funnel):
+    for pid, pipeline in funnel.items():
+        print(f"\n  {pipeline['label']}: {pipeline['open']} open, "
+              f"win rate {format_percent(pipeline['win_rate'])}, "
+              f"median cycle {format_days(pipeline['median_cycle_days'])} days, "
+              f"velocity {format_currency(pipeline['velocity_per_day'])}/day")
+        rows = [[stage["label"][:25], stage["reached"], format_percent(stage["conversion_to_next"]),
+                 stage["in_stage"], format_days(stage["days"]["median"]), format_days(stage["days"]["p90"])]
+                for stage in pipeline["stages"]]
+        print_table(["Stage", "Reached", "To Next", "Now In", "Median Days", "P90 Days"], rows)
+
+def print_dashboard(metrics, funnel=None, trend=None):
+    # ============================================================
+    # EXECUTIVE DASHBOARD
+    # ============================================================
+    print_section("EXECUTIVE DASHBOARD")
+
+    print(f"\n  Total Pipeline Value: {format_currency(metrics['open']['amount'])}")
+    print(f"  Open Deals: {metrics['open']['count']}")
+
+    print(f"\n  Pipeline by Deal Tier:")
+    for tier, total in sorted(metrics["open_by_tier"].items(), key=lambda x: -x[1]["amount"]):
+        print(f"    {tier}: {format_currency(total['amount'])}")
+
+    forecast = metrics.get("forecast")
+    if forecast:
+        print(f"\n  Weighted Pipeline: {format_currency(forecast['total']['weighted'])}")
+        print(f"\n  Weighted Pipeline by Deal Tier:")
+        for tier, cell in sorted(forecast["by_tier"].items(), key=lambda x: -x[1]["weighted"]):
+            print(f"    {tier}: {format_currency(cell['weighted'])}")
+
+        print(f"\n  Forecast by Close Month:")
+        this_month = datetime.now().strftime("%Y-%m")
+        months = sorted(m for m in forecast["by_close_month"] if m != "none" and m >= this_month)[:6]
+        rows = [[m, forecast["by_close_month"][m]["count"], format_currency(forecast["by_close_month"][m]["amount"]),
+                 format_currency(forecast["by_close_month"][m]["weighted"])] for m in months]
+        print_table(["Month", "Deals", "Amount", "Weighted"], rows)
+
+    print(f"\n  Total Won Revenue: {format_currency(metrics['won']['amount'])}")
+    print(f"  Won Deals: {metrics['won']['count']}")
+
+    if trend and trend["week_over_week"]:
+        print(f"\n  Pipeline Change vs Last Week:")
+        for tier, change in sorted(trend["week_over_week"].items(), key=lambda x: -abs(x[1])):
+            sign = "+" if change >= 0 else "-"
+            print(f"    {tier}: {sign}{format_currency(abs(change))}")
+
+    # ============================================================
+    # SALES DASHBOARD
+    # ============================================================
+    print_section("SALES DASHBOARD")
+
+    print("\n  Top Active Deals:")
+    rows = [[d.name[:30], format_currency(d.amount), d.stage[:15], d.tier] for d in metrics["top_open"]]
+    print_table(["Deal Name", "Amount", "Stage", "Tier"], rows)
+
+    print("\n  Deals by Pipeline:")
+    for name, pid in PIPELINES.items():
+        total = metrics["open_by_pipeline"].get(pid, {"count": 0, "amount": 0})
+        print(f"    {name}: {total['count']} deals, {format_currency(total['amount'])}")
+
+    # ============================================================
+    # FUNNEL DASHBOARD
+    # ============================================================
+    if funnel is not None:
+        print_section("FUNNEL DASHBOARD")
+        print_funnel(funnel)
+
+    # ============================================================
+    # CASH FLOW DASHBOARD
+    # ============================================================
+    print_section("CASH FLOW DASHBOARD")
+
+    expected = metrics["expected_payments"]
+    print("\n  Payments Expected (no payment received yet):")
+    rows = [[d.name[:30], format_currency(d.amount), d.payment_expected_date] for d in expected["deals"]]
+    print_table(["Deal", "Amount", "Expected Date"], rows)
+    if expected["count"] > len(rows):
+        print(f"  ... and {expected['count'] - len(rows)} more")
+    print(f"\n  Total Expected: {format_currency(expected['amount'])}")
+
+    overdue = metrics["overdue_payments"]
+    print("\n  Overdue Payments:")
+    rows = [[d.name[:30], format_currency(d.amount), d.payment_expected_date] for d in overdue["deals"]]
+    print_table(["Deal", "Amount", "Was Due"], rows)
+    if overdue["count"] > len(rows):
+        print(f"  ... and {overdue['count'] - len(rows)} more")
+    print(f"\n  Total Overdue: {format_currency(overdue['amount'])}")
+
+    # ============================================================
+    # OPERATIONS DASHBOARD
+    # ============================================================
+    print_section("OPERATIONS DASHBOARD")
+
+    print(f"\n  Client Delivery Pipeline: {metrics['client_delivery']['count']} deals")
+
+    print("\n  Phase III Starts (next 60 days):")
+    rows = [[d.name[:30], d.phase_3_start_date, format_currency(d.amount)] for d in metrics["phase_3_upcoming"]["deals"]]
+    print_table(["Deal", "Phase III Date", "Value"], rows)
+
+    print("\n  Renewals Due (next 90 days):")
+    rows = [[d.name[:30], d.renewal_date, format_currency(d.amount)] for d in metrics["renewals_upcoming"]["deals"]]
+    print_table(["Deal", "Renewal Date", "Value"], rows)
+
+    print(f"\n  Re-engagement Pipeline: {metrics['reengagement']['count']} deals")
+
+    print("\n" + "="*60)
+    print(f"  Report generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print("="*60 + "\n")
+
+
+def main():
+    from_snapshot = "--from-snapshot" in sys.argv
+
+    if "--serve" in sys.argv:
+        args = sys.argv[sys.argv.index("--serve") + 1:]
+        port = int(args[0]) if args and args[0].isdigit() else 8050
+        if from_snapshot:
+            cache = MetricsCache(load_snapshot=lambda: DealSnapshot.load(SNAPSHOT_PATH),
+                                 version=snapshot_file_version, check_seconds=0)
+        else:
+            cache = MetricsCache()
+        serve(port, cache=cache)
+        return
 
-# Total Pipeline Value (open deals)
-open_deals = [d for d in deals if d["properties"].get("dealstage") not in ["closedwon", "closedlost", None]]
-total_pipeline = sum(float(d["properties"].get("amount") or 0) for d in open_deals)
-print(f"\n  Total Pipeline Value: {format_currency(total_pipeline)}")
-print(f"  Open Deals: {len(open_deals)}")
+    if from_snapshot:
+        snapshot = DealSnapshot.load(SNAPSHOT_PATH)
+        print(f"Loaded {len(snapshot)} deals from snapshot taken {snapshot.fetched_at:%Y-%m-%d %H:%M}")
+    elif "--full" in sys.argv:
+        snapshot = fetch_snapshot(export="--export" in sys.argv)
+    else:
+        snapshot = refresh_snapshot()
 
-# Pipeline by Tier
-tier_totals = {}
-for d in open_deals:
-    tier = d["properties"].get("deal_tier") or "unassigned"
-    amount = float(d["properties"].get("amount") or 0)
-    tier_totals[tier] = tier_totals.get(tier, 0) + amount
+    history = SnapshotHistory()
+    if not from_snapshot:
+        history.record(snapshot)
 
-print(f"\n  Pipeline by Deal Tier:")
-for tier, total in sorted(tier_totals.items(), key=lambda x: -x[1]):
-    print(f"    {tier}: {format_currency(total)}")
+    # Opt-in: one API call per 100 sales deals, unlike the incremental refresh
+    funnel = funnel_metrics(snapshot) if "--funnel" in sys.argv and not from_snapshot else None
+    print_dashboard(dashboard_metrics(snapshot, datetime.now()), funnel, pipeline_trend(history))
 
-# Won deals
-won_deals = [d for d in deals if d["properties"].get("dealstage") == "closedwon"]
-total_won = sum(float(d["properties"].get("amount") or 0) for d in won_deals)
-print(f"\n  Total Won Revenue: {format_currency(total_won)}")
-print(f"  Won Deals: {len(won_deals)}")
 
-# ============================================================
-# SALES DASHBOARD
-# ============================================================
-print_section("SALES DASHBOARD")
-
-# Active deals sorted by amount
-print("\n  Top Active Deals:")
-sorted_deals = sorted(open_deals, key=lambda d: float(d["properties"].get("amount") or 0), reverse=True)[:10]
-rows = []
-for d in sorted_deals:
-    rows.append([
-        d["properties"].get("dealname", "")[:30],
-        format_currency(float(d["properties"].get("amount") or 0)),
-        d["properties"].get("dealstage", "")[:15],
-        d["properties"].get("deal_tier", "")
-    ])
-print_table(["Deal Name", "Amount", "Stage", "Tier"], rows)
-
-# Deals by pipeline
-print("\n  Deals by Pipeline:")
-pipeline_counts = {}
-pipeline_amounts = {}
-for d in open_deals:
-    p = d["properties"].get("pipeline", "unknown")
-    pipeline_counts[p] = pipeline_counts.get(p, 0) + 1
-    pipeline_amounts[p] = pipeline_amounts.get(p, 0) + float(d["properties"].get("amount") or 0)
-
-for name, pid in PIPELINES.items():
-    count = pipeline_counts.get(pid, 0)
-    amount = pipeline_amounts.get(pid, 0)
-    print(f"    {name}: {count} deals, {format_currency(amount)}")
-
-# ============================================================
-# CASH FLOW DASHBOARD
-# ============================================================
-print_section("CASH FLOW DASHBOARD")
-
-today = datetime.now()
-today_str = today.strftime("%Y-%m-%d")
-
-# Expected payments (have invoice, no payment received)
-print("\n  Payments Expected (no payment received yet):")
-expected_payments = []
-for d in deals:
-    expected = d["properties"].get("payment_expected_date")
-    received = d["properties"].get("payment_received_date")
-    if expected and not received:
-        expected_payments.append(d)
-
-expected_payments.sort(key=lambda d: d["properties"].get("payment_expected_date", "9999"))
-rows = []
-total_expected = 0
-for d in expected_payments[:10]:
-    amount = float(d["properties"].get("amount") or 0)
-    total_expected += amount
-    rows.append([
-        d["properties"].get("dealname", "")[:30],
-        format_currency(amount),
-        d["properties"].get("payment_expected_date", "")[:10]
-    ])
-print_table(["Deal", "Amount", "Expected Date"], rows)
-print(f"\n  Total Expected: {format_currency(total_expected)}")
-
-# Overdue payments
-print("\n  Overdue Payments:")
-overdue = []
-for d in expected_payments:
-    expected = d["properties"].get("payment_expected_date", "")[:10]
-    if expected and expected < today_str:
-        overdue.append(d)
-
-rows = []
-total_overdue = 0
-for d in overdue:
-    amount = float(d["properties"].get("amount") or 0)
-    total_overdue += amount
-    rows.append([
-        d["properties"].get("dealname", "")[:30],
-        format_currency(amount),
-        d["properties"].get("payment_expected_date", "")[:10]
-    ])
-print_table(["Deal", "Amount", "Was Due"], rows)
-print(f"\n  Total Overdue: {format_currency(total_overdue)}")
-
-# ============================================================
-# OPERATIONS DASHBOARD
-# ============================================================
-print_section("OPERATIONS DASHBOARD")
-
-# Client Delivery pipeline
-delivery_deals = [d for d in deals if d["properties"].get("pipeline") == PIPELINES["client_delivery"]]
-print(f"\n  Client Delivery Pipeline: {len(delivery_deals)} deals")
-
-# Phase III upcoming (next 60 days)
-print("\n  Phase III Starts (next 60 days):")
-future_60 = (today + timedelta(days=60)).strftime("%Y-%m-%d")
-phase3_upcoming = []
-for d in deals:
-    p3_date = d["properties"].get("phase_3_start_date") or ""
-    p3_date = p3_date[:10] if p3_date else ""
-    if p3_date and today_str <= p3_date <= future_60:
-        phase3_upcoming.append(d)
-
-rows = []
-for d in phase3_upcoming:
-    p3 = d["properties"].get("phase_3_start_date") or ""
-    rows.append([
-        (d["properties"].get("dealname") or "")[:30],
-        p3[:10] if p3 else "",
-        format_currency(float(d["properties"].get("amount") or 0))
-    ])
-print_table(["Deal", "Phase III Date", "Value"], rows)
-
-# Renewals upcoming (next 90 days)
-print("\n  Renewals Due (next 90 days):")
-future_90 = (today + timedelta(days=90)).strftime("%Y-%m-%d")
-renewals_upcoming = []
-for d in deals:
-    renewal = d["properties"].get("renewal_date") or ""
-    renewal = renewal[:10] if renewal else ""
-    if renewal and today_str <= renewal <= future_90:
-        renewals_upcoming.append(d)
-
-rows = []
-for d in renewals_upcoming:
-    ren = d["properties"].get("renewal_date") or ""
-    rows.append([
-        (d["properties"].get("dealname") or "")[:30],
-        ren[:10] if ren else "",
-        format_currency(float(d["properties"].get("amount") or 0))
-    ])
-print_table(["Deal", "Renewal Date", "Value"], rows)
-
-# Re-engagement pipeline
-reengagement_deals = [d for d in deals if d["properties"].get("pipeline") == PIPELINES["reengagement"]]
-print(f"\n  Re-engagement Pipeline: {len(reengagement_deals)} deals")
-
-print("\n" + "="*60)
-print(f"  Report generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-print("="*60 + "\n")
+if __name__ == "__main__":
+    main()
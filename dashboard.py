@@ -0,0 +1,694 @@
+"""
+Dashboard metrics as a library.
+
+dashboard_data() returns every dashboard number as JSON-ready structured
+data; dashboard-data.py prints it, and serve() exposes it over HTTP so
+index.html, the kartel-dashboards extensions and the daily report can use
+the same numbers.
+
+Deals are kept in a columnar snapshot (deal_snapshot.py) saved between
+runs. Each run fetches only deals modified since the last one and applies
+them to the snapshot and to the running totals and weighted forecast cube
+(forecast_cube.py) stored with it (subtract the deal's old totals, add its
+new ones), so refresh cost follows the change rate rather than the portal
+size. Deletions don't show up as modifications, so the snapshot's deal ids
+are reconciled with an id-only list read every DEAL_RECONCILE_HOURS, or
+sooner when the deal count doesn't match. Deal lists are computed from the
+snapshot columns with vectorized masks.
+
+The HTTP server caches the computed JSON. Before recomputing it makes one
+cheap search call for the deal count and latest hs_lastmodifieddate, and
+only refetches deals when that changes (or the day rolls over), so many
+viewers cost one computation. Responses carry ETag/Last-Modified and
+answer conditional requests with 304.
+
+Requires numpy.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import requests
+
+# Shared search modules live with the Cloud Functions
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "cloud-functions"))
+import deal_funnel
+from crm_export import export_objects
+from deal_snapshot import DEAL_PROPERTIES, DealSnapshot
+from forecast_cube import ForecastCube, stage_probabilities
+from partitioned_search import search_all
+from snapshot_history import DATA_DIR, SnapshotHistory, open_value_by_tier
+
+TOKEN = os.environ.get("HUBSPOT_ACCESS_TOKEN", "")
+BASE = "https://api.hubapi.com"
+HEADERS = {
+    "Authorization": f"Bearer {TOKEN}",
+    "Content-Type": "application/json"
+}
+
+# Pipeline IDs
+PIPELINES = {
+    "enterprise": "1880222397",
+    "smb": "1880222398",
+    "client_delivery": "1880222399",
+    "reengagement": "1880222400"
+}
+
+PAGE_SIZE = 100
+
+# Search API can't page past this many results
+SEARCH_LIMIT = 10000
+
+# How far back past the last sync to look for modified deals
+SYNC_OVERLAP_MS = 5 * 60 * 1000
+
+# How often to reconcile the snapshot's deal ids with HubSpot's (catches
+# deletions that a matching count hides, e.g. one deleted and one created)
+RECONCILE_HOURS = float(os.environ.get("DEAL_RECONCILE_HOURS", "24"))
+
+BATCH_SIZE = 100
+
+# Persistent by default (data/ next to the scripts, shared with snapshot_history)
+SNAPSHOT_PATH = os.environ.get("DEAL_SNAPSHOT_PATH", os.path.join(DATA_DIR, "deal-snapshot.npz"))
+
+# Server: how often to ask HubSpot whether deals changed, and CORS origin
+# for browser clients on another port (unset = same-origin only)
+DASHBOARD_CHECK_SECONDS = int(os.environ.get("DASHBOARD_CHECK_SECONDS", "60"))
+DASHBOARD_CORS_ORIGIN = os.environ.get("DASHBOARD_CORS_ORIGIN", "")
+
+def search_deals(filters, properties=None):
+    """Search deals with given filter groups (every result, partitioned past the 10k search cap)"""
+    if properties is None:
+        properties = DEAL_PROPERTIES
+    return search_all("deals", filters, properties, HEADERS)
+
+def get_all_deals(properties=None, export=False):
+    """
+    Get all deals, following pagination (the list endpoint has no 10k search
+    cap), or with export=True through one CRM export job (crm_export.py)
+    """
+    if properties is None:
+        properties = DEAL_PROPERTIES
+    if export:
+        return export_objects("deals", properties)
+
+    deals = []
+    after = None
+    while True:
+        params = {"limit": PAGE_SIZE, "properties": ",".join(properties)}
+        if after:
+            params["after"] = after
+
+        r = requests.get(f"{BASE}/crm/v3/objects/deals", headers=HEADERS, params=params)
+        if r.status_code != 200:
+            raise Exception(f"Error fetching deals: {r.status_code} {r.text[:200]}")
+
+        data = r.json()
+        deals.extend(data.get("results", []))
+
+        after = data.get("paging", {}).get("next", {}).get("after")
+        if not after:
+            break
+
+    return deals
+
+# ============================================================
+# METRICS
+# ============================================================
+# Each helper reads one metric off the snapshot for the rows in `mask`.
+
+def total(snapshot, mask):
+    """Count and amount of the deals in mask"""
+    return {"count": int(mask.sum()), "amount": float(snapshot.columns["amount"][mask].sum())}
+
+
+def group_total(snapshot, column, mask, missing):
+    """{category: count and amount} of the deals in mask, `missing` for unset values"""
+    codes = snapshot.columns[column][mask] + 1  # unset (-1) -> 0
+    size = len(snapshot.categories[column]) + 1
+    counts = np.bincount(codes, minlength=size)
+    amounts = np.bincount(codes, weights=snapshot.columns["amount"][mask], minlength=size)
+
+    labels = [missing] + [str(c) for c in snapshot.categories[column]]
+    return {labels[i]: {"count": int(counts[i]), "amount": float(amounts[i])}
+            for i in np.flatnonzero(counts)}
+
+
+def top_n(snapshot, n, mask):
+    """The n largest deals in mask, largest first (ties keep fetch order)"""
+    indices = np.flatnonzero(mask)
+    order = np.argsort(-snapshot.columns["amount"][indices], kind="stable")[:n]
+    return snapshot.deals(indices[order])
+
+
+def collect(snapshot, rows, limit=None):
+    """
+    Deals at the given rows, in that order, with their count and total
+    amount. Only the first `limit` rows are built into Deals.
+    """
+    rows = np.asarray(rows, dtype=np.intp)
+    return {"deals": snapshot.deals(rows[:limit]), "count": len(rows),
+            "amount": float(snapshot.columns["amount"][rows].sum())}
+
+# ============================================================
+# RUNNING TOTALS
+# ============================================================
+# The dashboard's totals are kept in the snapshot's state and updated per
+# modified deal: subtract the totals of its old row, add those of its new
+# one. Pending payments are totalled per expected date, so the overdue total
+# (dates before today) stays correct as days pass without any deal changing.
+
+def pending_payments(snapshot):
+    """Mask of deals with an expected payment date and no payment received"""
+    return (~np.isnat(snapshot.columns["payment_expected_date"])
+            & np.isnat(snapshot.columns["payment_received_date"]))
+
+
+def aggregate(snapshot):
+    """Additive totals over every deal in the snapshot"""
+    is_open = snapshot.is_open()
+    pending = pending_payments(snapshot)
+
+    dates, codes = np.unique(snapshot.columns["payment_expected_date"][pending], return_inverse=True)
+    counts = np.bincount(codes, minlength=len(dates))
+    amounts = np.bincount(codes, weights=snapshot.columns["amount"][pending], minlength=len(dates))
+
+    return {
+        "open": total(snapshot, is_open),
+        "open_by_tier": group_total(snapshot, "tier", is_open, "unassigned"),
+        "won": total(snapshot, snapshot.isin("stage", ["closedwon"])),
+        "open_by_pipeline": group_total(snapshot, "pipeline", is_open, "unknown"),
+        "deals_by_pipeline": group_total(snapshot, "pipeline", np.ones(len(snapshot), dtype=bool), "unknown"),
+        "pending_payments_by_date": {str(date): {"count": int(count), "amount": float(amount)}
+                                     for date, count, amount in zip(dates, counts, amounts)},
+    }
+
+
+# Single totals; every other aggregate is {key: total}
+AGGREGATE_TOTALS = ["open", "won"]
+
+
+def _add_total(into, total, sign):
+    into["count"] += sign * total["count"]
+    into["amount"] += sign * total["amount"]
+    if into["count"] == 0:
+        into["amount"] = 0.0  # drop float drift from repeated add/subtract
+
+
+def apply_aggregates(aggregates, delta, sign=1):
+    """Add (sign=1) or subtract (sign=-1) `delta` totals into `aggregates` in place"""
+    for name, value in delta.items():
+        if name in AGGREGATE_TOTALS:
+            _add_total(aggregates.setdefault(name, {"count": 0, "amount": 0.0}), value, sign)
+            continue
+
+        groups = aggregates.setdefault(name, {})
+        for key, group_value in value.items():
+            group = groups.setdefault(key, {"count": 0, "amount": 0.0})
+            _add_total(group, group_value, sign)
+            if group["count"] == 0:
+                del groups[key]
+    return aggregates
+
+# ============================================================
+# DASHBOARD METRICS
+# ============================================================
+
+# Expected and overdue payments listed (the counts and amounts cover all of them)
+PAYMENTS_SHOWN = 10
+
+
+def dashboard_metrics(snapshot, today):
+    """
+    Every number on the dashboard, as of `today`. Totals come from the
+    snapshot's running totals when it has them; deal lists from its rows.
+    """
+    aggregates = snapshot.state.get("aggregates") or aggregate(snapshot)
+    today = today.date()
+
+    is_open = snapshot.is_open()
+
+    # Windowed lists are range queries on the snapshot's date indexes
+    received = snapshot.columns["payment_received_date"]
+
+    def unpaid(rows):
+        rows = np.asarray(rows, dtype=np.intp)
+        return rows[np.isnat(received[rows])]
+
+    expected = snapshot.date_index("payment_expected_date")
+    phase_3 = snapshot.date_index("phase_3_start_date")
+    renewal = snapshot.date_index("renewal_date")
+
+    today_str = today.isoformat()
+    pending_by_date = aggregates["pending_payments_by_date"]
+    expected_total = {"count": 0, "amount": 0.0}
+    overdue_total = {"count": 0, "amount": 0.0}
+    for date, date_total in pending_by_date.items():
+        _add_total(expected_total, date_total, 1)
+        if date < today_str:
+            _add_total(overdue_total, date_total, 1)
+
+    deals_by_pipeline = aggregates["deals_by_pipeline"]
+    no_deals = {"count": 0, "amount": 0.0}
+
+    metrics = {
+        # Executive
+        "open": aggregates["open"],
+        "open_by_tier": aggregates["open_by_tier"],
+        "won": aggregates["won"],
+        # Sales
+        "top_open": top_n(snapshot, 10, is_open),
+        "open_by_pipeline": aggregates["open_by_pipeline"],
+        # Cash flow
+        "expected_payments": {**collect(snapshot, unpaid(expected.between()), PAYMENTS_SHOWN), **expected_total},
+        "overdue_payments": {**collect(snapshot, unpaid(expected.before(today)), PAYMENTS_SHOWN), **overdue_total},
+        # Operations
+        "client_delivery": deals_by_pipeline.get(PIPELINES["client_delivery"], no_deals),
+        "phase_3_upcoming": collect(snapshot, phase_3.within_days(today, 60)),
+        "renewals_upcoming": collect(snapshot, renewal.within_days(today, 90)),
+        "reengagement": deals_by_pipeline.get(PIPELINES["reengagement"], no_deals),
+    }
+
+    # Weighted forecast, when the snapshot has a cube (see refresh_snapshot)
+    if snapshot.state.get("forecast"):
+        cube = ForecastCube.from_state(snapshot.state["forecast"])
+        metrics["forecast"] = {
+            "total": cube.get(),
+            "by_tier": cube.breakdown("tier"),
+            "by_pipeline": cube.breakdown("pipeline"),
+            "by_owner": cube.breakdown("owner"),
+            "by_close_month": cube.breakdown("close_month"),
+        }
+    return metrics
+
+# ============================================================
+# FUNNEL
+# ============================================================
+
+# Pipelines the funnel section covers
+FUNNEL_PIPELINES = [PIPELINES["enterprise"], PIPELINES["smb"]]
+
+
+def funnel_metrics(snapshot, pipeline_ids=None):
+    """
+    {pipeline id: funnel, stage durations and velocity} (deal_funnel) for the
+    snapshot's deals in the sales pipelines. Reads stage history from the
+    API, one batch call per 100 deals.
+    """
+    pipeline_ids = pipeline_ids or FUNNEL_PIPELINES
+    rows = np.flatnonzero(snapshot.isin("pipeline", pipeline_ids))
+    pipelines = deal_funnel.get_pipelines(pipeline_ids)
+    history = deal_funnel.get_stage_history(snapshot.columns["id"][rows].tolist(), pipelines)
+    return {pipeline_id: pipeline_history.summary() for pipeline_id, pipeline_history in history.items()}
+
+# ============================================================
+# TRENDS
+# ============================================================
+
+def pipeline_trend(history=None, today=None, days=90):
+    """
+    Open pipeline value by tier for each day recorded in the snapshot
+    history over the last `days`, and each tier's change since a week ago
+    (empty until the history reaches back a week).
+    """
+    history = history or SnapshotHistory()
+    today = today or date.today()
+    series = history.trend(open_value_by_tier, days=days, end=today)
+
+    latest = series[-1][1] if series else {}
+    week_ago = next((values for day, values in reversed(series) if day <= today - timedelta(days=7)), None)
+    change = {}
+    if week_ago is not None:
+        change = {tier: latest.get(tier, 0.0) - week_ago.get(tier, 0.0)
+                  for tier in sorted(set(latest) | set(week_ago))}
+
+    return {
+        "days": [{"day": day.isoformat(), "open_by_tier": values} for day, values in series],
+        "week_over_week": change,
+    }
+
+# ============================================================
+# SNAPSHOT SYNC
+# ============================================================
+
+def get_modified_deals(since_ms):
+    """
+    Deals modified at or after `since_ms` (epoch ms), or None when there
+    are more than the search API can page through.
+    """
+    deals = []
+    after = None
+    while True:
+        payload = {
+            "filterGroups": [{"filters": [
+                {"propertyName": "hs_lastmodifieddate", "operator": "GTE", "value": str(since_ms)}
+            ]}],
+            "properties": DEAL_PROPERTIES,
+            "sorts": [{"propertyName": "hs_lastmodifieddate", "direction": "ASCENDING"}],
+            "limit": PAGE_SIZE
+        }
+        if after:
+            payload["after"] = after
+
+        r = requests.post(f"{BASE}/crm/v3/objects/deals/search", headers=HEADERS, json=payload)
+        if r.status_code != 200:
+            raise Exception(f"Error searching modified deals: {r.status_code} {r.text[:200]}")
+
+        data = r.json()
+        if data.get("total", 0) > SEARCH_LIMIT:
+            return None
+        deals.extend(data.get("results", []))
+
+        after = data.get("paging", {}).get("next", {}).get("after")
+        if not after:
+            break
+
+    return deals
+
+
+def get_all_deal_ids():
+    """Every deal id, from the list endpoint (no search index lag, no 10k cap)"""
+    ids = []
+    after = None
+    while True:
+        params = {"limit": PAGE_SIZE, "properties": "hs_object_id"}
+        if after:
+            params["after"] = after
+
+        r = requests.get(f"{BASE}/crm/v3/objects/deals", headers=HEADERS, params=params)
+        if r.status_code != 200:
+            raise Exception(f"Error listing deal ids: {r.status_code} {r.text[:200]}")
+
+        data = r.json()
+        ids.extend(str(deal["id"]) for deal in data.get("results", []))
+
+        after = data.get("paging", {}).get("next", {}).get("after")
+        if not after:
+            break
+
+    return ids
+
+
+def get_deals_by_id(deal_ids):
+    """Deals with DEAL_PROPERTIES, read 100 at a time"""
+    deals = []
+    for i in range(0, len(deal_ids), BATCH_SIZE):
+        r = requests.post(
+            f"{BASE}/crm/v3/objects/deals/batch/read",
+            headers=HEADERS,
+            json={"inputs": [{"id": deal_id} for deal_id in deal_ids[i:i + BATCH_SIZE]],
+                  "properties": DEAL_PROPERTIES}
+        )
+        # 207 = some ids not found (deleted since they were listed)
+        if r.status_code not in [200, 207]:
+            raise Exception(f"Error reading deals: {r.status_code} {r.text[:200]}")
+        deals.extend(r.json().get("results", []))
+    return deals
+
+
+def get_stage_probabilities():
+    """({stage id: probability}, closed stage ids) for every deal pipeline stage"""
+    return stage_probabilities(deal_funnel.get_pipelines())
+
+
+def fetch_snapshot(export=False):
+    """Fetch all deals into a snapshot with fresh totals and save it to SNAPSHOT_PATH"""
+    started_ms = int(time.time() * 1000)
+    snapshot = DealSnapshot.from_deals(get_all_deals(export=export))
+    forecast = ForecastCube.build(snapshot, get_stage_probabilities())
+    snapshot.state = {"synced_at_ms": started_ms, "reconciled_at_ms": started_ms,
+                      "aggregates": aggregate(snapshot), "forecast": forecast.to_state()}
+    snapshot.save(SNAPSHOT_PATH)
+    return snapshot
+
+
+def _apply_deals(snapshot, aggregates, forecast, deals):
+    """Upsert new versions of deals, updating the running totals and forecast"""
+    # A deal edited mid-paging can come back twice; keep its latest version
+    deals = list({deal["id"]: deal for deal in deals}.values())
+    delta = DealSnapshot.from_deals(deals)
+    rows, _ = snapshot.find(delta.columns["id"])
+    old = snapshot.take(rows)
+    apply_aggregates(aggregates, aggregate(old), -1)
+    apply_aggregates(aggregates, aggregate(delta), 1)
+    if forecast:
+        forecast.apply(old, -1).apply(delta, 1)
+    return snapshot.upsert(delta)
+
+
+def _remove_deals(snapshot, aggregates, forecast, deal_ids):
+    """Drop deals, subtracting them from the running totals and forecast"""
+    rows, _ = snapshot.find(deal_ids)
+    old = snapshot.take(rows)
+    apply_aggregates(aggregates, aggregate(old), -1)
+    if forecast:
+        forecast.apply(old, -1)
+    keep = np.ones(len(snapshot), dtype=bool)
+    keep[rows] = False
+    return snapshot.take(np.flatnonzero(keep))
+
+
+def reconcile_ids(snapshot, aggregates, forecast):
+    """
+    Match the snapshot's deals to HubSpot's deal ids: drop deleted deals and
+    read deals it's missing (e.g. created but not yet in the search index).
+    Returns (snapshot, removed count, added count).
+    """
+    ids = np.array(get_all_deal_ids(), dtype=str)
+    removed = np.setdiff1d(snapshot.columns["id"], ids)
+    missing = np.setdiff1d(ids, snapshot.columns["id"])
+
+    if len(removed):
+        snapshot = _remove_deals(snapshot, aggregates, forecast, removed)
+    if len(missing):
+        added = get_deals_by_id(missing.tolist())
+        if added:
+            snapshot = _apply_deals(snapshot, aggregates, forecast, added)
+    return snapshot, len(removed), len(missing)
+
+
+def refresh_snapshot():
+    """
+    The saved snapshot brought up to date by applying only the deals
+    modified since its last sync. Deal ids are reconciled (deleted deals
+    dropped, missing ones read) every RECONCILE_HOURS or when the deal count
+    doesn't match. Falls back to fetch_snapshot() when there is no saved
+    snapshot or too many deals changed to search.
+    """
+    if not os.path.exists(SNAPSHOT_PATH):
+        return fetch_snapshot()
+
+    snapshot = DealSnapshot.load(SNAPSHOT_PATH)
+    aggregates = snapshot.state.get("aggregates")
+    synced_ms = snapshot.state.get("synced_at_ms")
+    if aggregates is None or synced_ms is None:
+        return fetch_snapshot()
+
+    # Overlap the last sync a little: the search index lags writes, and
+    # re-applying an unchanged deal is a no-op
+    started_ms = int(time.time() * 1000)
+    modified = get_modified_deals(synced_ms - SYNC_OVERLAP_MS)
+    if modified is None:
+        print("Too many modified deals to sync; fetching all deals")
+        return fetch_snapshot()
+
+    # The forecast is rebuilt from the snapshot if stage probabilities or
+    # closed stages changed
+    stages = get_stage_probabilities()
+    forecast = None
+    saved = snapshot.state.get("forecast", {})
+    if (saved.get("probabilities"), saved.get("closed")) == stages:
+        forecast = ForecastCube.from_state(saved)
+
+    if modified:
+        snapshot = _apply_deals(snapshot, aggregates, forecast, modified)
+
+    reconciled_ms = snapshot.state.get("reconciled_at_ms") or 0
+    deal_count, _ = deal_data_version()
+    reason = None
+    if started_ms - reconciled_ms >= RECONCILE_HOURS * 3600 * 1000:
+        reason = "scheduled"
+    elif deal_count != len(snapshot):
+        reason = f"snapshot has {len(snapshot)} deals, search has {deal_count}"
+    if reason:
+        snapshot, removed, added = reconcile_ids(snapshot, aggregates, forecast)
+        reconciled_ms = started_ms
+        print(f"Reconciled deal ids ({reason}): {removed} removed, {added} added")
+
+    if forecast is None:
+        forecast = ForecastCube.build(snapshot, stages)
+
+    snapshot.fetched_at = datetime.now()
+    snapshot.state = {"synced_at_ms": started_ms, "reconciled_at_ms": reconciled_ms,
+                      "aggregates": aggregates, "forecast": forecast.to_state()}
+    snapshot.save(SNAPSHOT_PATH)
+    print(f"Applied {len(modified)} modified deals to the snapshot")
+    return snapshot
+
+# ============================================================
+# STRUCTURED DATA
+# ============================================================
+
+def _to_json(value):
+    if hasattr(value, "_asdict"):  # Deal rows
+        return value._asdict()
+    if isinstance(value, dict):
+        return {key: _to_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_to_json(item) for item in value]
+    return value
+
+
+def dashboard_data(snapshot=None, today=None):
+    """
+    Every dashboard metric as JSON-ready data (see dashboard_metrics for the
+    keys; deal rows become dicts). Refreshes the saved snapshot if none is given.
+    """
+    if snapshot is None:
+        snapshot = refresh_snapshot()
+    today = today or datetime.now()
+
+    return {
+        "as_of": today.strftime("%Y-%m-%d"),
+        "snapshot_fetched_at": snapshot.fetched_at.isoformat(timespec="seconds"),
+        "deal_count": len(snapshot),
+        "pipelines": PIPELINES,
+        "metrics": _to_json(dashboard_metrics(snapshot, today)),
+    }
+
+# ============================================================
+# CACHED JSON ENDPOINT
+# ============================================================
+
+def deal_data_version():
+    """
+    (deal count, latest hs_lastmodifieddate): one search call that changes
+    whenever a deal is created, edited or deleted.
+    """
+    r = requests.post(f"{BASE}/crm/v3/objects/deals/search", headers=HEADERS, json={
+        "filterGroups": [],
+        "properties": ["hs_lastmodifieddate"],
+        "sorts": [{"propertyName": "hs_lastmodifieddate", "direction": "DESCENDING"}],
+        "limit": 1
+    })
+    if r.status_code != 200:
+        raise Exception(f"Error checking deals: {r.status_code} {r.text[:200]}")
+
+    data = r.json()
+    results = data.get("results", [])
+    latest = results[0]["properties"].get("hs_lastmodifieddate") if results else None
+    return data.get("total", 0), latest
+
+
+def snapshot_file_version():
+    """Version for serving the saved snapshot: its modification time"""
+    return os.path.getmtime(SNAPSHOT_PATH)
+
+
+class MetricsCache:
+    """
+    The dashboard JSON, recomputed only when `version()` changes or the day
+    rolls over. `version()` is checked at most every `check_seconds`.
+    Concurrent callers wait for one computation.
+    """
+
+    def __init__(self, load_snapshot=refresh_snapshot, version=deal_data_version,
+                 check_seconds=DASHBOARD_CHECK_SECONDS):
+        self.load_snapshot = load_snapshot
+        self.version = version
+        self.check_seconds = check_seconds
+        self.lock = threading.Lock()
+        self.key = None
+        self.checked_at = 0.0
+        self.body = None
+        self.etag = None
+        self.last_modified = None
+
+    def get(self):
+        """(JSON body bytes, ETag, Last-Modified timestamp)"""
+        with self.lock:
+            if self.body is None or time.monotonic() - self.checked_at >= self.check_seconds:
+                key = (self.version(), datetime.now().strftime("%Y-%m-%d"))
+                self.checked_at = time.monotonic()
+                if key != self.key:
+                    self._compute()
+                    self.key = key
+            return self.body, self.etag, self.last_modified
+
+    def _compute(self):
+        data = dashboard_data(self.load_snapshot())
+        body = json.dumps(data, sort_keys=True).encode()
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if etag != self.etag:
+            self.body, self.etag = body, etag
+            self.last_modified = int(time.time())  # whole seconds, as the header carries
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """GET /metrics (or /) -> dashboard JSON from the server's MetricsCache"""
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ["/", "/metrics"]:
+            self.send_error(404)
+            return
+
+        try:
+            body, etag, last_modified = self.server.cache.get()
+        except Exception as e:
+            print(f"Error computing dashboard metrics: {e}")
+            self.send_error(502, "Could not load deal data")
+            return
+
+        if self._not_modified(etag, last_modified):
+            self.send_response(304)
+            self._send_cache_headers(etag, last_modified)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self._send_cache_headers(etag, last_modified)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_modified(self, etag, last_modified):
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match:
+            return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                return last_modified <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _send_cache_headers(self, etag, last_modified):
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", formatdate(last_modified, usegmt=True))
+        self.send_header("Cache-Control", "no-cache")  # revalidate with the ETag
+        if DASHBOARD_CORS_ORIGIN:
+            self.send_header("Access-Control-Allow-Origin", DASHBOARD_CORS_ORIGIN)
+
+
+def serve(port=8050, host="127.0.0.1", cache=None):
+    """Serve the dashboard JSON at http://host:port/metrics until interrupted"""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.cache = cache or MetricsCache()
+    print(f"Serving dashboard metrics on http://{host}:{port}/metrics")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
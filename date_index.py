@@ -0,0 +1,63 @@
+"""
+Sorted date index for "deals with X between d1 and d2" queries.
+
+Build once per deal set (one sort), then each range query is two bisects
+plus the k matching rows: O(log n + k) instead of a scan over every deal.
+Rows can be anything (snapshot row numbers, deal dicts); rows with no
+date are left out.
+
+Used by the dashboard (DealSnapshot.date_index) and daily-crm-sync.py's
+renewal reminders.
+"""
+
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from typing import Any, Callable, Iterable, List, Optional
+
+
+def parse_date(value: Any) -> Optional[date]:
+    """Date from a HubSpot date or datetime string ("2026-03-01", "2026-03-01T00:00:00Z"); None if unset or invalid."""
+    if not value:
+        return None
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+class DateIndex:
+    """Rows sorted by date; dates ascending, rows in the same order"""
+
+    def __init__(self, dates: List[date], rows: List[Any]):
+        self.dates = dates
+        self.rows = rows
+
+    @classmethod
+    def build(cls, items: Iterable[Any], date_of: Callable[[Any], Any]) -> "DateIndex":
+        """Index items by date_of(item) (parsed with parse_date). Ties keep input order."""
+        dated = [(parse_date(date_of(item)), item) for item in items]
+        dated = sorted((pair for pair in dated if pair[0] is not None), key=lambda pair: pair[0])
+        return cls([d for d, _ in dated], [item for _, item in dated])
+
+    def __len__(self):
+        return len(self.dates)
+
+    def between(self, start: Optional[date] = None, end: Optional[date] = None) -> List[Any]:
+        """Rows dated start..end inclusive (either end open if None), in date order"""
+        lo = bisect_left(self.dates, start) if start is not None else 0
+        hi = bisect_right(self.dates, end) if end is not None else len(self.dates)
+        return self.rows[lo:hi]
+
+    def on(self, day: date) -> List[Any]:
+        """Rows dated exactly `day`"""
+        return self.between(day, day)
+
+    def before(self, day: date) -> List[Any]:
+        """Rows dated strictly before `day`"""
+        return self.between(None, day - timedelta(days=1))
+
+    def within_days(self, today: date, days: int) -> List[Any]:
+        """Rows dated today..today+days inclusive"""
+        return self.between(today, today + timedelta(days=days))
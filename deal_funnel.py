@@ -0,0 +1,270 @@
+"""
+Stage-duration and funnel analytics from HubSpot's stage history.
+
+HubSpot records when a deal enters and leaves each stage in the
+hs_date_entered_<stage id> / hs_date_exited_<stage id> properties. There's
+no wildcard for them, so the exact names come from the pipelines API and
+are requested with batch reads, 100 deals at a time.
+
+Per pipeline, the history becomes two (deals x stages) datetime64 matrices,
+and everything below is computed over all deals at once:
+
+- time in stage: days from entering to leaving each stage (median, p75,
+  p90, mean), for deals that have left it
+- funnel: deals that reached each stage or a later one (stages in display
+  order, lost stages left out) and the conversion from one stage to the next
+- win rate, median days from first stage to won, and velocity
+  (open deals x average won amount x win rate / median cycle days, in $/day)
+- stalled deals: open deals that entered their current stage N+ days ago
+
+Used by dashboard-data.py (funnel section) and daily-crm-sync.py (stall
+detection).
+
+Requires numpy.
+"""
+
+import os
+from datetime import datetime
+from typing import List, NamedTuple
+
+import numpy as np
+import requests
+
+TOKEN = os.environ.get("HUBSPOT_ACCESS_TOKEN", "")
+BASE = "https://api.hubapi.com"
+HEADERS = {
+    "Authorization": f"Bearer {TOKEN}",
+    "Content-Type": "application/json"
+}
+
+BATCH_SIZE = 100
+
+DAY = np.timedelta64(1, "D")
+
+
+class Stage(NamedTuple):
+    id: str
+    label: str
+    probability: float
+    is_closed: bool
+
+    @property
+    def is_won(self):
+        return self.is_closed and self.probability >= 1
+
+    @property
+    def is_lost(self):
+        return self.is_closed and self.probability <= 0
+
+
+class Pipeline(NamedTuple):
+    id: str
+    label: str
+    stages: List[Stage]  # display order
+
+
+def get_pipelines(pipeline_ids=None):
+    """Deal pipelines with their stages in display order (only `pipeline_ids` if given)"""
+    response = requests.get(f"{BASE}/crm/v3/pipelines/deals", headers=HEADERS)
+    if response.status_code != 200:
+        raise Exception(f"Error fetching pipelines: {response.status_code} {response.text[:200]}")
+
+    pipelines = []
+    for pipeline in response.json().get("results", []):
+        if pipeline_ids and pipeline["id"] not in pipeline_ids:
+            continue
+        stages = []
+        for stage in sorted(pipeline.get("stages", []), key=lambda s: s.get("displayOrder", 0)):
+            metadata = stage.get("metadata", {})
+            stages.append(Stage(
+                id=stage["id"],
+                label=stage.get("label", stage["id"]),
+                probability=float(metadata.get("probability") or 0),
+                is_closed=str(metadata.get("isClosed", "false")).lower() == "true",
+            ))
+        pipelines.append(Pipeline(pipeline["id"], pipeline.get("label", pipeline["id"]), stages))
+    return pipelines
+
+
+def stage_properties(pipelines):
+    """Exact hs_date_entered_/hs_date_exited_ property names for every stage"""
+    properties = []
+    for pipeline in pipelines:
+        for stage in pipeline.stages:
+            properties += [f"hs_date_entered_{stage.id}", f"hs_date_exited_{stage.id}"]
+    return properties
+
+
+def to_timestamps(values):
+    """datetime64[s] column from HubSpot datetime strings, NaT where empty or invalid"""
+    column = np.full(len(values), np.datetime64("NaT", "s"))
+    for i, value in enumerate(values):
+        if value:
+            try:
+                column[i] = np.datetime64(value.rstrip("Z")[:19], "s")
+            except ValueError:
+                pass
+    return column
+
+
+class PipelineHistory:
+    """Stage history of one pipeline's deals (see module docstring)"""
+
+    def __init__(self, pipeline, deals):
+        self.pipeline = pipeline
+        self.stages = pipeline.stages
+        props = [deal.get("properties", {}) for deal in deals]
+
+        self.ids = np.array([str(deal.get("id")) for deal in deals], dtype=str)
+        self.amount = np.array([_to_float(p.get("amount")) for p in props])
+
+        stage_ids = [stage.id for stage in self.stages]
+        self.stage_index = np.array(
+            [stage_ids.index(p.get("dealstage")) if p.get("dealstage") in stage_ids else -1 for p in props],
+            dtype=np.intp,
+        )
+
+        shape = (len(deals), len(self.stages))
+        self.entered = np.full(shape, np.datetime64("NaT", "s"))
+        self.exited = np.full(shape, np.datetime64("NaT", "s"))
+        for j, stage in enumerate(self.stages):
+            self.entered[:, j] = to_timestamps([p.get(f"hs_date_entered_{stage.id}") for p in props])
+            self.exited[:, j] = to_timestamps([p.get(f"hs_date_exited_{stage.id}") for p in props])
+
+        self.won_stages = np.array([stage.is_won for stage in self.stages], dtype=bool)
+        self.lost_stages = np.array([stage.is_lost for stage in self.stages], dtype=bool)
+        self.closed_stages = np.array([stage.is_closed for stage in self.stages], dtype=bool)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _current(self, stage_mask):
+        """Mask of deals currently in one of the stages in stage_mask"""
+        known = self.stage_index >= 0
+        mask = np.zeros(len(self), dtype=bool)
+        mask[known] = stage_mask[self.stage_index[known]]
+        return mask
+
+    def time_in_stage(self):
+        """{stage id: count, median/p75/p90/mean days} for deals that have left the stage"""
+        days = (self.exited - self.entered) / DAY  # NaN unless both are set
+        result = {}
+        for j, stage in enumerate(self.stages):
+            done = days[:, j][~np.isnan(days[:, j])]
+            if not len(done):
+                result[stage.id] = {"count": 0, "median": None, "p75": None, "p90": None, "mean": None}
+                continue
+            median, p75, p90 = np.percentile(done, [50, 75, 90])
+            result[stage.id] = {"count": int(len(done)), "median": float(median), "p75": float(p75),
+                                "p90": float(p90), "mean": float(done.mean())}
+        return result
+
+    def funnel(self):
+        """
+        [(stage, deals that reached it or a later stage, conversion to the
+        next stage)] over the non-lost stages in display order
+        """
+        columns = np.flatnonzero(~self.lost_stages)
+        reached = ~np.isnat(self.entered[:, columns])
+        # A deal that skipped a stage still passed through it
+        reached_or_later = np.logical_or.accumulate(reached[:, ::-1], axis=1)[:, ::-1]
+        counts = reached_or_later.sum(axis=0)
+
+        steps = []
+        for k, j in enumerate(columns):
+            conversion = None
+            if k + 1 < len(columns) and counts[k]:
+                conversion = float(counts[k + 1] / counts[k])
+            steps.append((self.stages[j], int(counts[k]), conversion))
+        return steps
+
+    def velocity(self):
+        """Win rate, median days to win, and pipeline velocity ($/day)"""
+        won = self._current(self.won_stages)
+        lost = self._current(self.lost_stages)
+        is_open = (self.stage_index >= 0) & ~self._current(self.closed_stages)
+
+        closed = won.sum() + lost.sum()
+        win_rate = float(won.sum() / closed) if closed else None
+
+        # Cycle: first stage entry to entering the won stage
+        seconds = self.entered.astype("int64").astype(float)
+        seconds[np.isnat(self.entered)] = np.nan
+        won_rows = np.flatnonzero(won)
+        cycle_days = None
+        if len(won_rows):
+            first = np.fmin.reduce(seconds[won_rows], axis=1)  # ignores NaN
+            won_at = seconds[won_rows, self.stage_index[won_rows]]
+            cycles = (won_at - first) / 86400
+            cycles = cycles[~np.isnan(cycles)]
+            cycle_days = float(np.median(cycles)) if len(cycles) else None
+
+        average_won = float(self.amount[won].mean()) if won.any() else None
+        velocity = None
+        if win_rate and cycle_days and average_won:
+            velocity = float(is_open.sum() * average_won * win_rate / cycle_days)
+
+        return {"open": int(is_open.sum()), "won": int(won.sum()), "lost": int(lost.sum()),
+                "win_rate": win_rate, "median_cycle_days": cycle_days,
+                "average_won_amount": average_won, "velocity_per_day": velocity}
+
+    def stalled(self, min_days, now=None):
+        """[(deal id, stage, days in stage)] for open deals in their current stage min_days+ days"""
+        now = np.datetime64(now or datetime.now(), "s")
+        rows = np.flatnonzero((self.stage_index >= 0) & ~self._current(self.closed_stages))
+        entered = self.entered[rows, self.stage_index[rows]]
+        days = (now - entered) / DAY
+        keep = days >= min_days  # NaN (no entry date) compares False
+        return [(str(self.ids[i]), self.stages[self.stage_index[i]], int(d))
+                for i, d in zip(rows[keep], days[keep])]
+
+    def summary(self):
+        """JSON-ready funnel, stage durations and velocity"""
+        durations = self.time_in_stage()
+        in_stage = np.bincount(self.stage_index[self.stage_index >= 0], minlength=len(self.stages))
+        stage_position = {stage.id: j for j, stage in enumerate(self.stages)}
+        return {
+            "label": self.pipeline.label,
+            "deals": len(self),
+            "stages": [
+                {"id": stage.id, "label": stage.label, "reached": reached,
+                 "conversion_to_next": conversion, "in_stage": int(in_stage[stage_position[stage.id]]),
+                 "days": durations[stage.id]}
+                for stage, reached, conversion in self.funnel()
+            ],
+            **self.velocity(),
+        }
+
+
+def _to_float(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def get_stage_history(deal_ids, pipelines):
+    """
+    {pipeline id: PipelineHistory} for the given deals, read in batches with
+    every stage's entered/exited property. Deals in other pipelines are dropped.
+    """
+    properties = ["dealstage", "pipeline", "amount", *stage_properties(pipelines)]
+    deal_ids = list(deal_ids)
+
+    deals = []
+    for i in range(0, len(deal_ids), BATCH_SIZE):
+        response = requests.post(
+            f"{BASE}/crm/v3/objects/deals/batch/read",
+            headers=HEADERS,
+            json={"inputs": [{"id": deal_id} for deal_id in deal_ids[i:i + BATCH_SIZE]],
+                  "properties": properties}
+        )
+        # 207 = some ids not found
+        if response.status_code not in [200, 207]:
+            raise Exception(f"Error reading deal stage history: {response.status_code} {response.text[:200]}")
+        deals.extend(response.json().get("results", []))
+
+    by_pipeline = {}
+    for deal in deals:
+        by_pipeline.setdefault(deal.get("properties", {}).get("pipeline"), []).append(deal)
+    return {pipeline.id: PipelineHistory(pipeline, by_pipeline.get(pipeline.id, [])) for pipeline in pipelines}
@@ -0,0 +1,269 @@
+"""
+Columnar deal snapshot.
+
+Fetched deals are converted once into typed NumPy columns so reports can
+use vectorized masks and group-bys instead of re-parsing property dicts:
+
+- amount: float64 (0 where unset, as the dashboards have always counted it)
+- dates: datetime64[D] (NaT where unset or unparseable)
+- stage, pipeline, tier, owner: int32 codes into a sorted category list
+  (-1 where unset)
+- id, name: fixed-width strings
+
+A snapshot saves to a single .npz file and loads back without touching
+the HubSpot API. Along with the columns it carries `state`, a JSON dict
+for whatever the caller keeps in step with the deals (the dashboard's
+sync cursor and running totals), so both are saved atomically together.
+
+Modified deals are merged in with upsert(), which replaces rows by id.
+Date range queries go through date_index(), built once per snapshot.
+
+Requires numpy.
+"""
+
+import json
+import os
+from datetime import datetime
+from typing import NamedTuple
+
+import numpy as np
+
+from date_index import DateIndex
+
+# Deal properties a snapshot needs from the API
+DEAL_PROPERTIES = ["dealname", "amount", "dealstage", "pipeline", "closedate",
+                   "hubspot_owner_id", "deal_tier", "payment_expected_date",
+                   "payment_received_date", "phase_3_start_date", "renewal_date"]
+
+# Column name -> HubSpot property
+CATEGORY_COLUMNS = {
+    "stage": "dealstage",
+    "pipeline": "pipeline",
+    "tier": "deal_tier",
+    "owner": "hubspot_owner_id",
+}
+DATE_COLUMNS = {
+    "closedate": "closedate",
+    "payment_expected_date": "payment_expected_date",
+    "payment_received_date": "payment_received_date",
+    "phase_3_start_date": "phase_3_start_date",
+    "renewal_date": "renewal_date",
+}
+
+CLOSED_STAGES = ["closedwon", "closedlost"]
+
+NAT = np.datetime64("NaT", "D")
+
+
+class Deal(NamedTuple):
+    """One snapshot row, for printing"""
+    id: str
+    name: str
+    amount: float
+    stage: str
+    pipeline: str
+    tier: str
+    owner: str
+    closedate: str  # YYYY-MM-DD, "" if unset
+    payment_expected_date: str
+    payment_received_date: str
+    phase_3_start_date: str
+    renewal_date: str
+
+
+def to_amounts(values):
+    """float64 column, 0 where empty or not a number"""
+    column = np.zeros(len(values))
+    for i, value in enumerate(values):
+        try:
+            column[i] = float(value or 0)
+        except (TypeError, ValueError):
+            pass
+    return column
+
+
+def to_dates(values):
+    """datetime64[D] column from ISO date/datetime strings, NaT where empty or invalid"""
+    days = [value[:10] if value else "NaT" for value in values]
+    try:
+        return np.array(days, dtype="datetime64[D]")
+    except ValueError:
+        pass
+
+    # Some value isn't a date; parse one by one
+    column = np.full(len(days), NAT)
+    for i, day in enumerate(days):
+        try:
+            column[i] = np.datetime64(day, "D")
+        except ValueError:
+            pass
+    return column
+
+
+def to_categorical(values):
+    """(int32 codes, sorted categories); code -1 where the value is empty"""
+    keys = np.array([str(value) if value else "" for value in values], dtype=str)
+    if not len(keys):
+        return np.array([], dtype=np.int32), np.array([], dtype=str)
+
+    categories, codes = np.unique(keys, return_inverse=True)
+    codes = codes.astype(np.int32)
+    # "" sorts first, so dropping it shifts unset values to -1
+    if categories[0] == "":
+        categories = categories[1:]
+        codes -= 1
+    return codes, categories
+
+
+def _remap(codes, categories, merged):
+    """Codes into `categories` -> codes into `merged` (a superset); -1 stays -1"""
+    if not len(categories):
+        return codes
+    mapping = np.searchsorted(merged, categories).astype(np.int32)
+    return np.where(codes >= 0, mapping[codes], -1).astype(np.int32)
+
+
+class DealSnapshot:
+    """Deals as typed columns (see module docstring)"""
+
+    def __init__(self, columns, categories, fetched_at, state=None):
+        self.columns = columns
+        self.categories = categories
+        self.fetched_at = fetched_at
+        self.state = state or {}
+        self._date_indexes = {}
+
+    @classmethod
+    def from_deals(cls, deals, fetched_at=None):
+        """Build from HubSpot deal objects ({"id", "properties"})"""
+        props = [deal.get("properties", {}) for deal in deals]
+
+        def prop(name):
+            return [p.get(name) or None for p in props]
+
+        columns = {
+            "id": np.array([str(deal.get("id")) for deal in deals], dtype=str),
+            "name": np.array([name or "" for name in prop("dealname")], dtype=str),
+            "amount": to_amounts(prop("amount")),
+        }
+        categories = {}
+        for column, name in CATEGORY_COLUMNS.items():
+            columns[column], categories[column] = to_categorical(prop(name))
+        for column, name in DATE_COLUMNS.items():
+            columns[column] = to_dates(prop(name))
+
+        return cls(columns, categories, fetched_at or datetime.now())
+
+    def __len__(self):
+        return len(self.columns["id"])
+
+    def code(self, column, value):
+        """Category code for a value (-1 if no deal has it)"""
+        categories = self.categories[column]
+        i = np.searchsorted(categories, value)
+        return int(i) if i < len(categories) and categories[i] == value else -1
+
+    def isin(self, column, values):
+        """Mask of deals whose category column is one of `values`"""
+        codes = [self.code(column, value) for value in values]
+        return np.isin(self.columns[column], [c for c in codes if c >= 0])
+
+    def labels(self, column, missing=""):
+        """Category column as strings, `missing` where unset"""
+        labels = np.append(self.categories[column], missing).astype(object)
+        return labels[self.columns[column]]  # -1 picks `missing`
+
+    def find(self, ids):
+        """(row indices, found mask) for deal ids; rows only cover the ids found"""
+        ids = np.asarray(ids, dtype=str)
+        if not len(self):
+            return np.array([], dtype=np.intp), np.zeros(len(ids), dtype=bool)
+
+        order = np.argsort(self.columns["id"], kind="stable")
+        sorted_ids = self.columns["id"][order]
+        at = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+        found = sorted_ids[at] == ids
+        return order[at[found]], found
+
+    def take(self, rows):
+        """Snapshot of just the given rows (same categories, no state)"""
+        columns = {name: column[rows] for name, column in self.columns.items()}
+        return DealSnapshot(columns, self.categories, self.fetched_at)
+
+    def upsert(self, other):
+        """
+        New snapshot with `other`'s deals replacing ours by id, and deals we
+        don't have appended. Category codes are remapped to the merged
+        category lists. State is kept.
+        """
+        rows, found = self.find(other.columns["id"])
+        columns = {}
+        categories = {}
+
+        for name, column in self.columns.items():
+            theirs = other.columns[name]
+            if name in CATEGORY_COLUMNS:
+                merged = np.union1d(self.categories[name], other.categories[name])
+                categories[name] = merged
+                column = _remap(column, self.categories[name], merged)
+                theirs = _remap(theirs, other.categories[name], merged)
+
+            combined = np.concatenate([column, theirs[~found]]).astype(
+                np.promote_types(column.dtype, theirs.dtype))
+            combined[rows] = theirs[found]
+            columns[name] = combined
+
+        return DealSnapshot(columns, categories, other.fetched_at, self.state)
+
+    def date_index(self, column):
+        """DateIndex of row numbers by a date column (built on first use)"""
+        if column not in self._date_indexes:
+            dates = self.columns[column]
+            order = np.argsort(dates, kind="stable")  # NaT sorts last
+            order = order[:np.count_nonzero(~np.isnat(dates))]
+            self._date_indexes[column] = DateIndex(dates[order].tolist(), order.tolist())
+        return self._date_indexes[column]
+
+    def is_open(self, closed_stages=CLOSED_STAGES):
+        """Mask of deals with a stage that isn't one of `closed_stages`"""
+        return (self.columns["stage"] >= 0) & ~self.isin("stage", closed_stages)
+
+    def deals(self, indices):
+        """Deal rows for the given row indices, in that order"""
+        indices = np.asarray(indices, dtype=np.intp)
+        fields = {
+            "id": self.columns["id"][indices].tolist(),
+            "name": self.columns["name"][indices].tolist(),
+            "amount": self.columns["amount"][indices].tolist(),
+        }
+        for column in CATEGORY_COLUMNS:
+            labels = np.append(self.categories[column], "")
+            fields[column] = labels[self.columns[column][indices]].tolist()
+        for column in DATE_COLUMNS:
+            dates = self.columns[column][indices]
+            fields[column] = np.where(np.isnat(dates), "", dates.astype(str)).tolist()
+        return [Deal(*row) for row in zip(*(fields[name] for name in Deal._fields))]
+
+    def save(self, path):
+        """Write to a .npz file (replaced atomically)"""
+        arrays = dict(self.columns)
+        for column, categories in self.categories.items():
+            arrays[f"{column}_categories"] = categories
+        arrays["fetched_at"] = np.array(np.datetime64(self.fetched_at, "s"))
+        arrays["state"] = np.array(json.dumps(self.state))
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {name: data[name] for name in data.files}
+
+        fetched_at = arrays.pop("fetched_at").item()
+        state = json.loads(arrays.pop("state").item()) if "state" in arrays else {}
+        categories = {column: arrays.pop(f"{column}_categories") for column in CATEGORY_COLUMNS}
+        return cls(arrays, categories, fetched_at, state)
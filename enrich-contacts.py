@@ -3,7 +3,10 @@
 Contact Enrichment Script
 Enriches HubSpot contacts with Apollo.io data and sets lead_tier for routing.
 
-Usage: python3 enrich-contacts.py [--dry-run]
+Usage: python3 enrich-contacts.py [--dry-run] [--limit N]
+
+Each run enriches at most --limit contacts (default 100), since every
+contact costs an Apollo match.
 """
 
 import os
@@ -12,27 +15,31 @@ import json
 import requests
 from time import sleep
 
+# Shared routing modules live with the Cloud Functions
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "cloud-functions"))
+import routing
+from industry_mapper import map_industry
+from partitioned_search import search_all
+from size_buckets import numemployees_label
+from title_classifier import is_senior_title
+
 # API Keys
 HUBSPOT_TOKEN = os.environ.get("HUBSPOT_ACCESS_TOKEN", "")
 APOLLO_KEY = os.environ.get("APOLLO_API_KEY", "")
 
-# Routing thresholds
-ENTERPRISE_REVENUE = 50_000_000  # $50M
-ENTERPRISE_EMPLOYEES = 500
-MID_MARKET_REVENUE = 10_000_000  # $10M
-MID_MARKET_EMPLOYEES = 100
-
-# Senior titles for routing
-SENIOR_TITLES = ["ceo", "cmo", "cfo", "coo", "cto", "vp", "president", "director", "head of", "chief", "founder", "owner"]
+# Owner and tier routing rules (cloud-functions/routing_rules.json)
+routing_engine = routing.get_engine()
 
 # Owner IDs
-OWNER_BEN = "159215803"
-OWNER_EMMET = "160266467"
+OWNER_BEN = routing_engine.owner_ids()["ben"]
+OWNER_EMMET = routing_engine.owner_ids()["emmet"]
 
+# Contacts enriched per run (each one is an Apollo call)
+DEFAULT_LIMIT = 100
 
-def get_contacts_to_enrich():
-    """Get contacts missing company revenue data."""
-    url = "https://api.hubapi.com/crm/v3/objects/contacts/search"
+
+def get_contacts_to_enrich(limit=DEFAULT_LIMIT):
+    """Get up to `limit` contacts missing company revenue data."""
     headers = {
         "Authorization": f"Bearer {HUBSPOT_TOKEN}",
         "Content-Type": "application/json"
@@ -46,17 +53,16 @@ def get_contacts_to_enrich():
                 "operator": "NOT_HAS_PROPERTY"
             }]
         }],
-        "properties": ["email", "firstname", "lastname", "company", "jobtitle", "annualrevenue", "numemployees", "lead_tier", "hubspot_owner_id"],
-        "limit": 100
+        "properties": ["email", "firstname", "lastname", "company", "jobtitle", "annualrevenue", "numemployees", "lead_tier", "hubspot_owner_id"]
     }
 
-    response = requests.post(url, headers=headers, json=payload)
-    if response.status_code != 200:
-        print(f"Error fetching contacts: {response.text}")
+    # Pages only as far as `limit` (partitioned past the 10k search cap if needed)
+    try:
+        return search_all("contacts", payload["filterGroups"], payload["properties"], headers, limit=limit)
+    except Exception as e:
+        print(f"Error fetching contacts: {e}")
         return []
 
-    return response.json().get("results", [])
-
 
 def enrich_from_apollo(email=None, domain=None):
     """Enrich contact/company from Apollo."""
@@ -103,54 +109,13 @@ def enrich_from_apollo(email=None, domain=None):
 
 
 def determine_lead_tier(revenue, employees, job_title):
-    """Determine lead tier based on company size and contact title."""
-    is_senior = False
-    if job_title:
-        title_lower = job_title.lower()
-        is_senior = any(t in title_lower for t in SENIOR_TITLES)
-
-    # Enterprise: Big company + senior title
-    if revenue and revenue >= ENTERPRISE_REVENUE:
-        if is_senior:
-            return "enterprise", OWNER_BEN
-        else:
-            return "mid_market", OWNER_EMMET
-
-    if employees and employees >= ENTERPRISE_EMPLOYEES:
-        if is_senior:
-            return "enterprise", OWNER_BEN
-        else:
-            return "mid_market", OWNER_EMMET
-
-    # Mid-market
-    if revenue and revenue >= MID_MARKET_REVENUE:
-        return "mid_market", OWNER_EMMET
-
-    if employees and employees >= MID_MARKET_EMPLOYEES:
-        return "mid_market", OWNER_EMMET
-
-    # SMB (default)
-    return "smb", OWNER_EMMET
-
-
-def employee_count_to_range(count):
-    """Convert employee count to HubSpot range value."""
-    if not count:
-        return None
-    if count <= 5:
-        return "1-5"
-    elif count <= 25:
-        return "5-25"
-    elif count <= 50:
-        return "25-50"
-    elif count <= 100:
-        return "50-100"
-    elif count <= 500:
-        return "100-500"
-    elif count <= 1000:
-        return "500-1000"
-    else:
-        return "1000+"
+    """Determine lead tier based on company size and contact title (contact_tier rules)."""
+    decision = routing_engine.evaluate("contact_tier", {
+        "revenue": revenue,
+        "employees": employees,
+        "senior_title": is_senior_title(job_title),
+    })
+    return decision.outcome["tier"], decision.outcome["owner_id"]
 
 
 def update_hubspot_contact(contact_id, properties):
@@ -169,6 +134,9 @@ def update_hubspot_contact(contact_id, properties):
 
 def main():
     dry_run = "--dry-run" in sys.argv
+    limit = DEFAULT_LIMIT
+    if "--limit" in sys.argv:
+        limit = int(sys.argv[sys.argv.index("--limit") + 1])
 
     if not HUBSPOT_TOKEN or not APOLLO_KEY:
         print("Error: Set HUBSPOT_ACCESS_TOKEN and APOLLO_API_KEY environment variables")
@@ -182,7 +150,7 @@ def main():
 
     # Get contacts to enrich
     print("Fetching contacts missing company data...")
-    contacts = get_contacts_to_enrich()
+    contacts = get_contacts_to_enrich(limit)
     print(f"Found {len(contacts)} contacts to enrich\n")
 
     enriched = 0
@@ -239,11 +207,12 @@ def main():
         if revenue:
             updates["annualrevenue"] = str(int(revenue))
         if employees:
-            emp_range = employee_count_to_range(employees)
+            emp_range = numemployees_label(employees)
             if emp_range:
                 updates["numemployees"] = emp_range
         if enrichment.get("industry"):
-            updates["industry"] = enrichment.get("industry")
+            # HubSpot category, as set by the enrich_contact function
+            updates["industry"] = map_industry(enrichment.get("industry"))
 
         if dry_run:
             print(f"  Would update: {updates}")
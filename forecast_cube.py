@@ -0,0 +1,137 @@
+"""
+Weighted pipeline forecast cube.
+
+Open deals are weighted by their stage's probability (from the pipelines
+API, see batch2-pipelines.sh) and totalled by owner x tier x pipeline x
+close month. Open means not in a closed stage (isClosed in the pipeline
+definition): the custom pipelines' won stages ("Closed Won", "Renewed",
+"Converted to Deal") have numeric ids and probability 1.0, so they'd
+otherwise count as pipeline at 100%. Every roll-up is stored too ("*" = all values of that
+dimension), so any forecast number is one dict lookup:
+
+    cube.get()                                  # whole weighted pipeline
+    cube.get(tier="enterprise", close_month="2026-11")
+
+Each cell holds count, amount and weighted amount. The cube is built with
+one vectorized group-by over a DealSnapshot and updated incrementally like
+the dashboard totals: subtract a changed deal's old row, add its new one.
+It's saved in the dashboard snapshot's state.
+
+Requires numpy.
+"""
+
+from itertools import product
+
+import numpy as np
+
+from deal_snapshot import CLOSED_STAGES
+
+DIMENSIONS = ["owner", "tier", "pipeline", "close_month"]
+ALL = "*"
+
+# Label for deals with no value in a dimension
+MISSING = {"owner": "unassigned", "tier": "unassigned", "pipeline": "unknown", "close_month": "none"}
+
+SEPARATOR = "|"
+
+
+def stage_probabilities(pipelines):
+    """({stage id: probability}, sorted closed stage ids) from deal_funnel.get_pipelines()"""
+    stages = [stage for pipeline in pipelines for stage in pipeline.stages]
+    probabilities = {stage.id: stage.probability for stage in stages}
+    closed = sorted({stage.id for stage in stages if stage.is_closed} | set(CLOSED_STAGES))
+    return probabilities, closed
+
+
+def _key(values):
+    return SEPARATOR.join(values)
+
+
+def cube_cells(snapshot, probabilities, closed):
+    """{cell key: count, amount, weighted} for the snapshot's open deals, with every roll-up"""
+    is_open = snapshot.is_open(closed)
+    rows = np.flatnonzero(is_open)
+    amount = snapshot.columns["amount"][rows]
+
+    stage_probability = np.array([probabilities.get(str(stage), 0.0)
+                                  for stage in snapshot.categories["stage"]] + [0.0])
+    weighted = amount * stage_probability[snapshot.columns["stage"][rows]]
+
+    # One integer code per dimension (0 = missing), combined into one key
+    codes = []
+    labels = []
+    for dimension in ["owner", "tier", "pipeline"]:
+        codes.append(snapshot.columns[dimension][rows] + 1)
+        labels.append([MISSING[dimension]] + [str(c) for c in snapshot.categories[dimension]])
+    months = snapshot.columns["closedate"][rows].astype("datetime64[M]")
+    month_labels, month_codes = np.unique(months.astype(str), return_inverse=True)
+    codes.append(month_codes)
+    labels.append([MISSING["close_month"] if m == "NaT" else str(m) for m in month_labels])
+
+    sizes = [len(dimension_labels) for dimension_labels in labels]
+    combined = np.ravel_multi_index(codes, sizes) if len(rows) else np.array([], dtype=np.intp)
+    keys, inverse = np.unique(combined, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(keys))
+    amounts = np.bincount(inverse, weights=amount, minlength=len(keys))
+    weights = np.bincount(inverse, weights=weighted, minlength=len(keys))
+
+    cells = {}
+    for key, count, cell_amount, cell_weighted in zip(keys, counts, amounts, weights):
+        values = [labels[d][code] for d, code in enumerate(np.unravel_index(key, sizes))]
+        # The cell itself and every roll-up of it
+        for rolled in product(*[(value, ALL) for value in values]):
+            cell = cells.setdefault(_key(rolled), {"count": 0, "amount": 0.0, "weighted": 0.0})
+            cell["count"] += int(count)
+            cell["amount"] += float(cell_amount)
+            cell["weighted"] += float(cell_weighted)
+    return cells
+
+
+class ForecastCube:
+    """Weighted pipeline by owner x tier x pipeline x close month (see module docstring)"""
+
+    def __init__(self, probabilities, closed, cells=None):
+        self.probabilities = probabilities
+        self.closed = closed
+        self.cells = cells or {}
+
+    @classmethod
+    def build(cls, snapshot, stages):
+        """Cube over the snapshot; `stages` is stage_probabilities()'s result"""
+        probabilities, closed = stages
+        return cls(probabilities, closed, cube_cells(snapshot, probabilities, closed))
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(state["probabilities"], state.get("closed", CLOSED_STAGES), state["cells"])
+
+    def to_state(self):
+        return {"probabilities": self.probabilities, "closed": self.closed, "cells": self.cells}
+
+    def apply(self, snapshot, sign=1):
+        """Add (sign=1) or subtract (sign=-1) the snapshot's deals"""
+        for key, delta in cube_cells(snapshot, self.probabilities, self.closed).items():
+            cell = self.cells.setdefault(key, {"count": 0, "amount": 0.0, "weighted": 0.0})
+            cell["count"] += sign * delta["count"]
+            cell["amount"] += sign * delta["amount"]
+            cell["weighted"] += sign * delta["weighted"]
+            if cell["count"] == 0:
+                del self.cells[key]
+        return self
+
+    def get(self, owner=ALL, tier=ALL, pipeline=ALL, close_month=ALL):
+        """Count, amount and weighted amount for one cell or roll-up"""
+        empty = {"count": 0, "amount": 0.0, "weighted": 0.0}
+        return self.cells.get(_key([owner, tier, pipeline, close_month]), empty)
+
+    def breakdown(self, dimension, **fixed):
+        """{value: cell} across one dimension, with the other dimensions fixed (or all)"""
+        position = DIMENSIONS.index(dimension)
+        pattern = [fixed.get(d, ALL) for d in DIMENSIONS]
+        result = {}
+        for key, cell in self.cells.items():
+            values = key.split(SEPARATOR)
+            if values[position] != ALL and all(
+                    values[i] == pattern[i] for i in range(len(DIMENSIONS)) if i != position):
+                result[values[position]] = cell
+        return result
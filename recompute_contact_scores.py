@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Recompute lead_tier and priority_level for every contact.
+
+The enrich_contact function sets these when a contact or lead is created,
+so a contact whose HubSpot score changes later keeps a stale priority.
+This job reads the scoring inputs for all contacts, recomputes both
+properties as NumPy column operations (same rules as enrich_contact, from
+cloud-functions/routing_rules.json), and batch-updates only the contacts
+whose values changed.
+
+- priority_level: decision_maker (stored, or from job title/seniority if
+  unset) and hubspotscore
+- lead_tier: employees (numemployees or company_size, by range lower bound)
+  and annualrevenue. Contacts with neither keep their stored tier.
+
+Requires numpy.
+
+Usage: python3 recompute_contact_scores.py [--dry-run] [--export]
+
+--export reads the contacts through one CRM export job (crm_export.py)
+instead of paging the objects API 100 contacts at a time.
+"""
+
+import os
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+import requests
+
+# Shared routing modules live with the Cloud Functions
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "cloud-functions"))
+import routing
+import title_classifier
+from size_buckets import to_counts
+
+from crm_export import export_objects
+
+HUBSPOT_TOKEN = os.getenv("HUBSPOT_ACCESS_TOKEN")
+HUBSPOT_BASE = "https://api.hubapi.com"
+
+HEADERS = {
+    "Authorization": f"Bearer {HUBSPOT_TOKEN}",
+    "Content-Type": "application/json"
+}
+
+# Scoring inputs and the stored results
+CONTACT_PROPERTIES = ["decision_maker", "jobtitle", "seniority", "hubspotscore", "numemployees",
+                      "company_size", "annualrevenue", "lead_tier", "priority_level"]
+
+BATCH_SIZE = 100
+
+
+def get_all_contacts(export=False):
+    """Get every contact with the scoring properties"""
+    if export:
+        return export_objects("contacts", CONTACT_PROPERTIES)
+
+    contacts = []
+    after = None
+
+    while True:
+        params = {"limit": 100, "properties": ",".join(CONTACT_PROPERTIES)}
+        if after:
+            params["after"] = after
+
+        response = requests.get(f"{HUBSPOT_BASE}/crm/v3/objects/contacts", headers=HEADERS, params=params)
+        if response.status_code == 429:
+            time.sleep(1)
+            continue
+        if response.status_code != 200:
+            raise Exception(f"Error fetching contacts: {response.status_code} {response.text[:200]}")
+
+        data = response.json()
+        contacts.extend(data.get("results", []))
+
+        paging = data.get("paging", {})
+        if paging.get("next"):
+            after = paging["next"]["after"]
+        else:
+            break
+
+    return contacts
+
+
+def to_float_column(values):
+    """Numeric property values as floats, NaN where empty or not a number"""
+    column = np.full(len(values), np.nan)
+    for i, value in enumerate(values):
+        try:
+            column[i] = float(value)
+        except (TypeError, ValueError):
+            pass
+    return column
+
+
+def build_columns(contacts):
+    """One array per scoring input"""
+    props = [contact.get("properties", {}) for contact in contacts]
+
+    def prop(name):
+        return [p.get(name) or None for p in props]
+
+    # Stored decision_maker wins; contacts enriched before it existed use the title
+    stored_decision_maker = np.array(prop("decision_maker"), dtype=object)
+    decision_maker = stored_decision_maker == "true"
+    unset = np.array([value is None for value in stored_decision_maker], dtype=bool)
+    if unset.any():
+        titles = np.array(prop("jobtitle"), dtype=object)[unset]
+        seniorities = np.array(prop("seniority"), dtype=object)[unset]
+        decision_maker[unset] = [
+            title_classifier.is_decision_maker(title, seniority)
+            for title, seniority in zip(titles, seniorities)
+        ]
+
+    employees = to_counts(prop("numemployees"))
+    missing = np.isnan(employees)
+    employees[missing] = to_counts(np.array(prop("company_size"), dtype=object)[missing])
+
+    return {
+        "ids": np.array([str(contact["id"]) for contact in contacts], dtype=object),
+        "decision_maker": decision_maker,
+        "engagement": to_float_column(prop("hubspotscore")),
+        "employees": employees,
+        "revenue": to_float_column(prop("annualrevenue")),
+        "lead_tier": np.array(prop("lead_tier"), dtype=object),
+        "priority_level": np.array(prop("priority_level"), dtype=object),
+    }
+
+
+def recompute(columns, engine):
+    """
+    New lead_tier and priority_level columns. Contacts without employee or
+    revenue data keep their stored tier.
+    """
+    priority_level = engine.priority.levels(columns["decision_maker"], columns["engagement"])
+
+    lead_tier = engine.evaluate_columns(
+        "lead_tier",
+        {"employees": columns["employees"], "revenue": columns["revenue"]},
+        "tier",
+    )
+    no_size_data = np.isnan(columns["employees"]) & ~(columns["revenue"] > 0)
+    lead_tier[no_size_data] = columns["lead_tier"][no_size_data]
+
+    return {"lead_tier": lead_tier, "priority_level": priority_level}
+
+
+def diff_updates(columns, recomputed):
+    """{contact_id: {property: new value}} for contacts where anything changed"""
+    updates = {}
+    for prop, new_values in recomputed.items():
+        has_value = np.array([value is not None for value in new_values], dtype=bool)
+        changed = np.flatnonzero((new_values != columns[prop]) & has_value)
+        for i in changed:
+            updates.setdefault(columns["ids"][i], {})[prop] = new_values[i]
+    return updates
+
+
+def batch_update_contacts(updates_by_id):
+    """Update contacts 100 at a time. Returns the number updated."""
+    updated = 0
+    items = list(updates_by_id.items())
+
+    for i in range(0, len(items), BATCH_SIZE):
+        chunk = items[i:i + BATCH_SIZE]
+        response = requests.post(
+            f"{HUBSPOT_BASE}/crm/v3/objects/contacts/batch/update",
+            headers=HEADERS,
+            json={"inputs": [{"id": contact_id, "properties": props} for contact_id, props in chunk]}
+        )
+        # 207 = partial success
+        if response.status_code not in [200, 207]:
+            print(f"  ✗ Batch update failed: {response.status_code} {response.text[:200]}")
+            continue
+        updated += len(response.json().get("results", []))
+
+    return updated
+
+
+def main():
+    dry_run = "--dry-run" in sys.argv
+
+    print("=" * 70)
+    print("RECOMPUTE CONTACT TIER & PRIORITY")
+    print("=" * 70)
+    if dry_run:
+        print("DRY RUN MODE - No changes will be made")
+
+    print("\nFetching all contacts...")
+    contacts = get_all_contacts(export="--export" in sys.argv)
+    print(f"Found {len(contacts)} contacts")
+    if not contacts:
+        return
+
+    engine = routing.get_engine()
+    columns = build_columns(contacts)
+    recomputed = recompute(columns, engine)
+    updates = diff_updates(columns, recomputed)
+
+    print(f"\n--- CHANGES ---")
+    for prop in recomputed:
+        changed = Counter(u[prop] for u in updates.values() if prop in u)
+        print(f"{prop}: {sum(changed.values())} contacts")
+        for value, count in sorted(changed.items()):
+            print(f"  → {value}: {count}")
+
+    print(f"\n{len(updates)} of {len(contacts)} contacts need updating")
+    if dry_run or not updates:
+        return
+
+    updated = batch_update_contacts(updates)
+    print(f"Updated {updated} contacts")
+
+
+if __name__ == "__main__":
+    main()
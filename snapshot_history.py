@@ -0,0 +1,175 @@
+"""
+Daily deal snapshot history, stored as deltas.
+
+Each recorded day is one compressed DealSnapshot file in DEAL_HISTORY_DIR
+(default data/deal-history next to the scripts):
+
+- YYYY-MM-DD.keyframe.npz: every deal
+- YYYY-MM-DD.delta.npz: only the deals that are new or changed since the
+  previous recorded day, plus the ids of deals that disappeared
+
+A keyframe is written on the first day and then every KEYFRAME_DAYS, so
+rebuilding any day loads one keyframe and applies at most that many deltas.
+Between keyframes, storage grows with the number of changed deals, not with
+days x deals.
+
+Trend queries replay a window of days once, evaluating a metric on each
+day's state, e.g. trend(open_value_by_tier, days=90) for pipeline value by
+tier over the last 90 days.
+
+Requires numpy.
+"""
+
+import os
+from datetime import date, timedelta
+
+import numpy as np
+
+from deal_snapshot import CATEGORY_COLUMNS, DealSnapshot
+
+# Kept next to the scripts by default, not in /tmp: reboots and tmp cleaners
+# would wipe the history that week-over-week trends depend on
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+HISTORY_DIR = os.environ.get("DEAL_HISTORY_DIR", os.path.join(DATA_DIR, "deal-history"))
+
+# Days between full snapshots; bounds the deltas applied per reconstruction
+KEYFRAME_DAYS = int(os.environ.get("DEAL_HISTORY_KEYFRAME_DAYS", "90"))
+
+KINDS = ["keyframe", "delta"]
+
+
+def diff(previous, current):
+    """(snapshot of current's new or changed deals, ids of deals no longer in current)"""
+    rows, found = previous.find(current.columns["id"])
+    matched = np.flatnonzero(found)
+    changed = ~found
+
+    for name, column in current.columns.items():
+        if name == "id":
+            continue
+        if name in CATEGORY_COLUMNS:
+            # Codes depend on each snapshot's categories; compare labels
+            ours, theirs = current.labels(name)[matched], previous.labels(name)[rows]
+            differs = ours != theirs
+        else:
+            ours, theirs = column[matched], previous.columns[name][rows]
+            differs = ours != theirs
+            if column.dtype.kind == "M":
+                differs &= ~(np.isnat(ours) & np.isnat(theirs))
+        changed[matched[differs]] = True
+
+    removed = np.setdiff1d(previous.columns["id"], current.columns["id"])
+    return current.take(np.flatnonzero(changed)), removed
+
+
+def apply_delta(snapshot, delta):
+    """The next day's state: delta rows upserted, its removed ids dropped"""
+    snapshot = snapshot.upsert(delta)
+    removed = delta.state.get("removed", [])
+    if removed:
+        rows, _ = snapshot.find(removed)
+        keep = np.ones(len(snapshot), dtype=bool)
+        keep[rows] = False
+        snapshot = snapshot.take(np.flatnonzero(keep))
+    return snapshot
+
+
+def open_value_by_tier(snapshot):
+    """{deal tier: open pipeline amount} ("unassigned" for no tier)"""
+    is_open = snapshot.is_open()
+    codes = snapshot.columns["tier"][is_open] + 1  # unset (-1) -> 0
+    labels = ["unassigned"] + [str(c) for c in snapshot.categories["tier"]]
+    amounts = np.bincount(codes, weights=snapshot.columns["amount"][is_open], minlength=len(labels))
+    counts = np.bincount(codes, minlength=len(labels))
+    return {labels[i]: float(amounts[i]) for i in np.flatnonzero(counts)}
+
+
+class SnapshotHistory:
+    """Deal snapshots by day (see module docstring)"""
+
+    def __init__(self, directory=HISTORY_DIR, keyframe_days=KEYFRAME_DAYS):
+        self.directory = directory
+        self.keyframe_days = keyframe_days
+
+    def _path(self, day, kind):
+        return os.path.join(self.directory, f"{day.isoformat()}.{kind}.npz")
+
+    def index(self):
+        """[(day, "keyframe" or "delta")] for every recorded day, oldest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        index = []
+        for name in os.listdir(self.directory):
+            parts = name.split(".")
+            if len(parts) == 3 and parts[1] in KINDS and parts[2] == "npz":
+                try:
+                    index.append((date.fromisoformat(parts[0]), parts[1]))
+                except ValueError:
+                    pass
+        return sorted(index)
+
+    def days(self):
+        """Recorded days, oldest first"""
+        return [day for day, _ in self.index()]
+
+    def record(self, snapshot, day=None):
+        """
+        Record `snapshot` as `day`'s state (default today). Re-recording the
+        latest day replaces it; earlier days can't be rewritten.
+        """
+        day = day or date.today()
+        index = self.index()
+        if index and index[-1][0] > day:
+            raise Exception(f"Can't record {day}: history already has {index[-1][0]}")
+
+        earlier = [(d, kind) for d, kind in index if d < day]
+        keyframes = [d for d, kind in earlier if kind == "keyframe"]
+        if not keyframes or (day - keyframes[-1]).days >= self.keyframe_days:
+            kind = "keyframe"
+            record = DealSnapshot(snapshot.columns, snapshot.categories, snapshot.fetched_at)
+        else:
+            kind = "delta"
+            record, removed = diff(self.reconstruct(earlier[-1][0]), snapshot)
+            record.state = {"removed": removed.tolist()}
+
+        os.makedirs(self.directory, exist_ok=True)
+        record.save(self._path(day, kind))
+        # Re-recorded day that changed kind
+        for other in KINDS:
+            if other != kind and os.path.exists(self._path(day, other)):
+                os.remove(self._path(day, other))
+        return record
+
+    def replay(self, start, end):
+        """
+        Yield (day, snapshot) for each recorded day from start to end
+        inclusive, starting from the last keyframe before the window.
+        """
+        index = [(d, kind) for d, kind in self.index() if d <= end]
+        first = next((i for i, (d, _) in enumerate(index) if d >= start), None)
+        if first is None:
+            return
+        base = max(i for i in range(first + 1) if index[i][1] == "keyframe")
+
+        snapshot = None
+        for day, kind in index[base:]:
+            record = DealSnapshot.load(self._path(day, kind))
+            snapshot = record if kind == "keyframe" else apply_delta(snapshot, record)
+            if day >= start:
+                yield day, snapshot
+
+    def reconstruct(self, day):
+        """Deal state as of the latest recorded day on or before `day` (None if there isn't one)"""
+        earlier = [d for d in self.days() if d <= day]
+        if not earlier:
+            return None
+        snapshot = None
+        for _, snapshot in self.replay(earlier[-1], earlier[-1]):
+            pass
+        return snapshot
+
+    def trend(self, metric, days=90, end=None):
+        """[(day, metric(snapshot))] for each recorded day in the `days` days up to `end`"""
+        end = end or date.today()
+        start = end - timedelta(days=days - 1)
+        return [(day, metric(snapshot)) for day, snapshot in self.replay(start, end)]
@@ -20,13 +20,25 @@ Run this script:
 - Once to backfill existing Leads
 - Periodically (cron) to keep Leads in sync
 - Or trigger via webhook when new Leads are created
+
+Usage: python3 sync_contact_to_lead.py [--dry-run] [--export]
+
+--export reads the Leads through one CRM export job (crm_export.py) instead
+of paging the objects API.
 """
 
 import requests
+import sys
 import time
 import os
 from datetime import datetime
 
+# Shared modules live with the Cloud Functions
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "cloud-functions"))
+from size_buckets import company_size_label
+
+from crm_export import export_objects
+
 # Configuration
 HUBSPOT_TOKEN = os.getenv("HUBSPOT_ACCESS_TOKEN")
 
@@ -53,6 +65,8 @@ COMPANY_FALLBACK_MAPPING = {
     "numberofemployees": "lead_company_size",
 }
 
+LEAD_PROPERTIES = ["hs_lead_name", *CONTACT_TO_LEAD_MAPPING.values()]
+
 
 class ContactToLeadSync:
     def __init__(self):
@@ -63,22 +77,16 @@ class ContactToLeadSync:
             "errors": 0
         }
 
-    def get_all_leads(self):
+    def get_all_leads(self, export=False):
         """Fetch all Leads from HubSpot"""
+        if export:
+            return export_objects("leads", LEAD_PROPERTIES)
+
         leads = []
         url = "https://api.hubapi.com/crm/v3/objects/leads"
         params = {
             "limit": 100,
-            "properties": ",".join([
-                "hs_lead_name",
-                "lead_company_name",
-                "lead_company_type",
-                "lead_company_size",
-                "lead_job_title",
-                "lead_industry",
-                "lead_timeline",
-                "lead_use_case"
-            ])
+            "properties": ",".join(LEAD_PROPERTIES)
         }
 
         after = None
@@ -187,30 +195,6 @@ class ContactToLeadSync:
         except Exception:
             return None
 
-    def map_company_size(self, employee_count):
-        """Map employee count to company size bucket"""
-        if not employee_count:
-            return None
-
-        try:
-            count = int(employee_count)
-            if count <= 10:
-                return "1-10"
-            elif count <= 50:
-                return "11-50"
-            elif count <= 200:
-                return "51-200"
-            elif count <= 500:
-                return "201-500"
-            elif count <= 1000:
-                return "501-1000"
-            elif count <= 5000:
-                return "1001-5000"
-            else:
-                return "5000+"
-        except (ValueError, TypeError):
-            return None
-
     def update_lead(self, lead_id, properties):
         """Update Lead with new properties"""
         url = f"https://api.hubapi.com/crm/v3/objects/leads/{lead_id}"
@@ -263,7 +247,7 @@ class ContactToLeadSync:
                     if not current_value or current_value.strip() == "":
                         # Special handling for employee count → size bucket
                         if company_prop == "numberofemployees":
-                            mapped_size = self.map_company_size(value)
+                            mapped_size = company_size_label(value)
                             if mapped_size:
                                 updates[lead_prop] = mapped_size
                         else:
@@ -278,7 +262,7 @@ class ContactToLeadSync:
         else:
             return False, "Update failed"
 
-    def run(self, dry_run=False):
+    def run(self, dry_run=False, export=False):
         """Run the sync for all Leads"""
         print("\n" + "=" * 70)
         print("SYNC CONTACT PROPERTIES TO LEADS")
@@ -289,7 +273,7 @@ class ContactToLeadSync:
 
         # Fetch all Leads
         print("\nFetching all Leads...")
-        leads = self.get_all_leads()
+        leads = self.get_all_leads(export=export)
         print(f"Found {len(leads)} Leads")
 
         if not leads:
@@ -345,7 +329,7 @@ def main():
     dry_run = "--dry-run" in sys.argv
 
     sync = ContactToLeadSync()
-    sync.run(dry_run=dry_run)
+    sync.run(dry_run=dry_run, export="--export" in sys.argv)
 
 
 if __name__ == "__main__":
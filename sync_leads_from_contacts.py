@@ -3,12 +3,26 @@
 Sync all existing leads with their associated contact data.
 - Maps contact properties to lead properties
 - Reassigns owner based on routing rules
+
+Usage: python3 sync_leads_from_contacts.py [--export]
+
+--export reads the leads through one CRM export job (crm_export.py) instead
+of paging the objects API.
 """
 
 import requests
+import sys
 import time
 import os
 
+# Shared routing modules live with the Cloud Functions
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "cloud-functions"))
+import routing
+import title_classifier
+from size_buckets import size_tier
+
+from crm_export import export_objects
+
 HUBSPOT_TOKEN = os.getenv("HUBSPOT_ACCESS_TOKEN")
 HUBSPOT_BASE = "https://api.hubapi.com"
 
@@ -17,98 +31,45 @@ HEADERS = {
     "Content-Type": "application/json"
 }
 
-# Owner IDs for routing
-OWNERS = {
-    "ben": "159215803",      # Ben Kusin - CRO (high-value)
-    "emmet": "160266467",    # Emmet Reilly (middle tier)
-    "tim": "161182435",      # Tim Burke (small tier)
-}
-
-OWNER_NAMES = {
-    "159215803": "Ben",
-    "160266467": "Emmet",
-    "161182435": "Tim",
-}
-
-
-def calculate_decision_maker(jobtitle, seniority):
-    """Calculate decision maker status"""
-    if not jobtitle:
-        return seniority in ['C_LEVEL', 'VP', 'DIRECTOR', 'MANAGER'] if seniority else False
-
-    title_lower = jobtitle.lower()
-
-    # C-level
-    if any(x in title_lower for x in ['ceo', 'cfo', 'cmo', 'cto', 'coo', 'cpo', 'chief', 'founder', 'owner']):
-        return True
-
-    # VP/President
-    if 'vp' in title_lower or 'vice president' in title_lower:
-        return True
-    if 'president' in title_lower and 'vice' not in title_lower:
-        return True
-
-    # Director/Head
-    if 'director' in title_lower or 'head of' in title_lower:
-        return True
-
-    # Manager (excluding support roles)
-    if 'manager' in title_lower:
-        exclude = ['account manager', 'customer success', 'support', 'operations manager', 'community']
-        if not any(x in title_lower for x in exclude):
-            return True
-
-    # Seniority-based
-    if seniority in ['C_LEVEL', 'VP', 'DIRECTOR', 'MANAGER']:
-        return True
-
-    return False
+# Owner and tier routing rules (cloud-functions/routing_rules.json)
+routing_engine = routing.get_engine()
 
+# Owner IDs for routing
+OWNERS = routing_engine.owner_ids()
 
-def parse_company_size(size_value):
-    """Parse company size to tier"""
-    if not size_value:
-        return None
-
-    if isinstance(size_value, int):
-        if size_value >= 500:
-            return 'large'
-        elif size_value >= 51:
-            return 'medium'
-        else:
-            return 'small'
-
-    size_str = str(size_value).lower().strip()
+# Contact properties used for routing and lead sync
+CONTACT_PROPERTIES = ["email", "firstname", "lastname", "company", "jobtitle", "seniority",
+                      "company_size", "industry", "contact_type", "timeline", "use_case"]
 
-    if size_str in ['501-1000', '1001-5000', '5000+', '5000', '1000+']:
-        return 'large'
-    if size_str in ['51-200', '201-500']:
-        return 'medium'
-    if size_str in ['1-10', '11-50', '1-50']:
-        return 'small'
+OWNER_NAMES = {owner["id"]: owner["name"] for owner in routing_engine.owners.values()}
 
-    return None
 
+def route_leads(lead_contacts):
+    """
+    Route every lead with the lead_owner rules, in one batch.
+    Returns {lead_id: Decision}.
+    """
+    lead_ids = list(lead_contacts)
+    facts = []
+    for lead_id in lead_ids:
+        props = lead_contacts[lead_id].get("properties", {})
+        facts.append({
+            "decision_maker": title_classifier.is_decision_maker(props.get("jobtitle", ""), props.get("seniority", "")),
+            "size_tier": size_tier(props.get("company_size", "")),
+        })
 
-def determine_owner(company_size, is_decision_maker):
-    """Determine owner based on routing rules"""
-    if is_decision_maker:
-        return OWNERS["ben"], "decision_maker"
+    decisions = routing_engine.evaluate_batch("lead_owner", facts)
+    return dict(zip(lead_ids, decisions))
 
-    size_tier = parse_company_size(company_size)
 
-    if size_tier == 'large':
-        return OWNERS["ben"], "large_company"
-    if size_tier == 'small':
-        return OWNERS["tim"], "small_company"
-    if size_tier == 'medium':
-        return OWNERS["emmet"], "mid_company"
+LEAD_PROPERTIES = ["hs_lead_name", "hubspot_owner_id", "lead_company_name", "lead_company_size", "lead_job_title"]
 
-    return OWNERS["emmet"], "unknown_size"
 
+def get_all_leads(export=False):
+    """Get all leads from HubSpot, with their contact associations inline"""
+    if export:
+        return export_objects("leads", LEAD_PROPERTIES, associated="contacts")
 
-def get_all_leads():
-    """Get all leads from HubSpot"""
     leads = []
     after = None
 
@@ -116,7 +77,8 @@ def get_all_leads():
         url = f"{HUBSPOT_BASE}/crm/v3/objects/leads"
         params = {
             "limit": 100,
-            "properties": "hs_lead_name,hubspot_owner_id,lead_company_name,lead_company_size,lead_job_title"
+            "properties": ",".join(LEAD_PROPERTIES),
+            "associations": "contacts"
         }
         if after:
             params["after"] = after
@@ -138,31 +100,54 @@ def get_all_leads():
     return leads
 
 
-def get_lead_contact(lead_id):
-    """Get contact associated with a lead"""
-    url = f"{HUBSPOT_BASE}/crm/v4/objects/leads/{lead_id}/associations/contacts"
-
-    response = requests.get(url, headers=HEADERS)
-    if response.status_code != 200:
-        return None
-
-    results = response.json().get("results", [])
+def get_associated_contact_id(lead):
+    """First contact ID from a lead read with associations=contacts"""
+    results = lead.get("associations", {}).get("contacts", {}).get("results", [])
     if not results:
         return None
+    return str(results[0].get("id"))
+
+
+def batch_get_contacts(contact_ids):
+    """Read contacts 100 at a time. Returns {contact_id: contact}."""
+    contacts = {}
+
+    for i in range(0, len(contact_ids), 100):
+        chunk = contact_ids[i:i + 100]
+        response = requests.post(
+            f"{HUBSPOT_BASE}/crm/v3/objects/contacts/batch/read",
+            headers=HEADERS,
+            json={"properties": CONTACT_PROPERTIES, "inputs": [{"id": cid} for cid in chunk]}
+        )
+        # 207 = partial success (some contacts not found)
+        if response.status_code not in [200, 207]:
+            print(f"Error fetching contacts: {response.status_code}")
+            continue
 
-    contact_id = results[0].get("toObjectId")
+        for contact in response.json().get("results", []):
+            contacts[str(contact["id"])] = contact
 
-    # Get contact details
-    contact_url = f"{HUBSPOT_BASE}/crm/v3/objects/contacts/{contact_id}"
-    params = {
-        "properties": "email,firstname,lastname,company,jobtitle,seniority,company_size,industry,contact_type,timeline,use_case"
-    }
+    return contacts
 
-    contact_response = requests.get(contact_url, headers=HEADERS, params=params)
-    if contact_response.status_code != 200:
-        return None
 
-    return contact_response.json()
+def get_lead_contacts(leads):
+    """
+    Resolve leads (read with inline contact associations) to their contacts
+    with batch reads. Returns {lead_id: contact}.
+    """
+    lead_contact_ids = {}
+    for lead in leads:
+        contact_id = get_associated_contact_id(lead)
+        if contact_id:
+            lead_contact_ids[lead["id"]] = contact_id
+
+    contacts = batch_get_contacts(sorted(set(lead_contact_ids.values())))
+
+    return {
+        lead_id: contacts[contact_id]
+        for lead_id, contact_id in lead_contact_ids.items()
+        if contact_id in contacts
+    }
 
 
 def update_lead(lead_id, properties):
@@ -180,9 +165,16 @@ def main():
 
     # Get all leads
     print("\nFetching all leads...")
-    leads = get_all_leads()
+    leads = get_all_leads(export="--export" in sys.argv)
     print(f"Found {len(leads)} leads")
 
+    # Contacts for every lead in a handful of batch reads
+    print("Fetching associated contacts...")
+    lead_contacts = get_lead_contacts(leads)
+    print(f"Found contacts for {len(lead_contacts)} leads")
+
+    decisions = route_leads(lead_contacts)
+
     updated = 0
     skipped = 0
     errors = 0
@@ -198,21 +190,18 @@ def main():
         print(f"\n[{i+1}/{len(leads)}] {lead_name}")
 
         # Get associated contact
-        contact = get_lead_contact(lead_id)
+        contact = lead_contacts.get(lead_id)
         if not contact:
             print(f"  → No contact found, skipping")
             skipped += 1
             continue
 
         contact_props = contact.get("properties", {})
-        email = contact_props.get("email", "")
-        jobtitle = contact_props.get("jobtitle", "")
-        company_size = contact_props.get("company_size", "")
-        seniority = contact_props.get("seniority", "")
-
-        # Calculate routing
-        is_decision_maker = calculate_decision_maker(jobtitle, seniority)
-        new_owner, reason = determine_owner(company_size, is_decision_maker)
+
+        # Routed up front
+        decision = decisions[lead_id]
+        new_owner = decision.outcome["owner_id"]
+        reason = decision.explanation
 
         # Build update payload
         updates = {}
@@ -0,0 +1,70 @@
+"""
+crm_export against crm_export_fake.FakeExportServer.
+
+Run with: python3 -m pytest tests
+"""
+
+import os
+import sys
+from unittest import mock
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import crm_export
+from crm_export_fake import FakeExportServer
+
+
+def contacts(n):
+    return [{"id": str(i), "properties": {"email": f"c{i}@example.com", "firstname": f"C{i}"}}
+            for i in range(1, n + 1)]
+
+
+def test_csv_export():
+    with FakeExportServer({"CONTACT": contacts(3)}) as fake:
+        records = crm_export.export_objects("contacts", ["email", "firstname"],
+                                            base=fake.base_url, poll_seconds=0)
+
+    assert [r["id"] for r in records] == ["1", "2", "3"]
+    assert records[0]["properties"] == {"email": "c1@example.com", "firstname": "C1"}
+    assert "associations" not in records[0]
+
+
+def test_zip_export_above_rows_per_file():
+    with FakeExportServer({"CONTACT": contacts(25)}, rows_per_file=10) as fake:
+        records = crm_export.export_objects("contacts", ["email"], base=fake.base_url, poll_seconds=0)
+
+    assert [r["id"] for r in records] == [str(i) for i in range(1, 26)]
+    assert records[-1]["properties"] == {"email": "c25@example.com"}
+
+
+def test_missing_property_is_none():
+    records = {"CONTACT": [{"id": "1", "properties": {"email": "a@b.co"}}]}
+    with FakeExportServer(records) as fake:
+        [record] = crm_export.export_objects("contacts", ["email", "phone"], base=fake.base_url, poll_seconds=0)
+
+    assert record["properties"] == {"email": "a@b.co", "phone": None}
+
+
+def test_export_with_associations():
+    leads = [
+        {"id": "101", "properties": {"hs_lead_name": "One"}, "associations": {"CONTACT": ["1"]}},
+        {"id": "102", "properties": {"hs_lead_name": "Two"}, "associations": {"CONTACT": ["2", "3"]}},
+        {"id": "103", "properties": {"hs_lead_name": "None"}},
+    ]
+    with FakeExportServer({"0-136": leads}) as fake:
+        records = crm_export.export_objects("leads", ["hs_lead_name"], associated="contacts",
+                                            base=fake.base_url, poll_seconds=0)
+
+    associated = {r["id"]: [a["id"] for a in r["associations"]["contacts"]["results"]] for r in records}
+    assert associated == {"101": ["1"], "102": ["2", "3"], "103": []}
+
+
+def test_wait_for_export_times_out_while_rate_limited():
+    rate_limited = mock.Mock(status_code=429)
+    with mock.patch.object(crm_export.requests, "get", return_value=rate_limited), \
+            mock.patch.object(crm_export.time, "sleep"), \
+            mock.patch.object(crm_export.time, "monotonic", side_effect=[0, 0, 5]):
+        with pytest.raises(Exception, match="still rate limited"):
+            crm_export.wait_for_export("1", timeout_seconds=1, base="http://fake")
@@ -0,0 +1,162 @@
+"""
+SQLiteJobQueue and the process_jobs worker (cloud-functions/job_queue.py, main.py).
+
+Run with: python3 -m pytest tests
+"""
+
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cloud-functions"))
+
+import job_queue
+import main
+from job_queue import SQLiteJobQueue, retry_delay
+
+
+class Clock:
+    """Stands in for time.time so lease and backoff waits can be skipped"""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(job_queue.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    queue = SQLiteJobQueue(str(tmp_path / "jobs.sqlite3"), max_attempts=3)
+    monkeypatch.setattr(job_queue, "_queue", queue)
+    return queue
+
+
+def request(body=None):
+    return types.SimpleNamespace(get_json=lambda silent=True: body)
+
+
+def test_claim_oldest_first_in_batches(clock, queue):
+    queue.enqueue_many("followup_task", [{"deal_id": str(i)} for i in range(5)])
+
+    first = queue.claim(3)
+    assert [job["payload"]["deal_id"] for job in first] == ["0", "1", "2"]
+    assert all(job["attempts"] == 1 for job in first)
+    # Claimed jobs are leased, so the next claim gets the rest
+    assert [job["payload"]["deal_id"] for job in queue.claim(3)] == ["3", "4"]
+    assert queue.claim(3) == []
+    assert queue.counts() == {"running": 5}
+
+
+def test_expired_lease_is_claimed_again(clock, queue):
+    queue.enqueue("followup_task", {"deal_id": "1"})
+    [job] = queue.claim(10, lease_seconds=60)
+
+    clock.now += 59
+    assert queue.claim(10) == []
+
+    # The worker died without completing or failing the job
+    clock.now += 2
+    [again] = queue.claim(10)
+    assert again["id"] == job["id"]
+    assert again["attempts"] == 2
+
+
+def test_complete(clock, queue):
+    queue.enqueue_many("followup_task", [{"deal_id": "1"}, {"deal_id": "2"}])
+    jobs = queue.claim(10)
+
+    queue.complete([jobs[0]["id"]])
+    assert queue.counts() == {"done": 1, "running": 1}
+
+
+def test_fail_retries_with_backoff_then_dead(clock, queue):
+    queue.enqueue("followup_task", {"deal_id": "1"})
+
+    for attempt in (1, 2):
+        [job] = queue.claim(10)
+        assert job["attempts"] == attempt
+        queue.fail(job, "HubSpot 503")
+        assert queue.counts() == {"queued": 1}
+
+        clock.now += retry_delay(attempt) - 1
+        assert queue.claim(10) == []
+        clock.now += 1
+
+    [job] = queue.claim(10)
+    queue.fail(job, "HubSpot 503")
+    assert queue.counts() == {"dead": 1}
+    assert queue.claim(10) == []
+
+
+def test_requeue_with_backoff_and_drop_after_max_attempts(clock, queue):
+    queue.requeue([
+        {"kind": "followup_task", "payload": {"deal_id": "1"}, "attempts": 1, "error": "503"},
+        {"kind": "followup_task", "payload": {"deal_id": "2"}, "attempts": 3, "error": "503"},
+    ])
+    assert queue.counts() == {"queued": 1}
+
+    assert queue.claim(10) == []
+    clock.now += retry_delay(1)
+    [job] = queue.claim(10)
+    assert job["payload"] == {"deal_id": "1"}
+    assert job["attempts"] == 2
+
+
+def flaky_handler(payloads):
+    """Fails payloads with "fail" set, succeeds the rest"""
+    return [Exception("HubSpot 503") if p.get("fail") else {"ok": p["deal_id"]} for p in payloads]
+
+
+def test_worker_drains_sqlite_queue(clock, queue, monkeypatch):
+    monkeypatch.setitem(main.JOB_HANDLERS, "followup_task", flaky_handler)
+    queue.enqueue_many("followup_task", [{"deal_id": "1"}, {"deal_id": "2", "fail": True}, {"deal_id": "3"}])
+    queue.enqueue("unknown_kind", {})
+
+    body, status = main.process_jobs(request())
+
+    assert status == 200
+    assert body["processed"] == 2
+    assert body["failed"] == 2
+    assert body["queue"] == {"done": 2, "queued": 2}
+
+
+def test_worker_requeues_only_failed_jobs(clock, queue, monkeypatch):
+    monkeypatch.setitem(main.JOB_HANDLERS, "followup_task", flaky_handler)
+    jobs = [
+        {"kind": "followup_task", "payload": {"deal_id": "1"}, "attempts": 1},
+        {"kind": "followup_task", "payload": {"deal_id": "2", "fail": True}, "attempts": 1},
+    ]
+
+    body, status = main.process_jobs(request({"jobs": jobs}))
+
+    assert status == 200
+    assert body == {"status": "success", "processed": 1, "failed": 1}
+    clock.now += retry_delay(1)
+    [job] = queue.claim(10)
+    assert job["payload"]["deal_id"] == "2"
+
+
+def test_worker_answers_500_when_requeue_fails(clock, queue, monkeypatch):
+    monkeypatch.setitem(main.JOB_HANDLERS, "followup_task", flaky_handler)
+
+    def broken_requeue(jobs):
+        raise Exception("Cloud Tasks unavailable")
+
+    monkeypatch.setattr(queue, "requeue", broken_requeue)
+    jobs = [{"kind": "followup_task", "payload": {"deal_id": "1", "fail": True}, "attempts": 1}]
+
+    body, status = main.process_jobs(request({"jobs": jobs}))
+
+    # Cloud Tasks retries the whole task
+    assert status == 500
+    assert body["processed"] == 0
@@ -0,0 +1,116 @@
+"""
+MicroBatcher and LocalQueue (cloud-functions/enrich_contact/micro_batch.py).
+
+Run with: python3 -m pytest tests
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                "cloud-functions", "enrich_contact"))
+
+from micro_batch import LocalQueue, MicroBatcher
+
+
+class Recorder:
+    """Flush function that records batches, failing the first `failures` calls"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+        self.calls = 0
+        self.flushed = threading.Event()
+
+    def __call__(self, batch):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise Exception("HubSpot unavailable")
+        self.batches.append(list(batch))
+        self.flushed.set()
+
+
+def test_get_batch_stops_at_max_items():
+    q = LocalQueue()
+    for i in range(5):
+        q.put(i)
+
+    assert q.get_batch(3, 1) == [0, 1, 2]
+    assert q.get_batch(3, 1) == [3, 4]
+    assert len(q) == 0
+
+
+def test_get_batch_empty_after_timeout():
+    started = time.monotonic()
+    assert LocalQueue().get_batch(10, 0.05) == []
+    assert time.monotonic() - started >= 0.05
+
+
+def test_flushes_when_batch_is_full():
+    flush = Recorder()
+    batcher = MicroBatcher(flush, max_batch_size=3, max_wait_seconds=1)
+    for i in range(3):
+        batcher.submit(i)
+
+    batcher.start()
+    try:
+        # Well before max_wait_seconds: the full batch goes out right away
+        assert flush.flushed.wait(0.5)
+    finally:
+        batcher.stop()
+
+    assert flush.batches == [[0, 1, 2]]
+    assert batcher.stats["flushed"] == 3
+
+
+def test_flushes_partial_batch_after_max_wait():
+    flush = Recorder()
+    batcher = MicroBatcher(flush, max_batch_size=100, max_wait_seconds=0.05)
+    batcher.start()
+    try:
+        batcher.submit("a")
+        batcher.submit("b")
+        assert flush.flushed.wait(5)
+    finally:
+        batcher.stop()
+
+    assert flush.batches == [["a", "b"]]
+
+
+def test_stop_drains_queued_events():
+    flush = Recorder()
+    batcher = MicroBatcher(flush, max_batch_size=2)
+    for i in range(5):
+        batcher.submit(i)
+
+    assert batcher.flush_pending() == 5
+    assert flush.batches == [[0, 1], [2, 3], [4]]
+
+
+def test_failed_batch_is_retried():
+    flush = Recorder(failures=1)
+    batcher = MicroBatcher(flush, max_batch_size=10, max_wait_seconds=0.01, retry_seconds=0.01)
+    batcher.start()
+    try:
+        batcher.submit("a")
+        assert flush.flushed.wait(5)
+    finally:
+        batcher.stop()
+
+    assert flush.batches == [["a"]]
+    assert batcher.stats["errors"] == 1
+    assert batcher.failed == []
+
+
+def test_batch_kept_after_max_attempts():
+    flush = Recorder(failures=10)
+    batcher = MicroBatcher(flush, max_batch_size=10, max_attempts=3, retry_seconds=60)
+    batcher.submit("a")
+    batcher.submit("b")
+
+    assert batcher.flush_pending() == 0
+    assert flush.calls == 3
+    assert batcher.failed == ["a", "b"]
+    assert batcher.stats["failed"] == 2